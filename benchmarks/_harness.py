@@ -0,0 +1,87 @@
+"""
+Utilities shared by the benchmarks: running a server in a process of its own,
+so that the load of the clients does not slow it down, and summing up timings.
+"""
+
+# System imports
+import logging
+import multiprocessing
+import os
+import resource
+import socket
+import statistics
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+def use_tree(tree):
+    """
+    Lets python import the modules of the server from the checkout `tree`,
+    rather than from this one, when they are not imported yet.
+    """
+    # the modules of the server import each other from the server's directory
+    sys.path[:0] = [tree, os.path.join(tree, "server")]
+
+use_tree(ROOT)
+
+def raise_fd_limit(count):
+    """
+    Allows the process to open `count` files, within the hard limit of the system.
+    """
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    wanted = count if hard == resource.RLIM_INFINITY else min(count, hard)
+
+    if soft != resource.RLIM_INFINITY and soft < wanted:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (wanted, hard))
+
+    if wanted < count:
+        print(f"warning: only {wanted} files can be opened, instead of {count}", file=sys.stderr)
+
+def free_port():
+    """
+    Returns a port on which no server listens.
+    """
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def _serve(make_server, fd_limit):
+    raise_fd_limit(fd_limit)
+    logging.disable(logging.CRITICAL)
+    make_server().run_forever(0.5)
+
+def start_server(make_server, port, fd_limit=1024, timeout=10):
+    """
+    Runs the server returned by `make_server()` in a new process, and returns
+    that process once the server accepts connections on `port`.
+
+    `make_server` is called within the new process.
+    """
+    process = multiprocessing.get_context('fork').Process(target=_serve, args=(make_server, fd_limit), daemon=True)
+    process.start()
+
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            socket.create_connection(('127.0.0.1', port)).close()
+            return process
+        except ConnectionRefusedError:
+            if time.monotonic() > deadline or not process.is_alive():
+                process.terminate()
+                raise RuntimeError(f"the server did not start on port {port}")
+            time.sleep(0.05)
+
+def stop_server(process):
+    process.terminate()
+    process.join(5)
+
+def summary(latencies):
+    """
+    Returns the median, 99th percentile and maximum of `latencies` (seconds), in milliseconds.
+    """
+    latencies = sorted(latencies)
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+
+    return (f"median {statistics.median(latencies) * 1000:.3f}ms, "
+            f"p99 {p99 * 1000:.3f}ms, max {latencies[-1] * 1000:.3f}ms")
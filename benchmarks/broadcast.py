@@ -0,0 +1,124 @@
+"""
+Measures the number of MESSAGE requests per second a TcpServer broadcasts to
+100, 1k and 10k logged in clients.
+
+The receivers do not read while messages are sent, their sockets buffering
+the broadcasts, so that only the work of the server is measured. Another
+checkout of the repository, such as the one before a change, is measured
+with --tree:
+
+    git worktree add /tmp/before <commit>
+    python benchmarks/broadcast.py --tree /tmp/before
+"""
+
+# System imports
+import argparse
+import os
+import selectors
+import socket
+import time
+
+# Local imports
+from _harness import ROOT, free_port, raise_fd_limit, start_server, stop_server, use_tree
+
+def make_server(port):
+    """
+    Returns a TcpServer that does not broadcast logins, so that logging in
+    thousands of receivers does not take millions of sends.
+    """
+    from server.dnc.protocol import DncProtocol
+    from server.tcp import TcpServer
+
+    class QuietLoginServer(TcpServer):
+
+        def _broadcast(self, sender, message):
+            if not message.endswith(b" CONNECT\n"):
+                super()._broadcast(sender, message)
+
+    return QuietLoginServer(DncProtocol(), port)
+
+def read_until(sockets, expected, timeout=120):
+    """
+    Reads `sockets` until each of them received `expected` (bytes) as many times
+    as given per socket by `expected[socket]`, and returns what they received.
+    """
+    selector = selectors.DefaultSelector()
+    received = {}
+    for sock in sockets:
+        selector.register(sock, selectors.EVENT_READ)
+        received[sock] = bytearray()
+
+    deadline = time.monotonic() + timeout
+    pending = set(sockets)
+    while pending:
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"{len(pending)} clients did not receive everything")
+
+        for key, _ in selector.select(1):
+            data = key.fileobj.recv(1 << 20)
+            if not data:
+                raise RuntimeError("the server closed a connection")
+            received[key.fileobj] += data
+            if received[key.fileobj].count(expected[0]) >= expected[1]:
+                pending.discard(key.fileobj)
+                selector.unregister(key.fileobj)
+
+    selector.close()
+    return received
+
+def measure(receivers, messages):
+    """
+    Returns the number of messages per second broadcast to `receivers` clients.
+    """
+    port = free_port()
+    server = start_server(lambda: make_server(port), port, fd_limit=receivers + 64)
+    clients = []
+
+    try:
+        for i in range(receivers + 1):
+            sock = socket.create_connection(('127.0.0.1', port))
+            sock.sendall(f"CONNECT u{i}\n".encode())
+            clients.append(sock)
+        read_until(clients, (b"100 RPL_DONE\n", 1))
+
+        sender, receivers = clients[0], clients[1:]
+        requests = b"MESSAGE hello everyone\n" * messages
+
+        start = time.perf_counter()
+        sender.sendall(requests)
+        read_until([sender], (b"100 RPL_DONE\n", messages))
+        elapsed = time.perf_counter() - start
+
+        # the broadcasts must all have been sent, not dropped
+        received = read_until(receivers, (b":u0 MESSAGE hello everyone\n", messages))
+        assert all(data.count(b"\n") == messages for data in received.values())
+
+        return messages / elapsed
+    finally:
+        for sock in clients:
+            sock.close()
+        stop_server(server)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Measures the broadcast messages per second of a TcpServer.")
+    parser.add_argument('--tree', default=ROOT,
+                        help="The checkout of the repository to measure (default: this one).")
+    parser.add_argument('--receivers', default="100,1000,10000",
+                        help="The comma-separated numbers of receivers (default: 100,1000,10000).")
+    parser.add_argument('--messages', type=int, default=200,
+                        help="The number of messages sent, which the receivers buffer (default: 200).")
+
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    use_tree(os.path.abspath(args.tree))
+
+    counts = [int(count) for count in args.receivers.split(',')]
+    raise_fd_limit(max(counts) + 64)
+
+    for count in counts:
+        print(f"{count} receivers: {measure(count, args.messages):,.0f} messages/s")
+
+if __name__ == '__main__':
+    main()
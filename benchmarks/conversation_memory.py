@@ -0,0 +1,122 @@
+"""
+Measures the memory used by the conversation of the client once it received
+a million messages.
+
+The `widget` view stands for the conversation before it was virtualized: one
+QListWidgetItem per message, kept forever. The `model` view is the Conversation
+model, which keeps the last messages in memory and pages the older ones out
+to a temporary file. Each view is measured in a process of its own, rendered
+off-screen.
+
+    python benchmarks/conversation_memory.py --messages 1000000
+"""
+
+# System imports
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+# Local imports
+# lets python know the modules of the repository
+import _harness
+
+# the number of messages received between two renderings of the view
+BATCH = 10000
+
+def resident_size():
+    """
+    Returns the number of bytes of the process that are in memory.
+    """
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+def texts(count):
+    for i in range(count):
+        yield f"user{i % 50} : message number {i}, long enough to look like a sentence"
+
+def feed_widget(app, count):
+    from PyQt5.QtWidgets import QListWidget, QListWidgetItem
+
+    view = QListWidget()
+    view.show()
+
+    for i, text in enumerate(texts(count)):
+        view.addItem(QListWidgetItem(text))
+        if i % BATCH == 0:
+            view.scrollToBottom()
+            app.processEvents()
+
+    return view
+
+def feed_model(app, count):
+    from PyQt5.QtWidgets import QListView
+    from client.views.conversation import Conversation, ConversationDelegate, Entry
+
+    view = QListView()
+    view.setModel(Conversation(5000, view))
+    view.setItemDelegate(ConversationDelegate(view))
+    view.setLayoutMode(QListView.Batched)
+    view.show()
+
+    batch = []
+    for text in texts(count):
+        batch.append(Entry(text))
+        if len(batch) == BATCH:
+            view.model().extend(batch)
+            batch = []
+            view.scrollToBottom()
+            app.processEvents()
+    view.model().extend(batch)
+
+    return view
+
+FEEDERS = {
+    'widget': feed_widget,
+    'model': feed_model
+}
+
+def measure(view, count):
+    """
+    Feeds `count` messages to `view`, and prints the memory it took.
+    """
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+    from PyQt5.QtWidgets import QApplication
+
+    app = QApplication([])
+    before = resident_size()
+    start = time.perf_counter()
+
+    # the view must stay alive while measured
+    kept = FEEDERS[view](app, count)
+    app.processEvents()
+
+    elapsed = time.perf_counter() - start
+    print(f"{view}: {count:,} messages: +{(resident_size() - before) / (1 << 20):,.1f} MiB "
+          f"in {elapsed:.1f}s ({type(kept).__name__})")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Measures the memory of the conversation of the client.")
+    parser.add_argument('--messages', type=int, default=1000000,
+                        help="The number of messages received (default: 1000000).")
+    parser.add_argument('--views', default="widget,model",
+                        help=f"The comma-separated views to measure, among {', '.join(FEEDERS)} (default: widget,model).")
+    parser.add_argument('--view', choices=FEEDERS.keys(), help=argparse.SUPPRESS)
+
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+
+    if args.view:
+        measure(args.view, args.messages)
+        return
+
+    # each view starts from a fresh process, since freed memory is not always given back
+    for view in args.views.split(','):
+        subprocess.run([sys.executable, __file__, "--view", view, "--messages", str(args.messages)], check=True)
+
+if __name__ == '__main__':
+    main()
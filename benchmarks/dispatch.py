@@ -0,0 +1,107 @@
+"""
+Replays the recorded mix of requests of `request_mix.txt` through the DNC protocol,
+without any socket, and prints the number of requests handled per second.
+
+Another checkout of the repository, such as the one before a change, is measured
+with --tree:
+
+    git worktree add /tmp/before <commit>
+    python benchmarks/dispatch.py --tree /tmp/before
+"""
+
+# System imports
+import argparse
+import logging
+import os
+import sys
+import time
+
+MIX_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "request_mix.txt")
+
+class _Timer:
+    """
+    Stands for the timers of a server, which never run here.
+    """
+
+    def cancel(self):
+        pass
+
+def load_mix(mix_file=MIX_FILE):
+    """
+    Returns the (client, request) pairs of `mix_file`.
+    """
+    with open(mix_file, encoding='utf-8') as file:
+        lines = [line.rstrip('\n') for line in file if line.strip() and not line.startswith('#')]
+
+    return [tuple(line.split('\t')[:2]) for line in lines]
+
+def open_connection(protocol, port):
+    """
+    Returns a new connection of `protocol`, whose messages are dropped.
+    """
+    connection = protocol.create_new_connection()
+    connection.ip = lambda: "127.0.0.1"
+    connection.address = lambda: ("127.0.0.1", port)
+    connection.write = lambda message: None
+    connection.write_bytes = lambda data: None
+    connection.write_to = lambda pseudo, message: None
+    connection.write_all = lambda message: None
+    connection.close = lambda: connection.on_connection_closed()
+    connection.call_soon_threadsafe = lambda callback: callback()
+    connection.call_later = lambda delay, callback: _Timer()
+
+    # older connections were not told that they started
+    if hasattr(connection, "on_connection_started"):
+        connection.on_connection_started()
+
+    return connection
+
+def replay(protocol_class, mix, rounds):
+    """
+    Replays `mix` `rounds` times, each time with a new protocol, and returns
+    the number of seconds spent handling the requests.
+    """
+    elapsed = 0
+
+    for _ in range(rounds):
+        protocol = protocol_class()
+        clients = {client for client, _ in mix}
+        connections = {client: open_connection(protocol, 4000 + i) for i, client in enumerate(sorted(clients))}
+        requests = [(connections[client], request) for client, request in mix]
+
+        start = time.perf_counter()
+        for connection, request in requests:
+            connection.on_data_received(request)
+        elapsed += time.perf_counter() - start
+
+    return elapsed
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Measures the requests per second handled by the DNC protocol.")
+    parser.add_argument('--tree', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."),
+                        help="The checkout of the repository to measure (default: this one).")
+    parser.add_argument('--rounds', type=int, default=2000,
+                        help="The number of times the mix is replayed per run (default: 2000).")
+    parser.add_argument('--runs', type=int, default=5,
+                        help="The number of runs, the best one being reported (default: 5).")
+
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    tree = os.path.abspath(args.tree)
+    sys.path[:0] = [tree, os.path.join(tree, "server")]
+
+    from server.dnc.protocol import DncProtocol
+
+    # requests are logged when the level allows it
+    logging.disable(logging.CRITICAL)
+
+    mix = load_mix()
+    best = min(replay(DncProtocol, mix, args.rounds) for _ in range(args.runs))
+
+    print(f"{tree}: {len(mix) * args.rounds / best:,.0f} requests/s "
+          f"({len(mix)} requests x {args.rounds} rounds in {best:.3f}s)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""
+Measures the throughput of file transfers between two clients over the loopback,
+with and without packet loss, and checks that the received files are intact.
+
+The `udp` transfer stands for the one of the client before transfers moved to
+TCP: a new datagram socket per chunk of 1048 bytes, and the output file opened
+again for each datagram. The `tcp` transfer is the one of `client.controllers.transfer`.
+
+Packet loss is added to the loopback with netem, which requires root:
+
+    sudo python benchmarks/file_transfer.py --size 64 --loss 0,1,5
+"""
+
+# System imports
+import argparse
+import hashlib
+import os
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+
+# Local imports
+# lets python know the modules of the repository
+import _harness
+from client.controllers import transfer
+
+UDP_CHUNK = 1048
+
+def set_loss(loss):
+    """
+    Drops `loss` percent of the packets of the loopback, or none if `loss` is 0.
+    """
+    subprocess.run(["tc", "qdisc", "del", "dev", "lo", "root"], stderr=subprocess.DEVNULL)
+
+    if loss:
+        subprocess.run(["tc", "qdisc", "add", "dev", "lo", "root", "netem", "loss", f"{loss}%"], check=True)
+
+def send_udp(path, port):
+    with open(path, 'rb') as file:
+        while True:
+            data = file.read(UDP_CHUNK)
+            if not data:
+                return
+
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+                sock.sendto(data, ('127.0.0.1', port))
+
+def receive_udp(sock, path, size):
+    # a lost datagram would block the receiver forever, hence it gives up once nothing comes
+    sock.settimeout(1)
+    received = 0
+
+    with sock:
+        while received < size:
+            try:
+                data, _ = sock.recvfrom(UDP_CHUNK)
+            except socket.timeout:
+                return
+
+            received += UDP_CHUNK
+            with open(path, 'ab') as file:
+                file.write(data)
+
+def transfer_udp(source, destination, size):
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(('127.0.0.1', 0))
+    thread = threading.Thread(target=receive_udp, args=(receiver, destination, size))
+    thread.start()
+
+    send_udp(source, receiver.getsockname()[1])
+    thread.join()
+
+def transfer_tcp(source, destination, size):
+    server = transfer.listen()
+    port = server.getsockname()[1]
+    thread = threading.Thread(target=lambda: transfer.receive_file(transfer.accept(server), destination, size))
+    thread.start()
+
+    transfer.send_file(transfer.connect('127.0.0.1', port), source)
+    thread.join()
+
+TRANSFERS = {
+    'udp': transfer_udp,
+    'tcp': transfer_tcp
+}
+
+def digest(path):
+    if not os.path.exists(path):
+        return None
+
+    with open(path, 'rb') as file:
+        return hashlib.sha256(file.read()).hexdigest()
+
+def measure(name, source, size, directory):
+    """
+    Returns the throughput of a transfer in MiB/s, and whether the file arrived intact.
+    """
+    destination = os.path.join(directory, f"received_{name}")
+    if os.path.exists(destination):
+        os.remove(destination)
+
+    start = time.perf_counter()
+    TRANSFERS[name](source, destination, size)
+    elapsed = time.perf_counter() - start
+
+    return size / elapsed / (1 << 20), digest(destination) == digest(source)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Measures the throughput of file transfers over the loopback.")
+    parser.add_argument('--size', type=int, default=64,
+                        help="The size of the transferred file in MiB (default: 64).")
+    parser.add_argument('--loss', default="0",
+                        help="The comma-separated percentages of lost packets, netem being used "
+                             "for the non-zero ones (default: 0).")
+    parser.add_argument('--transfers', default="udp,tcp",
+                        help=f"The comma-separated transfers to measure, among {', '.join(TRANSFERS)} (default: udp,tcp).")
+
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    size = args.size << 20
+
+    with tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, "sent")
+        with open(source, 'wb') as file:
+            file.write(os.urandom(size))
+
+        try:
+            for loss in (float(loss) for loss in args.loss.split(',')):
+                set_loss(loss)
+
+                for name in args.transfers.split(','):
+                    throughput, intact = measure(name, source, size, directory)
+                    print(f"{name}, {loss:g}% lost: {throughput:,.1f} MiB/s, "
+                          f"{'intact' if intact else 'CORRUPTED'}")
+        finally:
+            set_loss(0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+"""
+Measures the latency of the requests of chatty clients while many idle clients
+stay connected to a TcpServer, for each selector backing its loop.
+
+The `select` selector stands for the loop the server used before epoll: it calls
+select() over every socket at each wakeup, and cannot watch more than
+FD_SETSIZE (1024) sockets.
+
+    python benchmarks/idle_connections.py --idle 10000 --chatty 100
+"""
+
+# System imports
+import argparse
+import selectors
+import socket
+import threading
+import time
+
+# Local imports
+from _harness import free_port, raise_fd_limit, start_server, stop_server, summary
+from server.dnc.protocol import DncProtocol
+from server.tcp import TcpServer
+
+SELECTORS = {
+    'select': selectors.SelectSelector,
+    'epoll': getattr(selectors, 'EpollSelector', None),
+    'default': selectors.DefaultSelector
+}
+
+class _ChattyClients:
+    """
+    Logged in clients, whose replies are read by a background thread.
+
+    The time at which each client receives "100 RPL_DONE" is recorded, the
+    messages broadcast by the other clients being dropped.
+    """
+
+    def __init__(self, port, count):
+        self.sockets = []
+        self.done = {}
+        self._selector = selectors.DefaultSelector()
+
+        for i in range(count):
+            sock = socket.create_connection(('127.0.0.1', port))
+            sock.sendall(f"CONNECT chatty{i}\n".encode())
+            self.sockets.append(sock)
+            self.done[sock] = threading.Event()
+            self._selector.register(sock, selectors.EVENT_READ, bytearray())
+
+        threading.Thread(target=self._read, daemon=True).start()
+
+        # logging in is not measured
+        for sock in self.sockets:
+            self.wait(sock)
+
+    def _read(self):
+        while True:
+            for key, _ in self._selector.select():
+                data = key.fileobj.recv(1 << 16)
+                if not data:
+                    self._selector.unregister(key.fileobj)
+                    continue
+
+                key.data.extend(data)
+                *lines, rest = key.data.split(b"\n")
+                key.data[:] = rest
+                if b"100 RPL_DONE" in lines:
+                    self.done[key.fileobj].set()
+
+    def wait(self, sock, timeout=10):
+        if not self.done[sock].wait(timeout):
+            raise RuntimeError("the server did not reply")
+        self.done[sock].clear()
+
+    def close(self):
+        for sock in self.sockets:
+            sock.close()
+
+def open_idle_clients(port, count):
+    """
+    Returns `count` sockets connected to the server, which never send anything.
+    """
+    sockets = []
+
+    for _ in range(count):
+        sockets.append(socket.create_connection(('127.0.0.1', port)))
+
+    return sockets
+
+def measure(selector, args):
+    """
+    Returns the latencies of the messages of the chatty clients, or the error
+    that prevented the server from serving them.
+    """
+    port = free_port()
+    server = start_server(lambda: TcpServer(DncProtocol(), port, selector=SELECTORS[selector]),
+                          port, fd_limit=args.idle + args.chatty + 64)
+    idle = []
+    chatty = None
+
+    try:
+        idle = open_idle_clients(port, args.idle)
+        chatty = _ChattyClients(port, args.chatty)
+        latencies = []
+
+        for i in range(args.messages):
+            sock = chatty.sockets[i % len(chatty.sockets)]
+            start = time.perf_counter()
+            sock.sendall(b"MESSAGE hello everyone\n")
+            chatty.wait(sock)
+            latencies.append(time.perf_counter() - start)
+
+        return latencies
+    except (OSError, RuntimeError) as e:
+        return f"failed ({e}; the server is {'alive' if server.is_alive() else 'dead'})"
+    finally:
+        if chatty is not None:
+            chatty.close()
+        for sock in idle:
+            sock.close()
+        stop_server(server)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Measures the latency of requests among idle connections.")
+    parser.add_argument('--idle', type=int, default=10000,
+                        help="The number of idle clients (default: 10000).")
+    parser.add_argument('--chatty', type=int, default=100,
+                        help="The number of logged in clients sending messages (default: 100).")
+    parser.add_argument('--messages', type=int, default=2000,
+                        help="The number of messages sent by the chatty clients (default: 2000).")
+    parser.add_argument('--selectors', default="select,epoll",
+                        help=f"The comma-separated selectors to compare, among {', '.join(SELECTORS)} "
+                             "(default: select,epoll).")
+
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    raise_fd_limit(args.idle + args.chatty + 64)
+
+    for selector in args.selectors.split(','):
+        if SELECTORS.get(selector) is None:
+            print(f"{selector}: not available")
+            continue
+
+        latencies = measure(selector, args)
+        if isinstance(latencies, str):
+            print(f"{selector}: {latencies}")
+        else:
+            print(f"{selector}: {args.idle} idle, {args.chatty} chatty clients: {summary(latencies)}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+"""
+Simulates the clients of a restarted server all connecting again at once, and
+measures the time until every one of them is served.
+
+Each client connects, sends a request, and is served once the server replies
+with anything else than "210 ERR_SERVERBUSY". A client that is refused, reset
+or times out connects again after a jittered exponential backoff, as the
+client of the chat does.
+
+The former accept loop listened with a backlog of 5; it is approached with
+--backlogs 5, although the server still accepts up to the backlog at once.
+
+    python benchmarks/reconnect_storm.py --clients 5000 --backlogs 5,1024
+"""
+
+# System imports
+import argparse
+import errno
+import random
+import selectors
+import socket
+import time
+
+# Local imports
+from _harness import free_port, raise_fd_limit, start_server, stop_server, summary
+from server.dnc.protocol import DncProtocol
+from server.tcp import TcpServer
+
+# The backoff of the clients, in seconds, as in the client of the chat
+MIN_DELAY = 0.5
+MAX_DELAY = 30
+
+# The seconds a client waits for a reply before giving up its attempt
+ATTEMPT_TIMEOUT = 10
+
+class _Client:
+
+    __slots__ = ('sock', 'attempts', 'retry_at', 'deadline', 'served_at')
+
+    def __init__(self):
+        self.sock = None
+        self.attempts = 0
+        self.retry_at = 0
+        self.deadline = None
+        self.served_at = None
+
+class _Storm:
+    """
+    Runs the clients within a single loop.
+    """
+
+    def __init__(self, port, count):
+        self.port = port
+        self.clients = [_Client() for _ in range(count)]
+        self.selector = selectors.DefaultSelector()
+        self.refused = 0
+        self.failed = 0
+
+    def _connect(self, client, now):
+        client.attempts += 1
+        client.retry_at = None
+        client.deadline = now + ATTEMPT_TIMEOUT
+        client.sock = socket.socket()
+        client.sock.setblocking(False)
+
+        code = client.sock.connect_ex(('127.0.0.1', self.port))
+        if code not in (0, errno.EINPROGRESS):
+            self._retry(client, now)
+            return
+
+        self.selector.register(client.sock, selectors.EVENT_WRITE, client)
+
+    def _retry(self, client, now, refused=False):
+        if refused:
+            self.refused += 1
+        else:
+            self.failed += 1
+
+        if client.sock is not None:
+            try:
+                self.selector.unregister(client.sock)
+            except (KeyError, ValueError):
+                pass
+            client.sock.close()
+            client.sock = None
+
+        delay = random.uniform(0, min(MAX_DELAY, MIN_DELAY * 2 ** min(client.attempts - 1, 16)))
+        client.retry_at = now + delay
+
+    def _handle(self, client, events, now):
+        sock = client.sock
+
+        if events & selectors.EVENT_WRITE:
+            if sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR) != 0:
+                self._retry(client, now)
+                return
+
+            sock.send(b"NAMES\n")
+            self.selector.modify(sock, selectors.EVENT_READ, client)
+            return
+
+        try:
+            reply = sock.recv(4096)
+        except OSError:
+            reply = b""
+
+        if not reply:
+            self._retry(client, now)
+        elif reply.startswith(b"210"):
+            self._retry(client, now, refused=True)
+        else:
+            client.served_at = now
+            client.deadline = None
+            # a served client stays connected, as the clients of the chat do
+            self.selector.unregister(sock)
+
+    def run(self, timeout):
+        """
+        Returns the times at which the clients were served, since the storm started.
+        """
+        start = time.monotonic()
+
+        for client in self.clients:
+            self._connect(client, start)
+
+        while time.monotonic() - start < timeout:
+            now = time.monotonic()
+            waiting = [client for client in self.clients if client.served_at is None]
+            if not waiting:
+                break
+
+            for client in waiting:
+                if client.retry_at is not None and client.retry_at <= now:
+                    self._connect(client, now)
+                elif client.deadline is not None and client.deadline <= now and client.sock is not None:
+                    self._retry(client, now)
+
+            for key, events in self.selector.select(0.05):
+                self._handle(key.data, events, time.monotonic())
+
+        return [client.served_at - start for client in self.clients if client.served_at is not None]
+
+    def close(self):
+        for client in self.clients:
+            if client.sock is not None:
+                client.sock.close()
+
+def measure(backlog, args):
+    port = free_port()
+    options = dict(backlog=backlog, accept_rate=args.accept_rate, accept_rate_per_ip=args.accept_rate_per_ip)
+    server = start_server(lambda: TcpServer(DncProtocol(), port, **options), port, fd_limit=args.clients + 64)
+    storm = _Storm(port, args.clients)
+
+    try:
+        served = storm.run(args.timeout)
+    finally:
+        storm.close()
+        stop_server(server)
+
+    attempts = sum(client.attempts for client in storm.clients)
+    print(f"backlog {backlog}: {len(served)}/{args.clients} served"
+          f"{f' in {max(served):.2f}s' if len(served) == args.clients else ''}, "
+          f"{attempts} attempts ({storm.refused} refused, {storm.failed} failed)")
+    if served:
+        print(f"    time to be served: {summary(served)}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Measures the time a server takes to serve a storm of reconnections.")
+    parser.add_argument('--clients', type=int, default=5000,
+                        help="The number of clients connecting at once (default: 5000).")
+    parser.add_argument('--backlogs', default="5,1024",
+                        help="The comma-separated backlogs of the server (default: 5,1024).")
+    parser.add_argument('--accept-rate', type=float,
+                        help="The clients accepted per second by the server (default: unlimited).")
+    parser.add_argument('--accept-rate-per-ip', type=float,
+                        help="The clients accepted per second from an ip (default: unlimited).")
+    parser.add_argument('--timeout', type=float, default=120,
+                        help="The seconds after which the clients left are given up (default: 120).")
+
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    raise_fd_limit(args.clients + 64)
+
+    for backlog in (int(backlog) for backlog in args.backlogs.split(',')):
+        measure(backlog, args)
+
+if __name__ == '__main__':
+    main()
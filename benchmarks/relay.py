@@ -0,0 +1,156 @@
+"""
+Measures the throughput of files relayed by the server, and the latency of the
+chat while they are relayed.
+
+Each transfer is requested through the chat (ASK_FILE, then REPLY_FILE ... YES RELAY),
+then its sender streams the file to the relay and its receiver reads it back.
+Meanwhile a client sends messages and measures how long the server takes to
+reply, which is compared with the latency without any transfer.
+
+    python benchmarks/relay.py --transfers 2 --size 1024
+"""
+
+# System imports
+import argparse
+import socket
+import threading
+import time
+
+# Local imports
+from _harness import free_port, start_server, stop_server, summary
+from client.controllers import transfer
+from server.dnc.protocol import DncProtocol
+from server.relay import FileRelay
+from server.tcp import TcpServer
+
+CHUNK = memoryview(bytes(1 << 20))
+
+class _ChatClient:
+    """
+    A logged in client, which reads the lines sent by the server one by one.
+    """
+
+    def __init__(self, port, pseudo):
+        self.sock = socket.create_connection(('127.0.0.1', port))
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._buffer = b""
+        self.request(f"CONNECT {pseudo}", "100 ")
+
+    def readline(self):
+        while b"\n" not in self._buffer:
+            data = self.sock.recv(1 << 16)
+            if not data:
+                raise RuntimeError("the server closed the connection")
+            self._buffer += data
+
+        line, self._buffer = self._buffer.split(b"\n", 1)
+        return line.decode()
+
+    def read_until(self, prefix):
+        """
+        Returns the next line starting with `prefix`, the others being dropped.
+        """
+        while True:
+            line = self.readline()
+            if line.startswith(prefix):
+                return line
+
+    def request(self, request, reply_prefix):
+        self.sock.sendall(f"{request}\n".encode())
+        return self.read_until(reply_prefix)
+
+def open_transfer(sender, receiver, receiver_pseudo, size):
+    """
+    Asks for a relayed transfer of `size` bytes, and returns the sockets of
+    its sender and receiver on the relay.
+    """
+    file_id = sender.request(f"ASK_FILE {receiver_pseudo} {size} file.bin", "102 ").split()[2]
+    receiver.read_until(":")
+    _, _, port, token = receiver.request(f"REPLY_FILE {file_id} YES RELAY", "104 ").split()
+
+    return (transfer.join_relay('127.0.0.1', int(port), token, "SEND"),
+            transfer.join_relay('127.0.0.1', int(port), token, "RECV"))
+
+def send(sock, size):
+    with sock:
+        while size > 0:
+            sock.sendall(CHUNK[:min(size, len(CHUNK))])
+            size -= len(CHUNK)
+
+def receive(sock, size, received):
+    buffer = memoryview(bytearray(1 << 20))
+
+    with sock:
+        while received[0] < size:
+            count = sock.recv_into(buffer)
+            if count == 0:
+                return
+            received[0] += count
+
+def chat_latencies(client, until):
+    """
+    Returns the latencies of the messages sent by `client` until `until(<number of messages>)` is true.
+    """
+    latencies = []
+
+    while not until(len(latencies)):
+        start = time.perf_counter()
+        client.request("MESSAGE ping", "100 ")
+        latencies.append(time.perf_counter() - start)
+        time.sleep(0.01)
+
+    return latencies
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Measures the relay's throughput and the chat's latency meanwhile.")
+    parser.add_argument('--transfers', type=int, default=2,
+                        help="The number of concurrent transfers (default: 2).")
+    parser.add_argument('--size', type=int, default=1024,
+                        help="The size of each file in MiB (default: 1024).")
+    parser.add_argument('--rate', type=int,
+                        help="The maximum bytes per second of a transfer (default: unlimited).")
+
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    size = args.size << 20
+    port, relay_port = free_port(), free_port()
+
+    def make_server():
+        protocol = DncProtocol()
+        protocol.relay = FileRelay(relay_port, args.rate)
+        return TcpServer(protocol, port)
+
+    server = start_server(make_server, port)
+
+    try:
+        chat = _ChatClient(port, "chat")
+        idle = chat_latencies(chat, lambda count: count >= 200)
+
+        threads = []
+        received = []
+        for i in range(args.transfers):
+            sender, receiver = _ChatClient(port, f"send{i}"), _ChatClient(port, f"recv{i}")
+            sender_sock, receiver_sock = open_transfer(sender, receiver, f"recv{i}", size)
+            received.append([0])
+            threads += [threading.Thread(target=send, args=(sender_sock, size)),
+                        threading.Thread(target=receive, args=(receiver_sock, size, received[-1]))]
+
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+
+        busy = chat_latencies(chat, lambda count: count >= 10 and not any(thread.is_alive() for thread in threads))
+        elapsed = time.perf_counter() - start
+
+        total = sum(count for count, in received)
+        print(f"{args.transfers} transfers of {args.size} MiB: {total / elapsed / (1 << 20):,.1f} MiB/s in total"
+              f"{'' if total == size * args.transfers else ' (INCOMPLETE)'}")
+        print(f"chat without transfer: {summary(idle)}")
+        print(f"chat during transfers: {summary(busy)}")
+    finally:
+        stop_server(server)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+"""
+Measures the number of MESSAGE requests per second served by main_server.py
+for each number of worker processes.
+
+Every client sends its messages as fast as the server replies, and reads the
+messages broadcast by all the others, whichever worker serves them. Workers
+only run in parallel on as many cores: the client, which is measured along
+with the server, needs a core of its own too.
+
+    python benchmarks/workers.py --workers 1,2,4
+"""
+
+# System imports
+import argparse
+import os
+import selectors
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+# Local imports
+from _harness import ROOT, free_port, raise_fd_limit
+
+CONFIG = """
+[log]
+verbose = False
+sample_rate = 0
+stats_interval = 3600
+"""
+
+class _Clients:
+    """
+    Logged in clients, whose replies are counted by a background thread.
+    """
+
+    def __init__(self, port, count):
+        self.sockets = []
+        self.done = {}
+        self.lines = 0
+        self._selector = selectors.DefaultSelector()
+        self._lock = threading.Condition()
+
+        for i in range(count):
+            sock = socket.create_connection(('127.0.0.1', port))
+            sock.sendall(f"CONNECT u{i}\n".encode())
+            self.sockets.append(sock)
+            self.done[sock] = 0
+            self._selector.register(sock, selectors.EVENT_READ, bytearray())
+
+        threading.Thread(target=self._read, daemon=True).start()
+        self.wait(1)
+
+    def _read(self):
+        while True:
+            for key, _ in self._selector.select():
+                try:
+                    data = key.fileobj.recv(1 << 16)
+                except OSError:
+                    data = b""
+                if not data:
+                    self._selector.unregister(key.fileobj)
+                    continue
+
+                key.data.extend(data)
+                end = key.data.rfind(b"\n") + 1
+                lines = key.data[:end]
+                del key.data[:end]
+
+                with self._lock:
+                    self.lines += lines.count(b"\n")
+                    self.done[key.fileobj] += lines.count(b"100 RPL_DONE\n")
+                    self._lock.notify_all()
+
+    def wait(self, replies, timeout=120):
+        """
+        Waits until every client received `replies` "100 RPL_DONE".
+        """
+        with self._lock:
+            if not self._lock.wait_for(lambda: min(self.done.values()) >= replies, timeout):
+                raise RuntimeError("the server did not reply to every request")
+
+    def close(self):
+        for sock in self.sockets:
+            sock.close()
+
+def start_server(port, workers, directory):
+    config = os.path.join(directory, "server.config")
+    with open(config, "w") as file:
+        file.write(CONFIG)
+
+    process = subprocess.Popen([sys.executable, os.path.join(ROOT, "server", "main_server.py"), str(port),
+                                os.path.join(directory, "server.log"), "--workers", str(workers),
+                                "--conf", config], cwd=os.path.join(ROOT, "server"))
+
+    deadline = time.monotonic() + 10
+    while True:
+        try:
+            socket.create_connection(('127.0.0.1', port)).close()
+            return process
+        except ConnectionRefusedError:
+            if time.monotonic() > deadline or process.poll() is not None:
+                process.kill()
+                raise RuntimeError(f"the server did not start on port {port}")
+            time.sleep(0.05)
+
+def measure(workers, args, directory):
+    """
+    Returns the number of requests served per second, and the number of lines
+    received per second by the clients.
+    """
+    port = free_port()
+    server = start_server(port, workers, directory)
+    clients = None
+
+    try:
+        clients = _Clients(port, args.clients)
+        # the broadcasts of the logins are not measured
+        time.sleep(0.5)
+        lines = clients.lines
+
+        start = time.perf_counter()
+        for sent in range(0, args.messages, args.window):
+            for sock in clients.sockets:
+                sock.sendall(b"MESSAGE hello everyone\n" * args.window)
+            clients.wait(1 + sent + args.window)
+        elapsed = time.perf_counter() - start
+
+        requests = args.clients * (args.messages // args.window * args.window)
+        return requests / elapsed, (clients.lines - lines) / elapsed
+    finally:
+        if clients is not None:
+            clients.close()
+        server.send_signal(signal.SIGTERM)
+        try:
+            server.wait(10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Measures the requests per second served per number of workers.")
+    parser.add_argument('--workers', default="1,2,4",
+                        help="The comma-separated numbers of workers (default: 1,2,4).")
+    parser.add_argument('--clients', type=int, default=50,
+                        help="The number of clients sending messages (default: 50).")
+    parser.add_argument('--messages', type=int, default=200,
+                        help="The number of messages sent per client (default: 200).")
+    parser.add_argument('--window', type=int, default=10,
+                        help="The number of messages a client sends before waiting for their replies (default: 10).")
+
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    raise_fd_limit(args.clients + 64)
+    print(f"{os.cpu_count()} cores, {args.clients} clients")
+
+    with tempfile.TemporaryDirectory() as directory:
+        for workers in (int(count) for count in args.workers.split(',')):
+            requests, lines = measure(workers, args, directory)
+            print(f"{workers} workers: {requests:,.0f} requests/s, {lines:,.0f} lines received/s")
+
+if __name__ == '__main__':
+    main()
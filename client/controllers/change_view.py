@@ -1,18 +1,17 @@
-import sys, socket, threading, queue, os
-from threading import Thread, Event
+import sys, threading, queue, os
 from configparser import ConfigParser
 
 from PyQt5 import QtCore
 from PyQt5.QtCore import QTimer
-from PyQt5.QtWidgets import QWidget, QApplication, QStackedWidget, QButtonGroup, QAbstractButton
+from PyQt5.QtWidgets import QWidget, QApplication, QStackedWidget
 from client.views.login import Login
 from client.views.logged import Logged
 from client.views.connected import Connected
+from client.controllers.network import NetworkClient, BUSY
+from client.controllers.pipeline import LOST_REPLY
 from client.widgets.main_window import Ui_MainWindow
 from PyQt5.QtCore import pyqtSignal
 
-main_program_is_over = Event()
-callbacks = queue.Queue()
 conversation_content = queue.Queue()
 
 
@@ -23,7 +22,7 @@ class MainView(QWidget, Ui_MainWindow):
     signal_nick = pyqtSignal(str)
     signal_ask = pyqtSignal(str)
     signal_stop = pyqtSignal(str)
-    signal_messages = pyqtSignal(str)
+    signal_resume = pyqtSignal(str)
     signal_change_msg_accueil = pyqtSignal(str)
 
     def __configure(self, config_file):
@@ -36,10 +35,20 @@ class MainView(QWidget, Ui_MainWindow):
             if 'port' in options['server']:
                 self.port = int(options["server"]["port"])
 
+        if 'reconnect' in options.sections():
+            if 'min_delay' in options['reconnect']:
+                self.min_delay = float(options['reconnect']['min_delay'])
+            if 'max_delay' in options['reconnect']:
+                self.max_delay = float(options['reconnect']['max_delay'])
+
+        if 'transfer' in options.sections():
+            if 'relay' in options['transfer']:
+                self.relay = options['transfer']['relay'].lower() in ['yes', 'true']
+
         return options
 
     def __persist_pseudo_at_login(self, pseudo):
-        if not self.options["session"]:
+        if 'session' not in self.options:
             self.options["session"] = {}
 
         self.options["session"]["pseudo"] = pseudo
@@ -53,8 +62,10 @@ class MainView(QWidget, Ui_MainWindow):
 
         self.ip = '127.0.0.1'
         self.port = 8123
-        self.sock = None
-        self.options = {}
+        self.min_delay = 0.5
+        self.max_delay = 30
+        self.relay = False
+        self.options = ConfigParser()
 
         if os.path.exists('client.config'):
             self.options = self.__configure('client.config')
@@ -73,6 +84,7 @@ class MainView(QWidget, Ui_MainWindow):
         self.signal_nick.connect(self.handle_nick)
         self.signal_ask.connect(self.handle_ask)
         self.signal_stop.connect(self.handle_stop)
+        self.signal_resume.connect(self.handle_resume)
         self.signal_change_msg_accueil.connect(lambda message: self.msg_accueil.setText(message))
 
         self.actionPasser_en_mode_actif.setEnabled(False)
@@ -81,22 +93,20 @@ class MainView(QWidget, Ui_MainWindow):
         self.sub_msg.hide()
         self.sub_button.hide()
         self.label_view = ""
+        self.requested_pseudo = ""
 
-        Thread(target=self.listen_in_background, args=(self.ip, self.port, self)).start()
+        # all reads and writes are done by the network thread
+        self.network = NetworkClient(self.ip, self.port, conversation_content, self.min_delay, self.max_delay, self)
+        self.network.connected.connect(self.on_connected)
+        self.network.connection_lost.connect(self.on_connection_lost)
+        self.network.start()
         self.logged_view = Logged(self)
         self.logged_view.yes.hide()
         self.logged_view.no.hide()
         self.stackedWidget.addWidget(self.logged_view)
         self.connected_view = Connected(self)
-        # handle mute buttons :
-        self.connected_view.buttonGroup = QButtonGroup()
-        self.connected_view.buttonGroup.buttonClicked[QAbstractButton].connect(self.connected_view.mute)
-        # handle send file buttons :
-        self.connected_view.filesGroup = QButtonGroup()
-        self.connected_view.filesGroup.buttonClicked[QAbstractButton].connect(self.connected_view.send_file)
 
         self.stackedWidget.addWidget(self.connected_view)
-        self.signal_messages.connect(self.logged_view.on_display)
 
         self.views = { 'login' : (0, self.login_view),  # index de la vue, vue
                        'logged' : (1, self.logged_view),
@@ -117,53 +127,50 @@ class MainView(QWidget, Ui_MainWindow):
 
     @QtCore.pyqtSlot(str, object)
     def send_request(self, req, callback=None):
-        global callbacks
-
-        try:
-            self.sock.send(req.encode())
-            if callback:
-                callbacks.put(callback)
-        except KeyboardInterrupt:
-            pass
-        except:
-            self.msg_accueil.setText("Impossible d'accéder au server,\n veuillez relancer le programme.")
-
-
-    def listen_in_background(self, ip, port, view):
-        global main_program_is_over, callbacks, conversation_content
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
-            self.sock = sock
-            self.sock.settimeout(3)
-            try:
-                sock.connect((ip, port))
-            except ConnectionRefusedError:
-                print("Server unreachable")  # qerrordialog + emettre un signal
-                return
-            while not main_program_is_over.is_set():
-                try:
-                    message = sock.recv(2048).decode()
-                    if not message:
-                        self.signal_change_msg_accueil.emit("Connection avec le server perdue,\nveuillez relancer le programme")
-                        main_program_is_over.set()  # si le serveur s'est arreté (envoyer plutot un signal d'erreur)
-                        return
-                    if not message.startswith(':'):
-                        if callbacks.empty():
-                            pass
-                        else:
-                            callback = callbacks.get()  # dat shit is bloquante
-                            callback.emit(message)  # par exemple, appelle handle_response() de login
-                    else:
-                        conversation_content.put(message)  # fonction qui traite un message recu
-                        self.signal_messages.emit("")
-                    # print(message)
-                except socket.timeout:
-                    pass
-                except OSError:
-                    return
+        self.network.submit(req, callback)
+
+    @QtCore.pyqtSlot()
+    def on_connection_lost(self):
+        self.msg_accueil.setText("Connection avec le server perdue,\nreconnexion en cours...")
+
+    @QtCore.pyqtSlot()
+    def on_connected(self):
+        # the session is resumed if the user was logged in before the connection was lost
+        if self.current_user:
+            pseudo = self.options.get('session', 'pseudo', fallback=self.current_user)
+            self.send_request(f"CONNECT {pseudo}", self.signal_resume)
+
+    @QtCore.pyqtSlot(str)
+    def handle_resume(self, server_response):
+        # the connection has been lost or refused again, hence the session is
+        # resumed on the next connection
+        if server_response == LOST_REPLY or server_response.startswith(BUSY):
+            self.on_connection_lost()
+            return
+
+        if not server_response == '100 RPL_DONE':
+            self.current_user = ""
+            self.update('login')
+            self.msg_accueil.setText("Impossible de restaurer la session,\nveuillez vous reconnecter.")
+            return
+
+        self.network.confirm()
+        self.current_user = self.options.get('session', 'pseudo', fallback=self.current_user)
+        self.msg_accueil.setText("Reconnecté !")
+
+        # the AWAY button is enabled while the user is away
+        if self.actionPasser_en_mode_actif.isEnabled():
+            self.send_request("AWAY")
+
+        # the versions of the list of pseudos are those of the previous server,
+        # whereas the muted pseudos are kept by the roster
+        self.connected_view.roster.reset([])
+        self.connected_view.on_display()
 
     def closeEvent(self, event):
         print("Closing...") # faire un truc zoli
-        main_program_is_over.set()
+        self.network.stop()
+        self.logged_view.messages.close()
 
         for t in threading.enumerate():
             if t != threading.main_thread():
@@ -187,6 +194,7 @@ class MainView(QWidget, Ui_MainWindow):
             self.sub_msg.setText("Merci de saisir un pseudo ! ")
 
         if self.label_view == "change_pseudo":
+            self.requested_pseudo = new_pseudo
             self.send_request(f"NICK {new_pseudo}", self.signal_nick)
         if self.label_view == "msg_prive":
             self.send_request(f"ASK_WHISPER {new_pseudo}", self.signal_ask)
@@ -202,12 +210,15 @@ class MainView(QWidget, Ui_MainWindow):
             self.sub_msg.hide()
             self.sub_button.hide()
             self.msg_accueil.setText("Pseudo changé !")
+            self.current_user = self.requested_pseudo
+            self.__persist_pseudo_at_login(self.requested_pseudo)
             self.update('logged')
 
     @QtCore.pyqtSlot()  # se déconnecter
     def on_actionSe_d_connecter_triggered(self):
         self.send_request("QUIT")
         self.current_user = ""
+        self.connected_view.roster.reset([])
         self.update('login')
 
 
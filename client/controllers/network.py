@@ -0,0 +1,188 @@
+import asyncio
+import random
+import threading
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+from client.controllers.pipeline import RequestPipeline, LOST_REPLY
+
+# The delay between two checks of the requests waiting for a reply, in seconds
+CHECK_INTERVAL = 1
+
+# The message sent by the server to check whether the client is alive
+PING = ":@server PING"
+
+# The reply of a server refusing the connection because it is too busy
+BUSY = "210"
+
+
+class _ClientProtocol(asyncio.Protocol):
+    """
+    Hands the data received from the server to the network client.
+    """
+
+    def __init__(self, network):
+        self.network = network
+
+    def connection_made(self, transport):
+        self.network._on_connected(transport)
+
+    def data_received(self, data):
+        self.network._on_data(data)
+
+    def connection_lost(self, exc):
+        self.network._on_lost()
+
+
+class NetworkClient(QObject):
+    """
+    Owns the connection with the server, which is served by an asyncio loop
+    running in a background thread.
+
+    Requests are submitted from any thread with `submit()`, and are written by
+    the loop so that the GUI never waits for the network. The replies are handed
+    to the callbacks of the requests, and the other messages of the server are
+    put into `events`, except the pings of the server which are answered by the
+    loop itself.
+
+    When the connection is lost, the client connects again after a random delay
+    between 0 and `min_delay * 2 ** attempts` seconds, capped to `max_delay`, so
+    that the clients of a restarted server do not all come back at once. A busy
+    server may accept a connection only to refuse it, hence the attempts are only
+    forgotten once `confirm()` tells that the server has accepted the session.
+
+    Signals:
+    --------
+        connected(): emitted each time the client is connected to the server
+        connection_lost(): emitted when the connection is lost or cannot be made
+
+    Args:
+    -----
+        ip (str): the ip of the server
+        port (int): the port of the server
+        events (queue.Queue): receives the messages starting with ':'
+        min_delay (float): the base delay before connecting again, in seconds
+        max_delay (float): the maximum delay before connecting again, in seconds
+    """
+    connected = pyqtSignal()
+    connection_lost = pyqtSignal()
+
+    def __init__(self, ip, port, events, min_delay=0.5, max_delay=30, parent=None):
+        QObject.__init__(self, parent)
+        self.ip = ip
+        self.port = port
+        self.events = events
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.requests = RequestPipeline()
+        self.__transport = None
+        self.__attempts = 0
+        self.__stopped = False
+        self.__loop = asyncio.new_event_loop()
+        self.__thread = threading.Thread(target=self.__run, name="dnc-network")
+
+    def start(self):
+        self.__thread.start()
+
+    def stop(self):
+        """
+        Closes the connection, then waits for the network thread to end.
+        """
+        self.__stopped = True
+
+        if self.__thread.is_alive():
+            self.__loop.call_soon_threadsafe(self.__loop.stop)
+            self.__thread.join()
+
+    def submit(self, request, callback=None):
+        """
+        Sends `request` to the server, and registers `callback` to receive its reply.
+
+        Can be called from any thread.
+        """
+        self.__loop.call_soon_threadsafe(self.__send, request, callback)
+
+    def confirm(self):
+        """
+        Tells that the server has accepted the session, so that the next loss of
+        the connection is retried after the shortest delay again.
+
+        Can be called from any thread.
+        """
+        self.__loop.call_soon_threadsafe(self.__reset_attempts)
+
+    def __reset_attempts(self):
+        self.__attempts = 0
+
+    def __run(self):
+        asyncio.set_event_loop(self.__loop)
+        self.__loop.create_task(self.__connect())
+        self.__loop.call_later(CHECK_INTERVAL, self.__check_requests)
+
+        try:
+            self.__loop.run_forever()
+        finally:
+            if self.__transport is not None:
+                self.__transport.abort()
+            self.__loop.run_until_complete(self.__loop.shutdown_asyncgens())
+            self.__loop.close()
+
+    async def __connect(self):
+        try:
+            await self.__loop.create_connection(lambda: _ClientProtocol(self), self.ip, self.port)
+        except OSError:
+            # the loss has already been reported if the client was connected before
+            if self.__attempts == 0:
+                self.connection_lost.emit()
+            self.__reconnect_later()
+
+    def __reconnect_later(self):
+        """
+        Connects again after a jittered exponential backoff.
+        """
+        delay = random.uniform(0, min(self.max_delay, self.min_delay * 2 ** min(self.__attempts, 16)))
+        self.__attempts += 1
+        self.__loop.call_later(delay, lambda: self.__loop.create_task(self.__connect()))
+
+    def __send(self, request, callback):
+        if self.__transport is None:
+            if callback is not None:
+                callback.emit(LOST_REPLY)
+            return
+
+        self.requests.send(self.__transport.write, request, callback)
+
+    def __check_requests(self):
+        # a connection that does not reply anymore is closed as lost
+        if self.__transport is not None and self.requests.expired():
+            self.__transport.abort()
+
+        self.__loop.call_later(CHECK_INTERVAL, self.__check_requests)
+
+    def _on_connected(self, transport):
+        self.__transport = transport
+        self.connected.emit()
+
+    def _on_data(self, data):
+        for message in self.requests.feed(data):
+            # pings are answered at once, so that a busy window cannot get the client dropped
+            if message == PING:
+                self.__send("PONG", None)
+                continue
+
+            # a reply that answers no request is the refusal of a busy server,
+            # which is left at once so that the next attempt waits longer
+            if not message.startswith(':'):
+                if message.startswith(BUSY) and self.__transport is not None:
+                    self.__transport.abort()
+                continue
+
+            self.events.put(message)
+
+    def _on_lost(self):
+        self.__transport = None
+        self.requests.fail_all()
+
+        if not self.__stopped:
+            self.connection_lost.emit()
+            self.__reconnect_later()
@@ -0,0 +1,117 @@
+import collections
+import threading
+import time
+
+# The requests to which the server never replies
+NO_REPLY = {"QUIT", "PONG"}
+
+# The reply given to the callbacks of requests that will never be answered
+LOST_REPLY = "299 ERR_CONNECTIONLOST"
+
+
+class RequestPipeline:
+    """
+    Sends the requests of the client, and hands each reply of the server to the
+    callback of the request it answers.
+
+    The server replies to the requests of a client in the order they were sent,
+    hence the requests waiting for a reply are kept in a FIFO. Each request takes
+    its place in the FIFO, whether it has a callback or not, so that a request
+    without callback cannot shift the replies of the next ones. Many requests can
+    be sent without waiting for their replies.
+
+    If the oldest request is not answered within `timeout` seconds, the connection
+    is considered broken: all pending callbacks receive `LOST_REPLY`, and
+    `expired()` returns `True` so that the connection can be closed.
+
+    Args:
+    -----
+        timeout (float): the number of seconds the server has to reply
+    """
+
+    def __init__(self, timeout=10):
+        self.timeout = timeout
+        self.__pending = collections.deque()
+        self.__buffer = b""
+        self.__lock = threading.Lock()
+
+    def send(self, write, request, callback=None):
+        """
+        Sends `request` thanks to `write(bytes)`, and registers `callback` to
+        receive its reply.
+
+        `callback` must have an `emit(str)` method, such as a Qt signal.
+
+        Raises:
+        -------
+            ValueError: `request` contains a line break, which would make it
+                        several requests
+        """
+        if "\n" in request or "\r" in request:
+            raise ValueError("a request cannot contain a line break")
+
+        words = request.split(maxsplit=1)
+        # empty lines are ignored by the server
+        expects_reply = request != "" and (not words or words[0].upper() not in NO_REPLY)
+        entry = (callback, time.monotonic() + self.timeout)
+
+        # the request is registered first, since its reply may come before `write` returns
+        if expects_reply:
+            with self.__lock:
+                self.__pending.append(entry)
+
+        try:
+            write(f"{request}\n".encode())
+        except OSError:
+            with self.__lock:
+                if entry in self.__pending:
+                    self.__pending.remove(entry)
+            raise
+
+    def feed(self, data):
+        """
+        Splits `data` into messages, hands the replies to their callbacks, and
+        returns the other messages sent by the server: those starting with ':',
+        and the replies received while no request was waiting for one.
+        """
+        # each message is terminated by a line feed, and is only decoded once
+        # complete so that a multi-byte character split by the network stays valid
+        *frames, self.__buffer = (self.__buffer + data).split(b"\n")
+        events = []
+
+        for frame in frames:
+            message = frame.decode(errors="replace").rstrip("\r")
+
+            if message.startswith(':'):
+                events.append(message)
+                continue
+
+            with self.__lock:
+                if not self.__pending:
+                    events.append(message)
+                    continue
+                callback, _ = self.__pending.popleft()
+
+            if callback is not None:
+                callback.emit(message)
+
+        return events
+
+    def expired(self):
+        """
+        Returns whether the oldest request has waited for its reply for too long.
+        """
+        with self.__lock:
+            return bool(self.__pending) and self.__pending[0][1] < time.monotonic()
+
+    def fail_all(self):
+        """
+        Gives `LOST_REPLY` to all the requests waiting for a reply.
+        """
+        with self.__lock:
+            pending, self.__pending = self.__pending, collections.deque()
+            self.__buffer = b""
+
+        for callback, _ in pending:
+            if callback is not None:
+                callback.emit(LOST_REPLY)
@@ -0,0 +1,118 @@
+import os
+import socket
+
+# The number of bytes received at once
+CHUNK_SIZE = 1 << 16
+
+# The number of seconds a transfer may stall before being given up
+TIMEOUT = 30
+
+
+def _write_at(fd, data, offset):
+    """
+    Writes `data` at `offset` in the file `fd`, without moving any file position
+    where the platform allows it.
+    """
+    while data:
+        if hasattr(os, 'pwrite'):
+            written = os.pwrite(fd, data, offset)
+        else:
+            os.lseek(fd, offset, os.SEEK_SET)
+            written = os.write(fd, data)
+
+        data = data[written:]
+        offset += written
+
+
+def listen():
+    """
+    Returns a socket listening on a port chosen by the system, on which a
+    sender can connect to send a file.
+
+    The socket is created before the file is accepted, so that the sender
+    cannot connect before the receiver listens.
+    """
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(('', 0))
+    server.listen(1)
+    server.settimeout(TIMEOUT)
+    return server
+
+
+def accept(server):
+    """
+    Returns the connection of the sender accepted on `server`, then closes `server`.
+    """
+    with server:
+        sock, _ = server.accept()
+
+    sock.settimeout(TIMEOUT)
+    return sock
+
+
+def connect(ip, port):
+    """
+    Returns a connection with the receiver listening on `ip`:`port`.
+    """
+    return socket.create_connection((ip, port), timeout=TIMEOUT)
+
+
+def join_relay(ip, port, token, role):
+    """
+    Returns a connection with the relay of the server listening on `ip`:`port`,
+    for the transfer identified by `token`.
+
+    `role` is "SEND" for the sender of the file and "RECV" for its receiver.
+    """
+    sock = socket.create_connection((ip, port), timeout=TIMEOUT)
+    sock.sendall(f"{token} {role}\n".encode())
+    return sock
+
+
+def receive_file(sock, path, size):
+    """
+    Writes the `size` bytes received on `sock` into `path`, then closes `sock`.
+    The file is allocated once, then filled in place.
+
+    Returns whether the whole file has been received. An incomplete file is removed,
+    whether the sender has stopped early or an error is raised.
+    """
+    received = 0
+
+    with sock:
+        file = open(path, 'wb')
+
+        try:
+            with file:
+                fd = file.fileno()
+
+                if hasattr(os, 'posix_fallocate') and size > 0:
+                    os.posix_fallocate(fd, 0, size)
+                else:
+                    file.truncate(size)
+
+                buffer = memoryview(bytearray(CHUNK_SIZE))
+
+                while received < size:
+                    count = sock.recv_into(buffer[:min(CHUNK_SIZE, size - received)])
+                    if count == 0:
+                        break
+
+                    _write_at(fd, buffer[:count], received)
+                    received += count
+        finally:
+            # the file is closed first, since an open file cannot be removed everywhere
+            if received < size:
+                os.remove(path)
+
+    return received == size
+
+
+def send_file(sock, path):
+    """
+    Sends the content of `path` on `sock`, then closes `sock`. The kernel copies
+    the file directly to the socket where `os.sendfile` is available.
+    """
+    with sock, open(path, 'rb') as file:
+        sock.sendfile(file)
+        sock.shutdown(socket.SHUT_WR)
@@ -1,18 +1,124 @@
 import os, queue
 from os.path import basename, splitext
-from PyQt5 import QtCore
-from PyQt5.QtCore import pyqtSignal
-from PyQt5.QtWidgets import QWidget, QListWidgetItem, QPushButton, QFileDialog
+from PyQt5 import QtCore, QtGui
+from PyQt5.QtCore import pyqtSignal, QAbstractListModel, QModelIndex, Qt
+from PyQt5.QtWidgets import QWidget, QFileDialog
 
 from client.widgets.connected import Ui_Connected
 
 my_files = queue.Queue()
 
+class Roster(QAbstractListModel):
+    """
+    The pseudos of the other connected clients.
+
+    The roster is updated by applying joins, parts and renames one by one,
+    so that the view only redraws the rows that changed.
+
+    Attributes:
+    -----------
+        version (int): the version of the server's list of pseudos the roster is based on
+        muted (set[str]): the pseudos whose messages are not displayed
+    """
+
+    def __init__(self, parent=None):
+        QAbstractListModel.__init__(self, parent)
+        self.__pseudos = []
+        self.__row_per_pseudo = {}
+        self.muted = set()
+        self.version = 0
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.__pseudos)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+
+        pseudo = self.__pseudos[index.row()]
+
+        if role == Qt.DisplayRole:
+            return pseudo
+        if role == Qt.ForegroundRole and pseudo in self.muted:
+            return QtGui.QBrush(Qt.gray)
+        return None
+
+    def pseudo(self, index):
+        return self.__pseudos[index.row()] if index.isValid() else None
+
+    def reset(self, pseudos, version=0):
+        self.beginResetModel()
+        self.__pseudos = list(pseudos)
+        self.__row_per_pseudo = {pseudo: row for row, pseudo in enumerate(self.__pseudos)}
+        self.version = version
+        self.endResetModel()
+
+    def add(self, pseudo):
+        if pseudo in self.__row_per_pseudo:
+            return
+
+        row = len(self.__pseudos)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.__pseudos.append(pseudo)
+        self.__row_per_pseudo[pseudo] = row
+        self.endInsertRows()
+
+    def remove(self, pseudo):
+        row = self.__row_per_pseudo.pop(pseudo, None)
+        if row is None:
+            return
+
+        # the last pseudo takes the row of the removed one, so no other row moves
+        last = len(self.__pseudos) - 1
+        if row != last:
+            moved = self.__pseudos[last]
+            self.__pseudos[row] = moved
+            self.__row_per_pseudo[moved] = row
+            self.dataChanged.emit(self.index(row), self.index(row))
+
+        self.beginRemoveRows(QModelIndex(), last, last)
+        self.__pseudos.pop()
+        self.endRemoveRows()
+
+    def rename(self, old_pseudo, new_pseudo):
+        row = self.__row_per_pseudo.pop(old_pseudo, None)
+        if row is None:
+            self.add(new_pseudo)
+            return
+
+        self.__pseudos[row] = new_pseudo
+        self.__row_per_pseudo[new_pseudo] = row
+
+        if old_pseudo in self.muted:
+            self.muted.remove(old_pseudo)
+            self.muted.add(new_pseudo)
+
+        self.dataChanged.emit(self.index(row), self.index(row))
+
+    def apply(self, changes):
+        """
+        Applies the changes of a RPL_NAMESDELTA reply, such as "+joe" or "-jack".
+        """
+        for change in changes:
+            if change.startswith('+'):
+                self.add(change[1:])
+            elif change.startswith('-'):
+                self.remove(change[1:])
+
+    def set_muted(self, pseudo, muted):
+        if muted:
+            self.muted.add(pseudo)
+        else:
+            self.muted.discard(pseudo)
+
+        row = self.__row_per_pseudo.get(pseudo)
+        if row is not None:
+            self.dataChanged.emit(self.index(row), self.index(row))
+
+
 class Connected(QWidget, Ui_Connected):
     signal_connected = pyqtSignal(str, object)  # document all signals
     signal_handle_response = pyqtSignal(str)
-    # signal_handle_mute = pyqtSignal(str)
-    # signal_handle_listen = pyqtSignal(str)
     signal_handle_file = pyqtSignal(str)
 
     def __init__(self, view, parent=None):
@@ -21,82 +127,70 @@ class Connected(QWidget, Ui_Connected):
         self.view = view
         self.signal_connected.connect(self.view.send_request)
         self.signal_handle_response.connect(self.handle_response)
-        # self.signal_handle_mute.connect(self.handle_mute)
-        # self.signal_handle_listen.connect(self.handle_listen)
         self.signal_handle_file.connect(self.handle_file)
-        self.last_btn_clicked = None
-        self.mute_ppl = []
+        self.roster = Roster(self)
+        self.connected_ppl.setModel(self.roster)
+        self.connected_ppl.selectionModel().currentChanged.connect(self.on_selection_changed)
+        self.roster.dataChanged.connect(lambda *args: self.on_selection_changed(self.connected_ppl.currentIndex()))
 
+    @property
+    def mute_ppl(self):
+        return self.roster.muted
 
     def on_display(self):
-        self.signal_connected.emit("NAMES", self.signal_handle_response)
+        # the roster follows the CONNECT, QUIT and NICK events: only ask the missed changes
+        self.signal_connected.emit(f"NAMES SINCE {self.roster.version}", self.signal_handle_response)
+
+    def on_event(self, sender, command, content):
+        """
+        Updates the roster according to an event sent by the server.
+        """
+        if command == "CONNECT":
+            self.roster.add(sender)
+        elif command == "QUIT":
+            self.roster.remove(sender)
+        elif command == "NICK":
+            self.roster.rename(sender, content)
 
     @QtCore.pyqtSlot(str)
     def handle_response(self, server_response):
-        self.connected_ppl.clear()
-        self.list_buttons.clear()
-        self.list_files.clear()
-        
-        if not server_response.startswith('101 RPL_NAMES'):
-            self.view.msg_accueil.setText("Une erreur est survenue... ")
+        words = server_response.split()
+
+        if server_response.startswith('103 RPL_NAMESDELTA'):
+            version, changes = int(words[2]), words[3:]
+
+            if changes[:1] == ['*']:
+                self.roster.reset((i for i in changes[1:] if i != self.view.current_user), version)
+            else:
+                self.roster.apply(i for i in changes if i[1:] != self.view.current_user)
+                self.roster.version = version
+        elif server_response.startswith('101 RPL_NAMES'):
+            self.roster.reset(i for i in words[2:] if i != self.view.current_user)
         else:
-            for i in server_response.split()[2:]:
-                if i != self.view.current_user:
-                    # mute button :
-                    if i not in self.mute_ppl :
-                        button = QPushButton("mute")
-                    else:
-                        button = QPushButton("unmute")
-                    button.setObjectName(f"{i}")
-                    self.buttonGroup.addButton(button)
-                    item = QListWidgetItem(self.list_buttons)
-                    self.list_buttons.setItemWidget(item, button)
-                    # send file button :
-                    btn_file = QPushButton("send file")
-                    btn_file.setObjectName(f"f_{i}")
-                    self.filesGroup.addButton(btn_file)
-                    item_file = QListWidgetItem(self.list_files)
-                    self.list_files.setItemWidget(item_file, btn_file)
-                    # name of the user:
-                    name = QListWidgetItem(i)
-                    self.connected_ppl.addItem(name)
-
-    @QtCore.pyqtSlot(str)
-    def handle_mute(self, server_response):
-        if not server_response.startswith('100 RPL_DONE'):
             self.view.msg_accueil.setText("Une erreur est survenue... ")
-        else:
-            self.mute_ppl.append(self.last_btn_clicked.objectName())
-            self.last_btn_clicked.setText("unmute")
-            self.last_btn_clicked = None
 
+    def selected_pseudo(self):
+        return self.roster.pseudo(self.connected_ppl.currentIndex())
 
-    @QtCore.pyqtSlot(str)
-    def handle_listen(self, server_response):
-        if not server_response.startswith('100 RPL_DONE'):
-            self.view.msg_accueil.setText("Une erreur est survenue... ")
-        else:
-            self.mute_ppl.remove(self.last_btn_clicked.objectName())
-            self.last_btn_clicked.setText("mute")
-            self.last_btn_clicked = None
-
-
-    def mute(self, button):
-        self.last_btn_clicked = button
-        if button.text() == "mute":
-            # if self.last_btn_clicked.objectName() not in self.mute_ppl:
-            self.mute_ppl.append(self.last_btn_clicked.objectName())
-            self.last_btn_clicked.setText("unmute")
-            self.last_btn_clicked = None
-            # self.signal_connected.emit(f"MUTE {button.objectName()}", self.signal_handle_mute)
-        else:
-            self.mute_ppl.remove(self.last_btn_clicked.objectName())
-            self.last_btn_clicked.setText("mute")
-            self.last_btn_clicked = None
-            # self.signal_connected.emit(f"LISTEN {button.objectName()}", self.signal_handle_listen)
+    def on_selection_changed(self, index, previous=None):
+        pseudo = self.roster.pseudo(index)
+        self.mute_button.setEnabled(pseudo is not None)
+        self.file_button.setEnabled(pseudo is not None)
+        self.mute_button.setText("unmute" if pseudo in self.roster.muted else "mute")
 
-    def send_file(self, button):
+    @QtCore.pyqtSlot()
+    def on_mute_button_clicked(self):
+        pseudo = self.selected_pseudo()
+        if pseudo is not None:
+            self.roster.set_muted(pseudo, pseudo not in self.roster.muted)
+
+    @QtCore.pyqtSlot()
+    def on_file_button_clicked(self):
         global my_files
+        pseudo = self.selected_pseudo()
+        if pseudo is None:
+            return
+
         fname = QFileDialog.getOpenFileName(self, 'Open file', '')
 
         if fname[0]:
@@ -105,12 +199,14 @@ class Connected(QWidget, Ui_Connected):
                 # data = f.read()
                 statinfo = os.stat(f'{f.name}')
                 my_files.put((f.name, statinfo.st_size))
-                self.signal_connected.emit(f"ASK_FILE {button.objectName()[2:]} {statinfo.st_size} {filename}", self.signal_handle_file)
+                self.signal_connected.emit(f"ASK_FILE {pseudo} {statinfo.st_size} {filename}", self.signal_handle_file)
 
     @QtCore.pyqtSlot(str)
     def handle_file(self, server_response):
         global my_files
         if not server_response.startswith('102 RPL_FILE'):
+            # the file of the refused request must not be given to the next one
+            my_files.get()
             self.view.msg_accueil.setText("Une erreur est survenue... ")
         else:
             print("in handle file")
@@ -0,0 +1,217 @@
+import tempfile
+from array import array
+from typing import NamedTuple, Optional, Tuple
+
+from PyQt5 import QtGui
+from PyQt5.QtCore import pyqtSignal, QAbstractListModel, QModelIndex, Qt, QEvent, QRect, QSize
+from PyQt5.QtWidgets import QApplication, QStyle, QStyledItemDelegate, QStyleOptionButton, QStyleOptionViewItem
+
+# The role telling whether a message waits for an answer of the user
+ActionRole = Qt.UserRole
+
+class Entry(NamedTuple):
+    """
+    A message of the conversation.
+
+    Attributes:
+    -----------
+        text (str): the displayed text
+        bold (bool): whether the text is displayed in bold, as private messages are
+        action (Tuple[str,str]): the request the user has to answer, such as ("whisper", <sender>)
+                                 or ("file", <request id>), or `None`
+    """
+    text: str
+    bold: bool = False
+    action: Optional[Tuple[str, str]] = None
+
+class _Ring:
+    """
+    A fixed-size buffer keeping the last `capacity` items pushed.
+    """
+
+    def __init__(self, capacity):
+        self.__items = [None] * capacity
+        self.__start = 0
+        self.__size = 0
+
+    def __len__(self):
+        return self.__size
+
+    def __getitem__(self, i):
+        return self.__items[(self.__start + i) % len(self.__items)]
+
+    def __setitem__(self, i, item):
+        self.__items[(self.__start + i) % len(self.__items)] = item
+
+    def push(self, item):
+        """
+        Appends `item`, and returns the oldest item if it had to be evicted, `None` otherwise.
+        """
+        capacity = len(self.__items)
+
+        if self.__size < capacity:
+            self.__items[(self.__start + self.__size) % capacity] = item
+            self.__size += 1
+            return None
+
+        evicted = self.__items[self.__start]
+        self.__items[self.__start] = item
+        self.__start = (self.__start + 1) % capacity
+        return evicted
+
+class _History:
+    """
+    The messages evicted from memory, stored in a temporary file.
+
+    Each message is stored as a flag byte (bold or not) followed by its text
+    encoded in UTF-8, and is found thanks to the offsets of the messages.
+    """
+
+    def __init__(self):
+        self.__file = tempfile.TemporaryFile()
+        self.__offsets = array('q', [0])
+
+    def __len__(self):
+        return len(self.__offsets) - 1
+
+    def __getitem__(self, i):
+        start, end = self.__offsets[i], self.__offsets[i + 1]
+        self.__file.seek(start)
+        record = self.__file.read(end - start)
+        return Entry(record[1:].decode(errors="replace"), record[0] == 1)
+
+    def append(self, entry):
+        # pending requests cannot be answered anymore once written on disk
+        record = bytes((1 if entry.bold else 0,)) + entry.text.encode()
+        self.__file.seek(self.__offsets[-1])
+        self.__file.write(record)
+        self.__offsets.append(self.__offsets[-1] + len(record))
+
+    def close(self):
+        self.__file.close()
+
+class Conversation(QAbstractListModel):
+    """
+    The messages of the conversation.
+
+    The last `capacity` messages are kept in memory, and older ones are paged
+    out to a temporary file, from which they are read only when displayed.
+    Moving a message to the file does not change its row.
+
+    Signals:
+    --------
+        answered(str, str, str): emitted with the kind of request, its key and
+                                 "YES" or "NO" when the user answers a request
+    """
+    answered = pyqtSignal(str, str, str)
+
+    def __init__(self, capacity=5000, parent=None):
+        QAbstractListModel.__init__(self, parent)
+        self.__recent = _Ring(capacity)
+        self.__history = _History()
+        self.__bold = QtGui.QFont('Tahoma', 8, QtGui.QFont.Bold)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.__history) + len(self.__recent)
+
+    def entry(self, row):
+        in_history = len(self.__history)
+        return self.__history[row] if row < in_history else self.__recent[row - in_history]
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+
+        entry = self.entry(index.row())
+
+        if role == Qt.DisplayRole:
+            return entry.text
+        if role == Qt.FontRole and entry.bold:
+            return self.__bold
+        if role == ActionRole:
+            return entry.action is not None
+        return None
+
+    def extend(self, entries):
+        """
+        Appends `entries` at the end of the conversation.
+        """
+        if not entries:
+            return
+
+        first = self.rowCount()
+        self.beginInsertRows(QModelIndex(), first, first + len(entries) - 1)
+
+        for entry in entries:
+            evicted = self.__recent.push(entry)
+            if evicted is not None:
+                self.__history.append(evicted)
+
+        self.endInsertRows()
+
+    def answer(self, row, answer):
+        """
+        Answers the request displayed at `row`, if it still waits for an answer.
+        """
+        in_history = len(self.__history)
+        if row < in_history:
+            return
+
+        entry = self.__recent[row - in_history]
+        if entry.action is None:
+            return
+
+        self.__recent[row - in_history] = entry._replace(action=None)
+        self.dataChanged.emit(self.index(row), self.index(row))
+        self.answered.emit(entry.action[0], entry.action[1], answer)
+
+    def close(self):
+        self.__history.close()
+
+class ConversationDelegate(QStyledItemDelegate):
+    """
+    Paints the messages of the conversation, along with "Accepter" and "Ignorer"
+    buttons for the requests waiting for an answer.
+
+    Every row has the same height, so that the view never has to measure the
+    rows that are not displayed.
+    """
+    ROW_HEIGHT = 30
+    BUTTON_WIDTH = 80
+    ANSWERS = (("Accepter", "YES"), ("Ignorer", "NO"))
+
+    def sizeHint(self, option, index):
+        return QSize(QStyledItemDelegate.sizeHint(self, option, index).width(), self.ROW_HEIGHT)
+
+    def button_rects(self, rect):
+        right = rect.right() - len(self.ANSWERS) * (self.BUTTON_WIDTH + 4)
+        return [QRect(right + i * (self.BUTTON_WIDTH + 4), rect.top() + 2, self.BUTTON_WIDTH, rect.height() - 4)
+                for i in range(len(self.ANSWERS))]
+
+    def paint(self, painter, option, index):
+        if not index.data(ActionRole):
+            QStyledItemDelegate.paint(self, painter, option, index)
+            return
+
+        style = option.widget.style() if option.widget else QApplication.style()
+
+        text_option = QStyleOptionViewItem(option)
+        self.initStyleOption(text_option, index)
+        text_option.rect = option.rect.adjusted(0, 0, -len(self.ANSWERS) * (self.BUTTON_WIDTH + 4), 0)
+        style.drawControl(QStyle.CE_ItemViewItem, text_option, painter, option.widget)
+
+        for (label, answer), rect in zip(self.ANSWERS, self.button_rects(option.rect)):
+            button = QStyleOptionButton()
+            button.rect = rect
+            button.text = label
+            button.state = QStyle.State_Enabled | QStyle.State_Raised
+            style.drawControl(QStyle.CE_PushButton, button, painter, option.widget)
+
+    def editorEvent(self, event, model, option, index):
+        if event.type() == QEvent.MouseButtonRelease and index.data(ActionRole):
+            for (label, answer), rect in zip(self.ANSWERS, self.button_rects(option.rect)):
+                if rect.contains(event.pos()):
+                    model.answer(index.row(), answer)
+                    return True
+
+        return QStyledItemDelegate.editorEvent(self, event, model, option, index)
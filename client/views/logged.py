@@ -1,109 +1,92 @@
-from socket import *
+import collections
+import functools
+import os
+import queue
 import threading
 from threading import Thread, Event
 from PyQt5 import QtCore, QtGui
-from PyQt5.QtGui import QFont
-from PyQt5.QtCore import pyqtSignal
-from PyQt5.QtWidgets import QWidget, QListWidgetItem, QPushButton, QLabel, QHBoxLayout, QLayout, QFileDialog
+from PyQt5.QtCore import pyqtSignal, QTimer
+from PyQt5.QtWidgets import QWidget, QFileDialog, QListView
 
+from client.controllers import transfer
+from client.views.conversation import Conversation, ConversationDelegate, Entry
 from client.widgets.logged import Ui_Logged
 
+# The number of messages kept in memory, older ones being paged out to disk
+MAX_SCROLLBACK = 5000
+# The maximum number of messages rendered at once, so that the window stays responsive
+MAX_BATCH = 500
+# The delay between two renderings of the received messages, in milliseconds
+RENDER_INTERVAL = 50
+
 def cmd_message(view, sender, content):
-    return QListWidgetItem(f"[{sender}] {content}")
+    return Entry(f"[{sender}] {content}")
 
 def cmd_nick(view, sender, content):
-    return QListWidgetItem(f"{sender} a changé son pseudo en {content}.")
+    return Entry(f"{sender} a changé son pseudo en {content}.")
 
 def cmd_connect(view, sender, content):
-    return QListWidgetItem(f"{sender} vient de se connecter !")
+    return Entry(f"{sender} vient de se connecter !")
 
 def cmd_quit(view, sender, content):
-    return QListWidgetItem(f"{sender} vient de quitter la conversation.")
+    return Entry(f"{sender} vient de quitter la conversation.")
 
 def cmd_ask_whisper(view, sender, content):
-    print("in cmd_ask_whisper")
-    accepter = QPushButton("Accepter")
-    ignorer = QPushButton("Ignorer")
-    accepter.clicked.connect(lambda: view.signal_handle_whisper.emit("YES", sender))
-    ignorer.clicked.connect(lambda: view.signal_handle_whisper.emit("NO", sender))
-    message = f"{sender} désire lancer une conversation privée. Acceptez-vous ?"
-    
-    # create a new widget to display the message and the buttons at once
-    widgetLayout = QHBoxLayout()
-    widgetLayout.addWidget(QLabel(message))
-    widgetLayout.addWidget(accepter)
-    widgetLayout.addWidget(ignorer)
-    widgetLayout.addStretch()
-    widgetLayout.setSizeConstraint(QLayout.SetFixedSize)
-    
-    widget = QWidget()
-    widget.setLayout(widgetLayout)  
-    
-    item = QListWidgetItem()
-    item.setSizeHint(widget.sizeHint())    
-
-    return item, widget
+    return Entry(f"{sender} désire lancer une conversation privée. Acceptez-vous ?", action=("whisper", sender))
 
 def cmd_reply_whisper(view, sender, content):
     if content == "YES":
         view.private_conversations.append(sender)
-        return QListWidgetItem(f"{sender} a accepté votre demande de conversation privée !")
-    return QListWidgetItem(f"{sender} a refusé votre demande de conversation privée.")
+        return Entry(f"{sender} a accepté votre demande de conversation privée !")
+    return Entry(f"{sender} a refusé votre demande de conversation privée.")
 
 def cmd_whisper(view, sender, content):
-    item = QListWidgetItem(f"[Message privé de {sender}] {content}")
-    item.setFont(QtGui.QFont('Tahoma', 8, QtGui.QFont.Bold))
-    return item
+    return Entry(f"[Message privé de {sender}] {content}", bold=True)
 
 def cmd_stop_whisper(view, sender, content):
-    return QListWidgetItem(f"{sender} a mis fin à votre conversation privée.")
+    return Entry(f"{sender} a mis fin à votre conversation privée.")
 
 def cmd_ask_file(view, sender, content):
-    accepter = QPushButton("Accepter")
-    ignorer = QPushButton("Ignorer")
-    accepter.clicked.connect(lambda: view.signal_handle_file.emit("YES", content.split()[0]))
-    ignorer.clicked.connect(lambda: view.signal_handle_file.emit("NO", content.split()[0]))
-    message = f"{sender} désire vous envoyer un fichier nommé {content.split()[2]} de {content.split()[1]} bytes. " \
+    file_id, size, name = content.split()[:3]
+    message = f"{sender} désire vous envoyer un fichier nommé {name} de {size} bytes. " \
            f"Acceptez-vous ?"
-    view.my_file_requests[content.split()[0]] = (content.split()[2],content.split()[1])
+    view.my_file_requests[file_id] = (name, size)
 
-    # create a new widget to display the message and the buttons at once
-    widgetLayout = QHBoxLayout()
-    widgetLayout.addWidget(QLabel(message))
-    widgetLayout.addWidget(accepter)
-    widgetLayout.addWidget(ignorer)
-    widgetLayout.addStretch()
-    widgetLayout.setSizeConstraint(QLayout.SetFixedSize)
+    return Entry(message, action=("file", file_id))
 
-    widget = QWidget()
-    widget.setLayout(widgetLayout)
+def cmd_reply_file(view, sender, content):
+    file_id, answer, *address = content.split()
 
-    item = QListWidgetItem()
-    item.setSizeHint(widget.sizeHint())
-    return item, widget
+    # the request is answered, hence it is over for the sender
+    request = view.my_file_requests.pop(file_id, None)
 
-def cmd_reply_file(view, sender, content):
-    if content.split()[1].lower() == "yes":
-        port = content.split()[2]
-        ip = content.split()[3]
-        
-        # send the file
-        filename = view.my_file_requests[content.split()[0]][0]
-        file_size = view.my_file_requests[content.split()[0]][1]
-        
-        amount_read = 0
-        
-        with open(filename, 'rb') as f:
-            while True and amount_read < file_size:
-                data = f.read(1048)
-                
-                amount_read += 1048
-                
-                with socket(AF_INET, SOCK_DGRAM) as sock:
-                    sock.sendto(data, (ip, int(port)))
-                    
-        return QListWidgetItem(f"{sender} a accepté votre demande d'envoi de fichier !")
-    return QListWidgetItem(f"{sender} a refusé votre demande d'envoi de fichier.")
+    # the request may have been made before the client reconnected
+    if request is None:
+        return None
+
+    filename = request[0]
+
+    if answer.lower() == "yes":
+
+        if address[0].upper() == "RELAY":
+            port, token = address[1:3]
+            connect = functools.partial(transfer.join_relay, view.view.ip, int(port), token, "SEND")
+        else:
+            port, ip = address[:2]
+            connect = functools.partial(transfer.connect, ip, int(port))
+
+        # the file is sent by a background thread so that the window stays responsive
+        Thread(target=view.send_file, args=(connect, filename)).start()
+
+        return Entry(f"{sender} a accepté votre demande d'envoi de fichier !")
+    return Entry(f"{sender} a refusé votre demande d'envoi de fichier.")
+
+def cmd_file_expired(view, sender, content):
+    request = view.my_file_requests.pop(content.split()[0], None)
+
+    if request is None:
+        return None
+    return Entry(f"Votre demande d'envoi du fichier {os.path.basename(request[0])} a expiré.")
 
 
 class Logged(QWidget, Ui_Logged):
@@ -111,6 +94,7 @@ class Logged(QWidget, Ui_Logged):
     signal_handle_response = pyqtSignal(str)
     signal_handle_whisper = pyqtSignal(str, str)  # yes/no, sender
     signal_handle_file = pyqtSignal(str, str)  # yes/no, request id
+    signal_handle_relay = pyqtSignal(str)  # reply to REPLY_FILE <id> YES RELAY
 
     def __init__(self, view, parent=None):
         QWidget.__init__(self, parent)
@@ -121,8 +105,11 @@ class Logged(QWidget, Ui_Logged):
         self.signal_handle_response.connect(self.handle_response)
         self.signal_handle_whisper.connect(self.handle_whisper)
         self.signal_handle_file.connect(self.handle_file)
+        self.signal_handle_relay.connect(self.handle_relay)
         self.private_conversations = []
         self.my_file_requests = {}
+        # the files waiting for the relay, in the order they were accepted
+        self.relayed_files = collections.deque()
         self.commands = {
             "MESSAGE": cmd_message,
             "NICK": cmd_nick,
@@ -133,35 +120,79 @@ class Logged(QWidget, Ui_Logged):
             "WHISPER": cmd_whisper,
             "STOP_WHISPER": cmd_stop_whisper,
             "ASK_FILE": cmd_ask_file,
-            "REPLY_FILE": cmd_reply_file
+            "REPLY_FILE": cmd_reply_file,
+            "FILE_EXPIRED": cmd_file_expired
         }
+        
+        # only the visible messages are drawn, and old ones are paged out to disk
+        self.messages = Conversation(MAX_SCROLLBACK, self)
+        self.messages.answered.connect(self.on_answered)
+        self.conversation.setModel(self.messages)
+        self.conversation.setItemDelegate(ConversationDelegate(self.conversation))
+        self.conversation.setLayoutMode(QListView.Batched)
+
+        # received messages are rendered by batches rather than one by one
+        self.render_timer = QTimer(self)
+        self.render_timer.timeout.connect(self.render_pending)
+        self.render_timer.start(RENDER_INTERVAL)
 
 
     def on_display(self):
-        self.messages = self.view.conversation
-
-        if not self.messages.empty():
-            new_msg = self.messages.get()
-            widget = None
-            print(new_msg)
-            if new_msg.startswith(':'):
-                sender = ''.join(new_msg.split()[:1]).lstrip(':')
-                content = ' '.join(new_msg.split()[2:])
-                if sender not in self.view.connected_view.mute_ppl:
-                    item = self.commands[new_msg.split()[1]](self, sender, content)
-                else:
-                    return
-            else:
-                if not self.view.actionPasser_en_mode_actif.isEnabled():
-                    item = QListWidgetItem(f"Moi : {new_msg}")
-                else:
-                    return
-
-            if isinstance(item, tuple):
-                self.conversation.addItem(item[0])
-                self.conversation.setItemWidget(item[0], item[1])
-            else:
-                self.conversation.addItem(item)
+        self.render_pending()
+
+    def render_pending(self):
+        """
+        Renders the messages waiting in the conversation queue, at most
+        MAX_BATCH at a time.
+        """
+        entries = []
+
+        for _ in range(MAX_BATCH):
+            try:
+                new_msg = self.view.conversation.get_nowait()
+            except queue.Empty:
+                break
+
+            entry = self.render(new_msg)
+            if entry is not None:
+                entries.append(entry)
+
+        if not entries:
+            return
+
+        # follow the new messages, unless the user is reading older ones
+        scroll_bar = self.conversation.verticalScrollBar()
+        at_bottom = scroll_bar.value() == scroll_bar.maximum()
+
+        self.messages.extend(entries)
+
+        if at_bottom:
+            self.conversation.scrollToBottom()
+
+    def render(self, new_msg):
+        """
+        Returns the entry displaying `new_msg`, or `None` if it must not be displayed.
+        """
+        if new_msg.startswith(':'):
+            sender, command, *content = new_msg[1:].split(None, 2)
+            content = content[0] if content else ""
+
+            self.view.connected_view.on_event(sender, command, content)
+
+            if sender in self.view.connected_view.mute_ppl or command not in self.commands:
+                return None
+            return self.commands[command](self, sender, content)
+
+        if not self.view.actionPasser_en_mode_actif.isEnabled():
+            return Entry(f"Moi : {new_msg}")
+        return None
+
+    @QtCore.pyqtSlot(str, str, str)
+    def on_answered(self, kind, key, reply):
+        if kind == "whisper":
+            self.signal_handle_whisper.emit(reply, key)
+        elif kind == "file":
+            self.signal_handle_file.emit(reply, key)
 
     @QtCore.pyqtSlot(str, str)
     def handle_whisper(self, reply, sender):
@@ -169,44 +200,77 @@ class Logged(QWidget, Ui_Logged):
 
     @QtCore.pyqtSlot(str, str)
     def handle_file(self, reply, request_id):
-        if reply == "YES":
-            port = 8432  # open a udp connection
+        name = QFileDialog.getSaveFileName(self, 'Save File')[0] if reply == "YES" else ""
 
-            name = QFileDialog.getSaveFileName(self, 'Save File')
-            Thread(target=self.receive_files, args=(name[0], request_id, port)).start()
-            self.signal_msg.emit(f"REPLY_FILE {request_id} {reply} {port}", self.signal_handle_response)
+        if name and self.view.relay:
+            # the receiver joins the relay once the server has opened the transfer
+            self.relayed_files.append((name, request_id))
+            self.signal_msg.emit(f"REPLY_FILE {request_id} YES RELAY", self.signal_handle_relay)
+        elif name:
+            self.receive_directly(name, request_id)
         else:
-            self.signal_msg.emit(f"REPLY_FILE {request_id} {reply}", self.signal_handle_response)
-
-    def receive_files(self, new_file_name, request_id, port):
-        file_size = self.my_file_requests[request_id][1]
-        with socket(AF_INET, SOCK_DGRAM) as sock:
-            sock.bind(('', port))
-            print(f"socket bound")
-            amount_received = 0
-            
-            while True and amount_received < int(file_size):
-                requete = sock.recvfrom(1048)
-                amount_received += 1048
-                
-                if not requete:
-                    break;
-                
-                (mess, adr_client) = requete
-
-                with open(new_file_name, 'ab') as file:
-                    file.write(mess)
-                    
+            self.signal_msg.emit(f"REPLY_FILE {request_id} NO", self.signal_handle_response)
+
+    def receive_directly(self, name, request_id):
+        # listen before replying, so that the sender cannot connect too early
+        server = transfer.listen()
+        port = server.getsockname()[1]
+
+        connect = functools.partial(transfer.accept, server)
+        Thread(target=self.receive_files, args=(connect, name, request_id)).start()
+        self.signal_msg.emit(f"REPLY_FILE {request_id} YES {port}", self.signal_handle_response)
+
+    @QtCore.pyqtSlot(str)
+    def handle_relay(self, server_response):
+        name, request_id = self.relayed_files.popleft()
+
+        # the file is still awaited when the server cannot relay it
+        if server_response.startswith("211"):
+            self.receive_directly(name, request_id)
+            return
+        if not server_response.startswith("104"):
+            self.handle_response(server_response)
+            return
+
+        port, token = server_response.split()[2:4]
+        connect = functools.partial(transfer.join_relay, self.view.ip, int(port), token, "RECV")
+        Thread(target=self.receive_files, args=(connect, name, request_id)).start()
+
+    def receive_files(self, connect, new_file_name, request_id):
+        file_size = int(self.my_file_requests[request_id][1])
+
+        try:
+            received = transfer.receive_file(connect(), new_file_name, file_size)
+        except OSError:
+            received = False
+
+        self.view.signal_change_msg_accueil.emit("Fichier reçu !" if received else "Le transfert du fichier a échoué.")
+
+    def send_file(self, connect, filename):
+        try:
+            transfer.send_file(connect(), filename)
+        except OSError:
+            self.view.signal_change_msg_accueil.emit("Le transfert du fichier a échoué.")
+        else:
+            self.view.signal_change_msg_accueil.emit("Fichier envoyé !")
+
     @QtCore.pyqtSlot()
     def on_send_msg_clicked(self):
         msg_content = self.msg.toPlainText()
         self.msg.clear()
         self.view.conversation.put(msg_content)
-        self.on_display()
+        self.render_pending()
+
+        # a request is a single line, hence each line is sent as a message of its own
+        lines = [line for line in msg_content.splitlines() if line.strip()]
+
         if not msg_content.startswith('@'):
-            self.signal_msg.emit(f"MESSAGE {msg_content}", self.signal_handle_response)
-        else:
-            self.signal_msg.emit(f"WHISPER {msg_content.split()[0][1:]} {' '.join(msg_content.split()[1:])}", self.signal_handle_response)
+            for line in lines:
+                self.signal_msg.emit(f"MESSAGE {line}", self.signal_handle_response)
+        elif lines:
+            receiver, *first = lines[0].split(None, 1)
+            for line in first + lines[1:]:
+                self.signal_msg.emit(f"WHISPER {receiver[1:]} {' '.join(line.split())}", self.signal_handle_response)
 
 
     @QtCore.pyqtSlot(str)
@@ -40,6 +40,7 @@ class Login(QWidget, Ui_Login):
             self.login.setText("")
             self.msg_login.setText("Ce pseudo est déjà pris... ")
         else:
+            self.view.network.confirm()
             self.view.menuMon_compte.setEnabled(True)
             self.view.menuConversation.setEnabled(True)
             self.view.current_user = self.login.text()
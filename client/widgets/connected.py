@@ -16,97 +16,18 @@ class Ui_Connected(object):
         self.pushButton = QtWidgets.QPushButton(Connected)
         self.pushButton.setGeometry(QtCore.QRect(210, 650, 201, 34))
         self.pushButton.setObjectName("pushButton")
-        self.connected_ppl = QtWidgets.QListWidget(Connected)
-        self.connected_ppl.setGeometry(QtCore.QRect(20, 20, 241, 601))
+        self.connected_ppl = QtWidgets.QListView(Connected)
+        self.connected_ppl.setGeometry(QtCore.QRect(20, 20, 411, 601))
+        self.connected_ppl.setUniformItemSizes(True)
         self.connected_ppl.setObjectName("connected_ppl")
-        self.list_buttons = QtWidgets.QListWidget(Connected)
-        self.list_buttons.setGeometry(QtCore.QRect(480, 20, 131, 601))
-        palette = QtGui.QPalette()
-        brush = QtGui.QBrush(QtGui.QColor(240, 240, 240))
-        brush.setStyle(QtCore.Qt.SolidPattern)
-        palette.setBrush(QtGui.QPalette.Active, QtGui.QPalette.WindowText, brush)
-        brush = QtGui.QBrush(QtGui.QColor(240, 240, 240))
-        brush.setStyle(QtCore.Qt.SolidPattern)
-        palette.setBrush(QtGui.QPalette.Active, QtGui.QPalette.Base, brush)
-        brush = QtGui.QBrush(QtGui.QColor(231, 231, 231))
-        brush.setStyle(QtCore.Qt.SolidPattern)
-        palette.setBrush(QtGui.QPalette.Active, QtGui.QPalette.Window, brush)
-        brush = QtGui.QBrush(QtGui.QColor(240, 240, 240))
-        brush.setStyle(QtCore.Qt.SolidPattern)
-        palette.setBrush(QtGui.QPalette.Active, QtGui.QPalette.Shadow, brush)
-        brush = QtGui.QBrush(QtGui.QColor(240, 240, 240))
-        brush.setStyle(QtCore.Qt.SolidPattern)
-        palette.setBrush(QtGui.QPalette.Inactive, QtGui.QPalette.WindowText, brush)
-        brush = QtGui.QBrush(QtGui.QColor(240, 240, 240))
-        brush.setStyle(QtCore.Qt.SolidPattern)
-        palette.setBrush(QtGui.QPalette.Inactive, QtGui.QPalette.Base, brush)
-        brush = QtGui.QBrush(QtGui.QColor(231, 231, 231))
-        brush.setStyle(QtCore.Qt.SolidPattern)
-        palette.setBrush(QtGui.QPalette.Inactive, QtGui.QPalette.Window, brush)
-        brush = QtGui.QBrush(QtGui.QColor(240, 240, 240))
-        brush.setStyle(QtCore.Qt.SolidPattern)
-        palette.setBrush(QtGui.QPalette.Inactive, QtGui.QPalette.Shadow, brush)
-        brush = QtGui.QBrush(QtGui.QColor(120, 120, 120))
-        brush.setStyle(QtCore.Qt.SolidPattern)
-        palette.setBrush(QtGui.QPalette.Disabled, QtGui.QPalette.WindowText, brush)
-        brush = QtGui.QBrush(QtGui.QColor(231, 231, 231))
-        brush.setStyle(QtCore.Qt.SolidPattern)
-        palette.setBrush(QtGui.QPalette.Disabled, QtGui.QPalette.Base, brush)
-        brush = QtGui.QBrush(QtGui.QColor(231, 231, 231))
-        brush.setStyle(QtCore.Qt.SolidPattern)
-        palette.setBrush(QtGui.QPalette.Disabled, QtGui.QPalette.Window, brush)
-        brush = QtGui.QBrush(QtGui.QColor(240, 240, 240))
-        brush.setStyle(QtCore.Qt.SolidPattern)
-        palette.setBrush(QtGui.QPalette.Disabled, QtGui.QPalette.Shadow, brush)
-        self.list_buttons.setPalette(palette)
-        self.list_buttons.setAutoFillBackground(False)
-        self.list_buttons.setFrameShape(QtWidgets.QFrame.NoFrame)
-        self.list_buttons.setLineWidth(0)
-        self.list_buttons.setObjectName("list_buttons")
-        self.list_files = QtWidgets.QListWidget(Connected)
-        self.list_files.setGeometry(QtCore.QRect(300, 20, 131, 601))
-        palette = QtGui.QPalette()
-        brush = QtGui.QBrush(QtGui.QColor(240, 240, 240))
-        brush.setStyle(QtCore.Qt.SolidPattern)
-        palette.setBrush(QtGui.QPalette.Active, QtGui.QPalette.WindowText, brush)
-        brush = QtGui.QBrush(QtGui.QColor(240, 240, 240))
-        brush.setStyle(QtCore.Qt.SolidPattern)
-        palette.setBrush(QtGui.QPalette.Active, QtGui.QPalette.Base, brush)
-        brush = QtGui.QBrush(QtGui.QColor(231, 231, 231))
-        brush.setStyle(QtCore.Qt.SolidPattern)
-        palette.setBrush(QtGui.QPalette.Active, QtGui.QPalette.Window, brush)
-        brush = QtGui.QBrush(QtGui.QColor(240, 240, 240))
-        brush.setStyle(QtCore.Qt.SolidPattern)
-        palette.setBrush(QtGui.QPalette.Active, QtGui.QPalette.Shadow, brush)
-        brush = QtGui.QBrush(QtGui.QColor(240, 240, 240))
-        brush.setStyle(QtCore.Qt.SolidPattern)
-        palette.setBrush(QtGui.QPalette.Inactive, QtGui.QPalette.WindowText, brush)
-        brush = QtGui.QBrush(QtGui.QColor(240, 240, 240))
-        brush.setStyle(QtCore.Qt.SolidPattern)
-        palette.setBrush(QtGui.QPalette.Inactive, QtGui.QPalette.Base, brush)
-        brush = QtGui.QBrush(QtGui.QColor(231, 231, 231))
-        brush.setStyle(QtCore.Qt.SolidPattern)
-        palette.setBrush(QtGui.QPalette.Inactive, QtGui.QPalette.Window, brush)
-        brush = QtGui.QBrush(QtGui.QColor(240, 240, 240))
-        brush.setStyle(QtCore.Qt.SolidPattern)
-        palette.setBrush(QtGui.QPalette.Inactive, QtGui.QPalette.Shadow, brush)
-        brush = QtGui.QBrush(QtGui.QColor(120, 120, 120))
-        brush.setStyle(QtCore.Qt.SolidPattern)
-        palette.setBrush(QtGui.QPalette.Disabled, QtGui.QPalette.WindowText, brush)
-        brush = QtGui.QBrush(QtGui.QColor(231, 231, 231))
-        brush.setStyle(QtCore.Qt.SolidPattern)
-        palette.setBrush(QtGui.QPalette.Disabled, QtGui.QPalette.Base, brush)
-        brush = QtGui.QBrush(QtGui.QColor(231, 231, 231))
-        brush.setStyle(QtCore.Qt.SolidPattern)
-        palette.setBrush(QtGui.QPalette.Disabled, QtGui.QPalette.Window, brush)
-        brush = QtGui.QBrush(QtGui.QColor(240, 240, 240))
-        brush.setStyle(QtCore.Qt.SolidPattern)
-        palette.setBrush(QtGui.QPalette.Disabled, QtGui.QPalette.Shadow, brush)
-        self.list_files.setPalette(palette)
-        self.list_files.setAutoFillBackground(False)
-        self.list_files.setFrameShape(QtWidgets.QFrame.NoFrame)
-        self.list_files.setLineWidth(0)
-        self.list_files.setObjectName("list_files")
+        self.mute_button = QtWidgets.QPushButton(Connected)
+        self.mute_button.setEnabled(False)
+        self.mute_button.setGeometry(QtCore.QRect(450, 20, 161, 34))
+        self.mute_button.setObjectName("mute_button")
+        self.file_button = QtWidgets.QPushButton(Connected)
+        self.file_button.setEnabled(False)
+        self.file_button.setGeometry(QtCore.QRect(450, 64, 161, 34))
+        self.file_button.setObjectName("file_button")
 
         self.retranslateUi(Connected)
         QtCore.QMetaObject.connectSlotsByName(Connected)
@@ -115,4 +36,5 @@ class Ui_Connected(object):
         _translate = QtCore.QCoreApplication.translate
         Connected.setWindowTitle(_translate("Connected", "Form"))
         self.pushButton.setText(_translate("Connected", "Retour à la conversation"))
-
+        self.mute_button.setText(_translate("Connected", "mute"))
+        self.file_button.setText(_translate("Connected", "send file"))
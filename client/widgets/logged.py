@@ -12,8 +12,9 @@ class Ui_Logged(object):
     def setupUi(self, Logged):
         Logged.setObjectName("Logged")
         Logged.resize(625, 723)
-        self.conversation = QtWidgets.QListWidget(Logged)
+        self.conversation = QtWidgets.QListView(Logged)
         self.conversation.setGeometry(QtCore.QRect(20, 20, 581, 451))
+        self.conversation.setUniformItemSizes(True)
         self.conversation.setObjectName("conversation")
         self.msg = QtWidgets.QTextEdit(Logged)
         self.msg.setGeometry(QtCore.QRect(20, 520, 581, 121))
@@ -0,0 +1,485 @@
+# Standard libraries
+import itertools
+import logging
+import multiprocessing
+import os
+import selectors
+import signal
+import socket
+import tempfile
+import threading
+
+# Local imports
+from server.dnc._data import ConnectionStatus
+from server.tcp import Connection, Protocol, TcpServer, _Callbacks, _Outbox
+from server.utils.framing import FrameBuffer
+from server.utils.timers import TimerWheel
+
+class _Link:
+    """
+    A line-based stream between two processes of the cluster.
+
+    Lines are written without blocking: the data that cannot be sent
+    immediately is kept until the socket is writable.
+
+    Args:
+    -----
+        sock (socket): a connected unix socket
+        selector (selectors.BaseSelector): the selector of the loop that owns the link
+        on_line (Callable[[str], None]): called for every received line
+        on_closed (Callable[[], None]): called once the link is closed
+    """
+
+    def __init__(self, sock, selector, on_line, on_closed):
+        sock.setblocking(False)
+
+        self._sock = sock
+        self._selector = selector
+        self._on_line = on_line
+        self._on_closed = on_closed
+        self._frames = FrameBuffer(max_size=1 << 24)
+        self._outbox = _Outbox()
+
+        selector.register(sock, selectors.EVENT_READ, self.handle)
+
+    def is_closed(self):
+        return self._sock.fileno() == -1
+
+    def write(self, line):
+        """
+        Writes `line` (str) to the other end of the link.
+        """
+        self.send(f"{line}\n".encode())
+
+    def send(self, data):
+        """
+        Writes `data` (bytes), made of lines ended by a line feed, to the other end of the link.
+        """
+        if self.is_closed():
+            return
+
+        was_empty = not self._outbox
+        self._outbox.push(data)
+
+        if was_empty:
+            self._flush()
+
+    def handle(self, events):
+        """
+        Called by the loop when the socket of the link is ready.
+        """
+        if events & selectors.EVENT_WRITE:
+            self._flush()
+        if events & selectors.EVENT_READ and not self.is_closed():
+            self._read()
+
+    def close(self):
+        if self.is_closed():
+            return
+
+        self._selector.unregister(self._sock)
+        self._sock.close()
+        self._on_closed()
+
+    def _read(self):
+        try:
+            data = self._sock.recv(1 << 16)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            data = b""
+
+        if not data:
+            self.close()
+            return
+
+        for frame in self._frames.feed(data):
+            if self.is_closed():
+                return
+            if frame is None:
+                logging.error("LINK: line too long, ignored")
+            else:
+                self._on_line(frame.decode())
+
+    def _flush(self):
+        try:
+            self._outbox.flush(self._sock)
+        except OSError:
+            self.close()
+            return
+
+        events = selectors.EVENT_READ | selectors.EVENT_WRITE if self._outbox else selectors.EVENT_READ
+
+        if self._selector.get_key(self._sock).events != events:
+            self._selector.modify(self._sock, events, self.handle)
+
+class Broker:
+    """
+    Owns the state of the chat, and runs the protocol for the clients of
+    every worker of the cluster.
+
+    Workers forward the events of their clients as lines `<op> <id> [<payload>]`,
+    where <id> identifies the client within its worker:
+        - O <id> <ip> <port>: a client is connected to the worker
+        - D <id> <request>: the client sent a request
+        - C <id>: the client closed its connection
+        - L <id>: the connection with the client has been lost
+
+    The broker answers with the following lines:
+        - W <id> <message>: writes `message` to the client
+        - B <ids> <message>: writes `message` to every connected client of the worker,
+                             except those of the comma-separated <ids> ('-' if empty)
+        - J <id>: the client is now connected
+        - P <id>: the client is not connected anymore
+        - C <id>: closes the connection with the client
+
+    Args:
+    -----
+        protocol (DncProtocol): the protocol that deals with clients' requests
+        local_socket (socket): the listening unix socket to which workers connect
+
+    Attributes:
+    -----------
+        links (set[_Link]): the links with the workers
+        connection_per_key (Map[(_Link,str),Connection]): the connection of each client
+        key_per_connection (Map[Connection,(_Link,str)])
+    """
+
+    def __init__(self, protocol, local_socket):
+        self._protocol = protocol
+        self._local_socket = local_socket
+        self._is_over = threading.Event()
+        self._selector = None
+        self._callbacks = None
+        self._timers = None
+        self._links = set()
+        self._connection_per_key = {}
+        self._key_per_connection = {}
+
+    def run_forever(self, poll_interval=0.5):
+        """
+        Runs the broker until every worker is gone.
+
+        Arguments:
+        ----------
+            poll_interval (float): the maximum time (in seconds) to wait for an event
+                                   before checking whether the broker is over
+        """
+        self._is_over.clear()
+
+        with self._local_socket, selectors.DefaultSelector() as selector:
+            self._selector = selector
+            self._callbacks = _Callbacks(selector)
+            self._timers = TimerWheel()
+            selector.register(self._local_socket, selectors.EVENT_READ)
+
+            try:
+                while not self._is_over.is_set():
+                    for key, events in selector.select(self._timers.timeout(poll_interval)):
+                        if key.fileobj is self._local_socket:
+                            self._handle_new_worker()
+                        else:
+                            key.data(events)
+
+                    self._timers.advance()
+            except KeyboardInterrupt:
+                self._is_over.set()
+            except Exception:
+                logging.exception("")
+                raise
+
+    def _handle_new_worker(self):
+        sock, _ = self._local_socket.accept()
+
+        link = _Link(sock, self._selector,
+                     lambda line: self._handle_line(link, line),
+                     lambda: self._on_link_closed(link))
+
+        self._links.add(link)
+        logging.info(f"BROKER: NEW WORKER ({len(self._links)} running)")
+
+    def _on_link_closed(self, link):
+        self._links.remove(link)
+        logging.info(f"BROKER: WORKER GONE ({len(self._links)} running)")
+
+        for link_of_client, conn_id in list(self._connection_per_key):
+            if link_of_client is link:
+                self._close(link, conn_id, connection_lost=True)
+
+        if not self._links:
+            self._is_over.set()
+
+    def _handle_line(self, link, line):
+        op, conn_id, *payload = line.split(' ', 2)
+
+        if op == 'O':
+            ip, port = payload[0].split(' ')
+            self._open(link, conn_id, (ip, int(port)))
+        elif op == 'D':
+            self._handle_request(link, conn_id, payload[0] if payload else "")
+        elif op == 'C' or op == 'L':
+            self._close(link, conn_id, connection_lost=(op == 'L'))
+
+    def _open(self, link, conn_id, address):
+        connection = self._protocol.create_new_connection()
+        connection.ip = lambda: address[0]
+        connection.address = lambda: address
+        connection.write = lambda message: link.write(f"W {conn_id} {message}")
+        connection.write_bytes = lambda data: link.send(b"W " + conn_id.encode() + b" " + data)
+        connection.write_to = lambda pseudo, message: self._protocol[pseudo].connection.write(message)
+        connection.write_all = lambda message: self._broadcast(connection, message)
+        connection.close = lambda: self._close(link, conn_id, notify=True)
+        connection.call_soon_threadsafe = self._callbacks.call_soon_threadsafe
+        connection.call_later = self._timers.call_later
+
+        self._connection_per_key[link, conn_id] = connection
+        self._key_per_connection[connection] = (link, conn_id)
+
+        connection.on_connection_started()
+
+    def _handle_request(self, link, conn_id, request):
+        connection = self._connection_per_key.get((link, conn_id))
+
+        if connection is None:
+            return
+
+        connected = self._protocol.connected
+        was_connected = connection in connected
+
+        connection.on_data_received(request)
+
+        # let the worker know which clients receive the broadcast messages
+        is_connected = connection in connected
+        if is_connected != was_connected and (link, conn_id) in self._connection_per_key:
+            link.write(f"J {conn_id}" if is_connected else f"P {conn_id}")
+
+    def _broadcast(self, sender, message):
+        """
+        Broadcasts `message` to all connected clients, except `sender`
+        and the clients that muted it.
+
+        Each worker receives the message once, along with the clients to skip.
+        """
+        if sender.status is ConnectionStatus.NOT_CONNECTED:
+            return
+
+        excluded_per_link = {link: [] for link in self._links}
+
+        for connection in itertools.chain(sender.ignored_by, (sender,)):
+            # the sender is already forgotten when its connection is lost
+            key = self._key_per_connection.get(connection)
+            if key is not None:
+                excluded_per_link[key[0]].append(key[1])
+
+        for link, excluded in excluded_per_link.items():
+            link.write(f"B {','.join(excluded) or '-'} {message}")
+
+    def _close(self, link, conn_id, connection_lost=False, notify=False):
+        connection = self._connection_per_key.pop((link, conn_id), None)
+
+        if connection is None:
+            return
+
+        del self._key_per_connection[connection]
+
+        if notify:
+            link.write(f"C {conn_id}")
+
+        if connection_lost:
+            logging.info(f"CONNECTION LOST: {connection.client}")
+            connection.on_connection_lost()
+        else:
+            logging.info(f"CONNECTION CLOSED: {connection.client}")
+            connection.on_connection_closed()
+
+class _RelayConnection(Connection):
+    """
+    Forwards the events of a client to the broker.
+    """
+
+    def __init__(self, protocol, conn_id):
+        self._protocol = protocol
+        self.id = conn_id
+        self.client = None
+
+    def on_connection_started(self):
+        self._protocol.link.write(f"O {self.id} {self.ip()} {self.address()[1]}")
+
+    def on_data_received(self, data):
+        self._protocol.link.write(f"D {self.id} {data}")
+
+    def on_connection_closed(self):
+        self._protocol.link.write(f"C {self.id}")
+        self._protocol.forget(self)
+
+    def on_connection_lost(self):
+        self._protocol.link.write(f"L {self.id}")
+        self._protocol.forget(self)
+
+class _RelayProtocol(Protocol):
+    """
+    The protocol of the workers, which delegates requests to the broker.
+
+    Attributes:
+    -----------
+        link (_Link): the link with the broker
+        connection_per_id (Map[str,Connection]): the connection of each client of the worker
+        joined (Map[str,Connection]): the connections of the connected clients
+    """
+
+    def __init__(self):
+        self.link = None
+        self.connection_per_id = {}
+        self.joined = {}
+        self._ids = itertools.count()
+
+    def create_new_connection(self):
+        connection = _RelayConnection(self, str(next(self._ids)))
+        self.connection_per_id[connection.id] = connection
+        return connection
+
+    def is_authenticated(self, connection):
+        return connection.id in self.joined
+
+    def ping(self, connection):
+        # the worker checks its clients by itself, since the broker does not see their sockets
+        connection.write(":@server PING")
+
+    def forget(self, connection):
+        del self.connection_per_id[connection.id]
+        self.joined.pop(connection.id, None)
+
+class Worker(TcpServer):
+    """
+    A TCP server that shares its port with the other workers of the cluster,
+    and lets the broker process the requests of its clients.
+
+    The worker only deals with I/O: it accepts clients, frames their requests,
+    and writes to them the messages sent by the broker.
+
+    Args:
+    -----
+        broker_path (str): the path of the unix socket of the broker
+        port (int): the port of listening
+        options: the keyword arguments of `:class:TcpServer`, such as `max_write_buffer`
+    """
+
+    def __init__(self, broker_path, port=8123, **options):
+        super().__init__(_RelayProtocol(), port, **options)
+        self._broker_path = broker_path
+
+    def _create_local_socket(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        # let the kernel balance the incoming connections among the workers
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind(('', self._port))
+        sock.listen(self._backlog)
+        sock.setblocking(0)
+        logging.info(f"Worker {os.getpid()} is waiting (PORT={self._port})")
+
+        return sock
+
+    def _on_started(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(self._broker_path)
+
+        # the worker is useless without the broker
+        self._protocol.link = _Link(sock, self._selector, self._handle_line, self._is_over.set)
+
+    def _handle_line(self, line):
+        op, conn_id, *payload = line.split(' ', 2)
+        protocol = self._protocol
+
+        if op == 'B':
+            self._broadcast_locally(conn_id.split(','), payload[0])
+            return
+
+        connection = protocol.connection_per_id.get(conn_id)
+
+        if connection is None:
+            return
+
+        if op == 'W':
+            connection.write(payload[0])
+        elif op == 'J':
+            protocol.joined[conn_id] = connection
+        elif op == 'P':
+            protocol.joined.pop(conn_id, None)
+        elif op == 'C':
+            connection.close()
+
+    def _broadcast_locally(self, excluded, message):
+        excluded = set(excluded)
+        data = f"{message}\n".encode()
+
+        # copy the items since sending may close slow clients
+        for conn_id, connection in list(self._protocol.joined.items()):
+            if conn_id not in excluded:
+                socket = self._socket_per_connection.get(connection)
+                if socket is not None:
+                    self._send(socket, data)
+
+def run_cluster(protocol, port=8123, workers=2, **options):
+    """
+    Runs `workers` processes that share `port`, and a broker process that
+    runs `protocol` for all of them.
+
+    Processes are coordinated through a unix socket, so that messages reach
+    clients connected to any worker. This function returns once every
+    process is over. Both an interruption and a termination of the calling
+    process are forwarded to the others, which are then closed.
+
+    Arguments:
+    ----------
+        protocol (DncProtocol): the protocol that deals with clients' requests
+        port (int): the port of listening
+        workers (int): the number of worker processes
+        options: the keyword arguments of the `:class:TcpServer` of each worker,
+                 such as `max_write_buffer`
+    """
+    context = multiprocessing.get_context('fork')
+
+    with tempfile.TemporaryDirectory() as directory:
+        broker_path = os.path.join(directory, 'broker.sock')
+
+        # listen before starting the workers, so that they can connect at once
+        broker_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        broker_socket.bind(broker_path)
+        broker_socket.listen(workers)
+
+        processes = [context.Process(target=Broker(protocol, broker_socket).run_forever, name="broker")]
+        processes += [context.Process(target=Worker(broker_path, port, **options).run_forever, name=f"worker-{i}")
+                      for i in range(workers)]
+
+        for process in processes:
+            process.start()
+
+        broker_socket.close()
+
+        # the handler is installed once the processes are started, so that they do not inherit it
+        terminated = False
+
+        def terminate(signum, frame):
+            nonlocal terminated
+            # the processes are being closed already after a first termination
+            if not terminated:
+                terminated = True
+                raise KeyboardInterrupt
+
+        previous_handler = signal.signal(signal.SIGTERM, terminate)
+
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            # the interruption may not have been sent to the whole process group,
+            # whereas a termination is only sent to this process
+            for process in processes:
+                process.join(0 if terminated else 1)
+                if process.is_alive():
+                    os.kill(process.pid, signal.SIGINT)
+            for process in processes:
+                process.join()
+        finally:
+            signal.signal(signal.SIGTERM, previous_handler)
@@ -1,79 +1,162 @@
 # Standard modules
+import functools
 
 # Local imports
-from server.dnc._data import ConnectionStatus, Client
-from server.utils.errors import abort_if
-from server.utils.patterns import Dispatcher
+from server.dnc._data import ConnectionStatus, Client, FileRequest
 
 # Restrict "from _commands import *"
 __all__ = ['CommandDispatcher']
 
-class CommandDispatcher(Dispatcher):
+# The statuses in which a command is refused, along with the reply sent in that case
+LOGGED_IN = {
+    ConnectionStatus.NOT_CONNECTED: "201 ERR_NOTCONNECTED"
+}
+ACTIVE = {
+    ConnectionStatus.NOT_CONNECTED: "201 ERR_NOTCONNECTED",
+    ConnectionStatus.AWAY: "202 ERR_BADSTATUS"
+}
+LOGGED_OUT = {
+    ConnectionStatus.CONNECTED: "200 ERR_ALREADYCONNECTED",
+    ConnectionStatus.AWAY: "200 ERR_ALREADYCONNECTED"
+}
+
+class _Command:
+    """
+    A registered command, along with the preconditions checked before running it.
+    
+    Attributes:
+    -----------
+        handler (Callable[[DncConnection, List[str]], Union[str,bytes]]): computes the reply
+                                                                          to the request
+        refused (Dict[ConnectionStatus,str]): the error replied per status in which
+                                              the command cannot be run
+        min_args (int): the minimum number of arguments
+        max_args (int): the number of arguments the request is split into, the last
+                        one holding the rest of the line, or `None` to split every word
+        offload (Callable[[DncConnection, List[str]], bool]): tells whether the request
+                                                              has to be run by a pool of threads
+    """
+    
+    __slots__ = ('handler', 'refused', 'min_args', 'max_args', 'offload')
+    
+    def __init__(self, handler, refused, min_args=0, max_args=None, offload=None):
+        self.handler = handler
+        self.refused = refused
+        self.min_args = min_args
+        self.max_args = max_args
+        self.offload = offload
+        
+    def check(self, connection, args):
+        """
+        Returns the error to reply if the request cannot be handled, `None` otherwise.
+        """
+        error = self.refused.get(connection.status)
+        
+        if error is None and len(args) < self.min_args:
+            error = "203 ERR_NOTENOUGHARGS"
+            
+        return error
+
+class CommandDispatcher:
     """
-    Registers DNC commands, and handles clients' requests.
+    Registers DNC commands, and parses clients' requests.
     """
     
+    # The registered commands, per upper-cased name
+    _commands = {}
+    
     @classmethod
-    def register_cmd(cls, callback):
+    def register_cmd(cls, callback=None, *, refused=LOGGED_IN, min_args=0, max_args=None, offload=None):
         """
         A decorator that registers a new command.
         
         The name of the command is the name of the function (case is irrelevant),
         and the content of the function is executed when the command is received
-        by `:func:react`.
+        by a connection.
         
         Registered functions must take two arguments:
             - (DncConnection): the connection associated with the client that sent
                                the request
             - (List[str]): the arguments of the request
+            
+        and return the reply to send, or `None`. A reply shared by many clients can
+        be returned as `bytes`, already encoded and ended by a line feed.
+            
+        The decorator can be used with arguments:
+            - refused (Dict[ConnectionStatus,str]): the statuses in which the command is
+                refused, along with the error to reply (default: `LOGGED_IN`)
+            - min_args (int): the minimum number of arguments, "203 ERR_NOTENOUGHARGS"
+                being replied to shorter requests
+            - max_args (int): the number of arguments the request is split into, the
+                last one holding the rest of the line as is
+            - offload (Callable[[DncConnection, List[str]], bool]): a predicate telling
+                whether a request is slow enough to be run by a pool of threads rather
+                than by the server's loop. Offloaded commands must not modify the state
+                of the server nor write to connections: they only compute the reply.
+                
+        Preconditions are checked by the server's loop before the handler is called.
         """
+        if callback is None:
+            return functools.partial(cls.register_cmd, refused=refused, min_args=min_args,
+                                                       max_args=max_args, offload=offload)
+        
         name = callback.__name__.upper()
-        return cls.set_callback(name, callback)
-
-    def react(self, message, connection):
+        cls._commands[name] = _Command(callback, refused, min_args, max_args, offload)
+        return callback
+    
+    def parse(self, message):
         """
-        Reacts to a client's request.
+        Returns the command that handles `message` along with its arguments.
         
         The command to process is the first word of `message`, and the next ones
-        are the arguments.
-        
-        Arguments:
-        ----------
-            message (str): the request's content
-            connection (DncConnection): the connection associated with the client
-            
-        Returns:
-        -------
-            str: the response to send to the client, or `None` if no response has to be send
+        are the arguments. The line is only split into as many arguments as the
+        command needs.
         """
-        cmd, *args = message.split()
+        parts = message.split(None, 1)
+        
+        if not parts:
+            return _MALFORMED_REQUEST, []
+        
+        command = self._commands.get(parts[0].upper(), _MALFORMED_REQUEST)
         
-        handler = self.dispatch(cmd.upper(), lambda *_: "298 ERR_MALFORMEDREQUEST")
-        return handler(connection, args)
+        if len(parts) == 1:
+            return command, []
+        if command.max_args is None:
+            return command, parts[1].split()
+        return command, parts[1].rstrip().split(None, command.max_args - 1)
 
-@CommandDispatcher.register_cmd
-def connect(connection, args):
-    abort_if(lambda: connection.status == ConnectionStatus.CONNECTED, "200 ERR_ALREADYCONNECTED")
-    abort_if(lambda: len(args) < 1, "203 ERR_NOTENOUGHARGS")
-    abort_if(lambda: args[0] in connection._protocol.clients, "205 ERR_NICKNAMEINUSE")
+def _malformed_request(connection, args):
+    return "298 ERR_MALFORMEDREQUEST"
+
+_MALFORMED_REQUEST = _Command(_malformed_request, {})
+
+def _asks_chat_bot(connection, args):
+    """
+    Returns whether the message in `args` is a command for the chat bot.
+    """
+    return connection._protocol.chat_bot is not None and len(args) > 0 and args[0].startswith('!')
 
+@CommandDispatcher.register_cmd(refused=LOGGED_OUT, min_args=1)
+def connect(connection, args):
     pseudo = args[0]
     
+    if pseudo in connection._protocol.clients:
+        return "205 ERR_NICKNAMEINUSE"
+    
     if len(pseudo) > 10 or pseudo.startswith('@') or ',' in pseudo:
         return "206 ERR_INVALIDNICKNAME"
     
     connection.status = ConnectionStatus.CONNECTED    
     connection.client = Client(pseudo, connection)
     connection._protocol.clients[pseudo] = connection.client
+    connection._protocol.connected.add(connection)
     
     connection.write_all(f":{pseudo} CONNECT")
     
     return "100 RPL_DONE"
 
-@CommandDispatcher.register_cmd
+@CommandDispatcher.register_cmd(max_args=1)
 def quit(connection, args):  # @ReservedAssignment
-    abort_if(lambda: connection.status == ConnectionStatus.NOT_CONNECTED, "201 ERR_NOTCONNECTED")
-
     connection.write_all(":" + connection.client.pseudo + " QUIT " + " ".join(args))
         
     connection.close();
@@ -81,24 +164,22 @@ def quit(connection, args):  # @ReservedAssignment
     # no reply will be sent
     return None
 
-@CommandDispatcher.register_cmd
+@CommandDispatcher.register_cmd(refused={})
+def pong(connection, args):
+    # receiving the answer to a ping is enough to know that the client is alive
+    return None
+
+@CommandDispatcher.register_cmd(refused=ACTIVE, min_args=1, max_args=1, offload=_asks_chat_bot)
 def message(connection, args):
-    abort_if(lambda: connection.status == ConnectionStatus.NOT_CONNECTED, "201 ERR_NOTCONNECTED")
-    abort_if(lambda: connection.status == ConnectionStatus.AWAY, "202 ERR_BADSTATUS")
-    abort_if(lambda: len(args) < 1, "203 ERR_NOTENOUGHARGS")
-        
-    if args[0].startswith('!'):                
-        return connection._protocol.chat_bot.react(*args)
+    if _asks_chat_bot(connection, args):
+        return connection._protocol.chat_bot.react(*args[0].split())
 
-    connection.write_all(":" + connection.client.pseudo + " MESSAGE " + " ".join(args))
+    connection.write_all(f":{connection.client.pseudo} MESSAGE {args[0]}")
             
     return "100 RPL_DONE"
 
-@CommandDispatcher.register_cmd
+@CommandDispatcher.register_cmd(min_args=1)
 def mute(connection, args):
-    abort_if(lambda: connection.status == ConnectionStatus.NOT_CONNECTED, "201 ERR_NOTCONNECTED")
-    abort_if(lambda: len(args) < 1, "203 ERR_NOTENOUGHARGS")
-     
     in_error = []
  
     for pseudo in args:
@@ -107,15 +188,12 @@ def mute(connection, args):
         except KeyError:
             in_error.append(pseudo)
         else:
-            connection.ignored.add(to_mute.connection)
+            connection.mute(to_mute.connection)
         
     return "100 RPL_DONE" if not in_error else "204 ERR_NICKNAMENOTEXIST " + " ".join(in_error) 
     
-@CommandDispatcher.register_cmd
+@CommandDispatcher.register_cmd(min_args=1)
 def listen(connection, args):
-    abort_if(lambda: connection.status == ConnectionStatus.NOT_CONNECTED, "201 ERR_NOTCONNECTED")
-    abort_if(lambda: len(args) < 1, "203 ERR_NOTENOUGHARGS")
-    
     in_error = []
     
     for pseudo in args:
@@ -124,21 +202,17 @@ def listen(connection, args):
         except KeyError:
             in_error.append(pseudo)
         else:
-            connection.ignored.remove(to_listen.connection)
+            connection.listen(to_listen.connection)
         
     return "100 RPL_DONE" if not in_error else "204 ERR_NICKNAMENOTEXIST " + " ".join(in_error) 
 
-@CommandDispatcher.register_cmd
+@CommandDispatcher.register_cmd(refused=ACTIVE, min_args=2, max_args=2)
 def whisper(connection, args):
-    abort_if(lambda: connection.status == ConnectionStatus.NOT_CONNECTED, "201 ERR_NOTCONNECTED")
-    abort_if(lambda: connection.status == ConnectionStatus.AWAY, "202 ERR_BADSTATUS")
-    abort_if(lambda: len(args) < 2, "203 ERR_NOTENOUGHARGS")
-
-    dest = args[0]
+    dest, message = args
     
     try:
-        abort_if(lambda: not connection in connection._protocol[dest].connection.private, "207 ERR_WHISPERNOTALLOWED")
-        message = " ".join(args[1:])
+        if connection not in connection._protocol[dest].connection.private:
+            return "207 ERR_WHISPERNOTALLOWED"
 
         connection.write_to(dest, ":" + connection.client.pseudo + " WHISPER " + message)
     except KeyError:
@@ -146,12 +220,8 @@ def whisper(connection, args):
     
     return "100 RPL_DONE"
 
-@CommandDispatcher.register_cmd
+@CommandDispatcher.register_cmd(refused=ACTIVE, min_args=1)
 def ask_whisper(connection, args):
-    abort_if(lambda: connection.status == ConnectionStatus.NOT_CONNECTED, "201 ERR_NOTCONNECTED")
-    abort_if(lambda: connection.status == ConnectionStatus.AWAY, "202 ERR_BADSTATUS")
-    abort_if(lambda: len(args) < 1, "203 ERR_NOTENOUGHARGS")
-    
     dest = args[0]
     
     try:
@@ -161,12 +231,8 @@ def ask_whisper(connection, args):
     
     return "100 RPL_DONE"
 
-@CommandDispatcher.register_cmd
+@CommandDispatcher.register_cmd(refused=ACTIVE, min_args=2)
 def reply_whisper(connection, args):
-    abort_if(lambda: connection.status == ConnectionStatus.NOT_CONNECTED, "201 ERR_NOTCONNECTED")
-    abort_if(lambda: connection.status == ConnectionStatus.AWAY, "202 ERR_BADSTATUS")
-    abort_if(lambda: len(args) < 2, "203 ERR_NOTENOUGHARGS")
-    
     dest = args[0]
     answer = str(args[1]).strip()
     
@@ -182,12 +248,8 @@ def reply_whisper(connection, args):
     
     return "100 RPL_DONE"
 
-@CommandDispatcher.register_cmd
+@CommandDispatcher.register_cmd(refused=ACTIVE, min_args=1)
 def stop_whisper(connection, args):
-    abort_if(lambda: connection.status == ConnectionStatus.NOT_CONNECTED, "201 ERR_NOTCONNECTED")
-    abort_if(lambda: connection.status == ConnectionStatus.AWAY, "202 ERR_BADSTATUS")
-    abort_if(lambda: len(args) < 1, "203 ERR_NOTENOUGHARGS")
-    
     dest = args[0]
     
     try:
@@ -202,33 +264,48 @@ def stop_whisper(connection, args):
     
     return "100 RPL_DONE"
 
-@CommandDispatcher.register_cmd
+@CommandDispatcher.register_cmd(min_args=3)
 def ask_file(connection, args):
-    abort_if(lambda: connection.status == ConnectionStatus.NOT_CONNECTED, "201 ERR_NOTCONNECTED")
-    abort_if(lambda: len(args) < 3, "203 ERR_NOTENOUGHARGS")
-    
     dest, size, file = args[0], args[1], args[2]
-    file_id = connection._protocol.generate_file_id(file)
+    protocol = connection._protocol
+    requests = protocol.file_requests
+    
+    if requests.is_full(connection):
+        return "210 ERR_SERVERBUSY"
     
     try:
-        connection.write_to(dest, f":{connection.client.pseudo} ASK_FILE {file_id} {size} {file}")
+        recipient = protocol[dest].connection
     except KeyError:
         return "204 ERR_NICKNAMENOTEXIST"
     
-    connection._protocol.sender_per_file_request[file_id] = connection
+    file_id = protocol.generate_file_id(file)
+    recipient.write(f":{connection.client.pseudo} ASK_FILE {file_id} {size} {file}")
+    
+    # the request is forgotten if the recipient does not answer in time
+    timer = connection.call_later(requests.ttl, lambda: expire_file_request(protocol, file_id))
+    requests.add(file_id, FileRequest(connection, recipient, size, timer))
     
     return f"102 RPL_FILE {file_id}"
 
-@CommandDispatcher.register_cmd
-def reply_file(connection, args):
-    abort_if(lambda: connection.status == ConnectionStatus.NOT_CONNECTED, "201 ERR_NOTCONNECTED")
-    abort_if(lambda: len(args) < 2, "203 ERR_NOTENOUGHARGS")
+def expire_file_request(protocol, file_id):
+    """
+    Removes the file request `file_id`, then lets its sender know that it has expired.
+    """
+    request = protocol.file_requests.pop(file_id)
     
+    if request is not None:
+        request.sender.write(f":@server FILE_EXPIRED {file_id}")
+
+@CommandDispatcher.register_cmd(min_args=2)
+def reply_file(connection, args):
     file_id, answer = args[0], args[1].lower()
+    requests = connection._protocol.file_requests
     
-    abort_if(lambda: file_id not in connection._protocol.sender_per_file_request, "209 ERR_FILEIDNOTEXIST")
+    # only the recipient of a request can answer it
+    if file_id not in requests or requests[file_id].recipient is not connection:
+        return "209 ERR_FILEIDNOTEXIST"
     
-    file_sender = connection._protocol.sender_per_file_request[file_id]
+    request = requests[file_id]
     
     if answer != "no" and answer != "yes":
         return "208 ERR_BADARGUMENT"
@@ -236,49 +313,93 @@ def reply_file(connection, args):
     if answer == "no":
         response = f":{connection.client.pseudo} REPLY_FILE {file_id} NO"
     else:
-        abort_if(lambda: len(args) < 3, "203 ERR_NOTENOUGHARGS")
+        if len(args) < 3:
+            return "203 ERR_NOTENOUGHARGS"
+        
+        if args[2].upper() == "RELAY":
+            return relay_file(connection, file_id, request)
         
+        # the sender connects to the recipient
         port = args[2]
-        ip = file_sender.ip()
+        ip = connection.ip()
         response = f":{connection.client.pseudo} REPLY_FILE {file_id} {answer} {port} {ip}"
         
     try:
-        file_sender.write(response)
+        request.sender.write(response)
     except OSError:
         return "204 ERR_NICKNAMENOTEXIST"
     finally:
-        del connection._protocol.sender_per_file_request[file_id]
+        requests.pop(file_id)
             
     return "100 RPL_DONE"
 
+def relay_file(connection, file_id, request):
+    """
+    Opens a transfer of the file `file_id` through the relay of the server,
+    on which both the sender and the recipient connect.
+    """
+    protocol = connection._protocol
+    relay = protocol.relay
+    
+    if not request.size.isdigit():
+        protocol.file_requests.pop(file_id)
+        return "208 ERR_BADARGUMENT"
+    
+    if relay is None:
+        return "211 ERR_RELAYNOTAVAILABLE"
+    
+    try:
+        token = relay.open(int(request.size))
+    except OSError:
+        return "211 ERR_RELAYNOTAVAILABLE"
+    
+    try:
+        request.sender.write(f":{connection.client.pseudo} REPLY_FILE {file_id} YES RELAY {relay.port} {token}")
+    except OSError:
+        return "204 ERR_NICKNAMENOTEXIST"
+    finally:
+        protocol.file_requests.pop(file_id)
+    
+    return f"104 RPL_RELAY {relay.port} {token}"
+
 @CommandDispatcher.register_cmd
 def names(connection, args):
-    abort_if(lambda: connection.status == ConnectionStatus.NOT_CONNECTED, "201 ERR_NOTCONNECTED")
+    clients = connection._protocol.clients
+    
+    if not args:
+        return clients.names_reply
     
-    return "101 RPL_NAMES " + " ".join(client for client in connection._protocol.clients)
+    if args[0].upper() != "SINCE":
+        return "208 ERR_BADARGUMENT"
+    if len(args) < 2:
+        return "203 ERR_NOTENOUGHARGS"
+    
+    try:
+        changes = clients.changes_since(int(args[1]))
+    except ValueError:
+        return "208 ERR_BADARGUMENT"
+    
+    if changes is None:
+        return f"103 RPL_NAMESDELTA {clients.version} * {clients.roster}"
+    return f"103 RPL_NAMESDELTA {clients.version} {' '.join(changes)}"
 
 @CommandDispatcher.register_cmd
 def away(connection, args):
-    abort_if(lambda: connection.status == ConnectionStatus.NOT_CONNECTED, "201 ERR_NOTCONNECTED")
-    
     connection.status = ConnectionStatus.AWAY
     return "100 RPL_DONE"
 
 @CommandDispatcher.register_cmd
 def re(connection, args):
-    abort_if(lambda: connection.status == ConnectionStatus.NOT_CONNECTED, "201 ERR_NOTCONNECTED")
-    
     connection.status = ConnectionStatus.CONNECTED
     return "100 RPL_DONE"
 
-@CommandDispatcher.register_cmd
+@CommandDispatcher.register_cmd(min_args=1)
 def nick(connection, args):
-    abort_if(lambda: connection.status == ConnectionStatus.NOT_CONNECTED, "201 ERR_NOTCONNECTED")
-    abort_if(lambda: len(args) < 1, "203 ERR_NOTENOUGHARGS")
-    abort_if(lambda: args[0] in connection._protocol.clients, "205 ERR_NICKNAMEINUSE")
-    
     new_nick = args[0]
     
+    if new_nick in connection._protocol.clients:
+        return "205 ERR_NICKNAMEINUSE"
+    
     if len(new_nick) > 10 or new_nick.startswith('@') or ',' in new_nick:
         return "206 ERR_INVALIDNICKNAME"
     
@@ -1,4 +1,6 @@
 # System import
+import collections
+import itertools
 from threading import Lock
 
 # Local imports
@@ -18,11 +20,15 @@ class Client():
     -----------
         pseudo (str): the pseudo used by the client
         connection (Connection): the connection that links the server and the client 
+        address (tuple): the address of the client, or `None` if it has no connection
     """
+    
+    __slots__ = ('pseudo', 'connection', 'address')
 
-    def __init__(self, pseudo, connection):
+    def __init__(self, pseudo, connection=None):
         self.pseudo = pseudo
         self.connection = connection
+        self.address = connection.address() if connection is not None else None
       
     def __eq__(self, rhs):
         if not isinstance(rhs, Client):
@@ -35,28 +41,90 @@ class Client():
 class Clients:
     """
     Represents a list of chat's clients.
+    
+    Clients are indexed by pseudo, by address and by connection, so that
+    looking a client up costs the same whatever the number of clients.
+    Keys are told apart by their type: a `str` is a pseudo, a `tuple` an
+    address, and anything else a connection.
+    
+    The list of pseudos is versioned: each join or part increments `version`,
+    and the last `history_size` changes are kept so that the changes since
+    a recent version can be retrieved.
+    
+    Args:
+    -----
+        history_size (int): the number of changes kept
     """
 
-    def __init__(self):
+    def __init__(self, history_size=1024):
         self.__clients = {}
+        self.__per_address = {}
+        self.__per_connection = {}
+        self.__changes = collections.deque(maxlen=history_size)
+        self.__names_reply = None
+        self.version = 0
       
     @property
     def all(self):
         return self.__clients
+    
+    @property
+    def roster(self):
+        """
+        The pseudos of the clients, separated by a space.
+        """
+        return " ".join(self.__clients)
+    
+    @property
+    def names_reply(self):
+        """
+        The reply to NAMES, "101 RPL_NAMES" followed by the roster, encoded and
+        ended by a line feed.
+        
+        The reply is only built again once the clients have changed, and the same
+        bytes are written to every client that asks for them.
+        """
+        if self.__names_reply is None:
+            self.__names_reply = f"101 RPL_NAMES {self.roster}\n".encode()
+        return self.__names_reply
+    
+    def changes_since(self, version):
+        """
+        Returns the changes that occurred since `version`, as a list of pseudos
+        prefixed with '+' when they joined and with '-' when they parted.
+        
+        Returns `None` if the changes are too old to be known.
+        """
+        missed = self.version - version
+        
+        if missed < 0 or missed > len(self.__changes):
+            return None
+        
+        return list(itertools.islice(self.__changes, len(self.__changes) - missed, None))
+    
+    def __changed(self, *changes):
+        self.__changes.extend(changes)
+        self.version += len(changes)
+        self.__names_reply = None
         
     def from_pseudo(self, pseudo):
         return self.__clients[pseudo]
       
     def from_address(self, address):
-        return next((client for client in self.all.values() if client.address == address), None)
+        return self.__per_address.get(address)
+    
+    def from_connection(self, connection):
+        return self.__per_connection.get(connection)
     
     def rename(self, client, new_pseudo):
         if isinstance(client, str):
             client = self[client]
             
-        self -= client
+        del self.__clients[client.pseudo]
+        self.__changed("-" + client.pseudo, "+" + new_pseudo)
+        
         client.pseudo = new_pseudo
-        self += client
+        self.__clients[new_pseudo] = client
         
     def __contains__(self, client):
         if isinstance(client, Client):
@@ -64,23 +132,34 @@ class Clients:
         if isinstance(client, str):
             return client in self.__clients
         if isinstance(client, tuple):
-            return self.from_address(client) != None
-        return False
+            return client in self.__per_address
+        return client in self.__per_connection
         
     def __iter__(self):
-        # yield from self.all
-        for client in self.all:
-            yield client
+        return iter(self.__clients)
+    
+    def __len__(self):
+        return len(self.__clients)
             
     def __getitem__(self, key):
         if isinstance(key, str):
             return self.from_pseudo(key)
         if isinstance(key, tuple):
-            return self.from_address(key)
-        raise KeyError
+            return self.__per_address[key]
+        return self.__per_connection[key]
             
     def __setitem__(self, pseudo, client):
+        if pseudo in self.__clients:
+            self -= pseudo
+            
+        client.pseudo = pseudo
         self.__clients[pseudo] = client
+        self.__changed("+" + pseudo)
+        
+        if client.address is not None:
+            self.__per_address[client.address] = client
+        if client.connection is not None:
+            self.__per_connection[client.connection] = client
       
     def __iadd__(self, client):
         abort_if(lambda: not isinstance(client,Client), "cannot add a non Client instance")
@@ -89,10 +168,109 @@ class Clients:
         return self
         
     def __isub__(self, client):
-        if isinstance(client, Client):
-            del self.all[client.pseudo]
-        elif isinstance(client, tuple):
-            del self.all[ self[client].pseudo ]
-        elif isinstance(client, str):
-            del self.all[client]
-        return self
\ No newline at end of file
+        if not isinstance(client, Client):
+            client = self[client]
+            
+        del self.__clients[client.pseudo]
+        self.__changed("-" + client.pseudo)
+        
+        if self.__per_address.get(client.address) is client:
+            del self.__per_address[client.address]
+        if self.__per_connection.get(client.connection) is client:
+            del self.__per_connection[client.connection]
+            
+        return self
+
+class FileRequest:
+    """
+    A file that a client wants to send, and that waits for the answer of its recipient.
+    
+    Attributes:
+    -----------
+        sender (Connection): the connection of the client that sends the file
+        recipient (Connection): the connection of the client that receives the file
+        size (str): the size of the file, as given by the sender
+        timer: the handle of the expiry of the request, whose `cancel()` method stops it
+    """
+    
+    __slots__ = ('sender', 'recipient', 'size', 'timer')
+    
+    def __init__(self, sender, recipient, size, timer=None):
+        self.sender = sender
+        self.recipient = recipient
+        self.size = size
+        self.timer = timer
+        
+class FileRequests:
+    """
+    The file requests waiting for an answer, indexed by id.
+    
+    Requests are also indexed by sender, so that the number of pending requests
+    of a client is bounded, and by recipient, so that the requests of a client
+    that leaves are found without looking at the others. A request that is removed from the
+    table has its expiry cancelled.
+    
+    Args:
+    -----
+        ttl (float): the number of seconds a request waits for an answer
+        max_per_sender (int): the maximum number of pending requests of a client
+    """
+    
+    def __init__(self, ttl=300, max_per_sender=8):
+        self.ttl = ttl
+        self.max_per_sender = max_per_sender
+        self.__requests = {}
+        self.__ids_per_sender = collections.defaultdict(set)
+        self.__ids_per_recipient = collections.defaultdict(set)
+        
+    def __contains__(self, file_id):
+        return file_id in self.__requests
+    
+    def __len__(self):
+        return len(self.__requests)
+    
+    def __getitem__(self, file_id):
+        return self.__requests[file_id]
+    
+    def is_full(self, sender):
+        """
+        Returns whether `sender` cannot make any other request.
+        """
+        ids = self.__ids_per_sender.get(sender)
+        return ids is not None and len(ids) >= self.max_per_sender
+    
+    def add(self, file_id, request):
+        self.__requests[file_id] = request
+        self.__ids_per_sender[request.sender].add(file_id)
+        self.__ids_per_recipient[request.recipient].add(file_id)
+        
+    def pop(self, file_id):
+        """
+        Removes the request `file_id` and returns it, or returns `None` if it does not exist.
+        """
+        request = self.__requests.pop(file_id, None)
+        
+        if request is None:
+            return None
+        
+        for ids_per_client, client in ((self.__ids_per_sender, request.sender),
+                                       (self.__ids_per_recipient, request.recipient)):
+            ids = ids_per_client[client]
+            ids.discard(file_id)
+            if not ids:
+                del ids_per_client[client]
+            
+        if request.timer is not None:
+            request.timer.cancel()
+            
+        return request
+    
+    def discard(self, connection):
+        """
+        Removes the requests sent by `connection`, and those sent to it.
+        """
+        for file_id in list(self.__ids_per_sender.get(connection, ())):
+            self.pop(file_id)
+            
+        for file_id in list(self.__ids_per_recipient.get(connection, ())):
+            self.pop(file_id)
@@ -1,10 +1,13 @@
 # Standard imports
+import collections
+import itertools
 import logging
-from threading import Lock
+import random
+from concurrent.futures import ThreadPoolExecutor
 
 # Local imports
 from server.dnc._commands import CommandDispatcher
-from server.dnc._data import ConnectionStatus, Clients, Client
+from server.dnc._data import ConnectionStatus, Clients, Client, FileRequests
 from server.tcp import Connection, Protocol
 
 class _DncConnection(Connection):
@@ -17,6 +20,11 @@ class _DncConnection(Connection):
         status (ConnectionStatus): the status of the client
         client (User): store data about the client
         private (set[Connection]): the connection with which a private conversation has been started
+        ignored (set[Connection]): the connections muted by the client
+        ignored_by (set[Connection]): the connections that muted the client
+        waiting (deque[str]): the requests received while an offloaded request is running
+        busy (bool): whether an offloaded request of the client is running
+        closed (bool): whether the connection is over
     """
 
     def __init__(self, protocol):
@@ -25,21 +33,40 @@ class _DncConnection(Connection):
         self.client = None
         self.private = set()
         self.ignored = set()
-        
-    def __eq__(self, rhs):
-        return self.client == rhs.client
-    
-    def __hash__(self):
-        return hash(self.client.pseudo) if self.client else "None" 
+        self.ignored_by = set()
+        self._waiting = collections.deque()
+        self._busy = False
+        self._closed = False
         
     def on_data_received(self, data):
-        if self.client:
-            logging.info(f"FROM {self.ip()} - {self.client.pseudo}: {data}")
-        else:
-            logging.info(f"FROM {self.ip()}: {data}")
+        # replies must be sent in the order of the requests
+        if self._busy:
+            self._waiting.append(data)
+            return
+        
+        self._handle_request(data)
+        
+    def _handle_request(self, data):
+        # logging every request is costly, hence it can be disabled or sampled
+        if logging.root.isEnabledFor(logging.INFO) and random.random() < self._protocol.log_sample_rate:
+            if self.client:
+                logging.info("FROM %s - %s: %s", self.ip(), self.client.pseudo, data)
+            else:
+                logging.info("FROM %s: %s", self.ip(), data)
+        
+        command, args = self._protocol.commands.parse(data)
+        error = command.check(self, args)
+        
+        if error is not None:
+            self.write(error)
+            return
+        
+        if command.offload is not None and command.offload(self, args):
+            self._offload(command.handler, args)
+            return
         
         try:
-            response = self._protocol.commands.react(data, self)
+            response = command.handler(self, args)
         except ValueError as e:
             response = str(e)
         except:
@@ -48,49 +75,161 @@ class _DncConnection(Connection):
             raise
             
         if response:
+            self._reply(response)
+            
+    def _reply(self, response):
+        """
+        Writes `response`, which is already encoded if it is `bytes`.
+        """
+        if isinstance(response, bytes):
+            self.write_bytes(response)
+        else:
+            self.write(response)
+            
+    def _offload(self, handler, args):
+        """
+        Runs `handler` within the pool of threads of the protocol, then writes
+        its reply from the server's loop.
+        """
+        protocol = self._protocol
+        
+        if protocol.offloaded >= protocol.queue_depth:
+            self.write("210 ERR_SERVERBUSY")
+            return
+        
+        protocol.offloaded += 1
+        self._busy = True
+        
+        future = protocol.executor.submit(handler, self, args)
+        future.add_done_callback(lambda future: self.call_soon_threadsafe(lambda: self._on_offloaded(future)))
+        
+    def _on_offloaded(self, future):
+        """
+        Called within the server's loop when an offloaded request is over.
+        """
+        self._protocol.offloaded -= 1
+        self._busy = False
+        
+        # the client may have left while its request was running
+        if self._closed:
+            return
+        
+        try:
+            response = future.result()
+        except ValueError as e:
+            response = str(e)
+        except:
+            response = "299 ERR_INTERNALERROR"
             self.write(response)
+            raise
+        
+        if response:
+            self._reply(response)
+        
+        while self._waiting and not self._busy:
+            self._handle_request(self._waiting.popleft())
         
     def on_connection_closed(self):
+        # the requests waiting behind an offloaded one are given up along with the client
+        self._closed = True
+        self._waiting.clear()
+        self._protocol.file_requests.discard(self)
+        
         if self.client is None:
             return
             
         self._protocol.clients -= self.client
+        self._protocol.connected.discard(self)
         
         for friend in self.private:
             friend.private.remove(self)
             
+        for muted in self.ignored:
+            muted.ignored_by.discard(self)
+            
+        for muter in self.ignored_by:
+            muter.ignored.discard(self)
+            
     def on_connection_lost(self):
-        self.write_all(f":{self.client.pseudo} QUIT")
+        if self.client is not None:
+            self.write_all(f":{self.client.pseudo} QUIT")
         self.on_connection_closed()
         
+    def mute(self, connection):
+        """
+        Stops sending the broadcast messages of `connection` to this client.
+        """
+        self.ignored.add(connection)
+        connection.ignored_by.add(self)
+        
+    def listen(self, connection):
+        """
+        Sends the broadcast messages of `connection` to this client again.
+        """
+        self.ignored.discard(connection)
+        connection.ignored_by.discard(self)
+        
 class DncProtocol(Protocol):
     """
     Represents the global DNC protocol, and is hence responsible of creating
     new `DncConnection` for accepted sockets.
+    
+    Args:
+    -----
+        pool_size (int): the number of threads running the offloaded commands
+        queue_depth (int): the maximum number of offloaded requests waiting for a reply
+        log_sample_rate (float): the ratio of requests that are logged, between 0 and 1
+        file_request_ttl (float): the number of seconds a file request waits for an answer
+        max_file_requests (int): the maximum number of pending file requests of a client
+    
+    Attributes:
+    -----------
+        clients (Clients): the connected clients
+        connected (set[Connection]): the connections of the connected clients
+        chat_bot: an object whose `react(*args)` method replies to the messages
+                  starting with '!', or `None` if there is no chat bot
+        executor (ThreadPoolExecutor): runs the offloaded commands
+        offloaded (int): the number of offloaded requests waiting for a reply
+        file_requests (FileRequests): the file requests waiting for an answer
+        relay (FileRelay): forwards the files between clients that cannot reach
+                           each other, or `None` if files cannot be relayed
     """
     
-    def __init__(self):
+    def __init__(self, pool_size=4, queue_depth=64, log_sample_rate=1.0, file_request_ttl=300, max_file_requests=8):
         self.clients = Clients()
+        self.connected = set()
         self.commands = CommandDispatcher()
+        self.chat_bot = None
         
-        self.lock = Lock()
-        self.file_id = 0
-        self.sender_per_file_request = {}
+        self.executor = ThreadPoolExecutor(pool_size, thread_name_prefix="dnc-command")
+        self.queue_depth = queue_depth
+        self.offloaded = 0
+        self.relay = None
+        
+        self.log_sample_rate = log_sample_rate
+        
+        self._file_ids = itertools.count(1)
+        self.file_requests = FileRequests(file_request_ttl, max_file_requests)
         
     def generate_file_id(self, file_name):
         """
         Generates a unique id for `file_name`. 
         
         Used by `ASK_FILE` command in order to identify different requests.
+        Ids are never reused, and drawing one is atomic, so that no lock is
+        needed even from the threads of the executor.
         """
-        with self.lock:
-            self.file_id += 1
-            
-        return str(self.file_id)
+        return str(next(self._file_ids))
     
     def create_new_connection(self):
         return _DncConnection(self)
     
+    def is_authenticated(self, connection):
+        return connection.status is not ConnectionStatus.NOT_CONNECTED
+    
+    def ping(self, connection):
+        connection.write(":@server PING")
+    
     def get_connection(self, key):
         #return self.clients.all.get(key)
         return self.clients[key]
@@ -100,5 +239,13 @@ class DncProtocol(Protocol):
            and sender not in receiver.ignored \
            and sender.status is not ConnectionStatus.NOT_CONNECTED 
     
+    def receivers(self, sender, connections, message):
+        if sender.status is ConnectionStatus.NOT_CONNECTED:
+            return []
+        
+        receivers = self.connected - sender.ignored_by
+        receivers.discard(sender)
+        return receivers
+    
     def add_client(self, login):
         self.clients[login] = Client(login)
\ No newline at end of file
@@ -1,7 +1,11 @@
 # System imports
 import argparse
+import atexit
 import configparser
 import logging
+import logging.handlers
+import multiprocessing.util
+import queue
 import sys
 import os
 from typing import Dict
@@ -12,14 +16,84 @@ sys.path.append(os.path.dirname(__file__))
 
 # Local imports
 from server.dnc.protocol import DncProtocol
-from server.tcp import TcpServer
+from server.relay import FileRelay
+from server.tcp import TcpServer, AsyncTcpServer
+from server.cluster import run_cluster
 from server.utils.errors import print_err
 
+# The servers that can be selected with the --engine option
+ENGINES = {
+    'selectors': TcpServer,
+    'asyncio': AsyncTcpServer
+}
+
+class _BatchFileHandler(logging.FileHandler):
+    """
+    A file handler that does not flush its stream after each record,
+    so that records are written to the file by batches.
+    
+    Attributes:
+    -----------
+        batched (bool): whether records are written by batches, or one by one
+                        when several processes share the file
+    """
+    
+    batched = True
+    
+    def emit(self, record):
+        try:
+            self.stream.write(self.format(record) + self.terminator)
+            
+            # a record written at once cannot be torn by the records of other processes
+            if not self.batched:
+                self.stream.flush()
+        except Exception:
+            self.handleError(record)
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    A queue handler that puts records in the queue as they are, so that their
+    message is only formatted by the thread of the listener.
+    
+    The queue must not leave the process, and the arguments of a record must
+    not be modified once logged.
+    """
+    
+    def prepare(self, record):
+        return record
+
+class _BatchQueueListener(logging.handlers.QueueListener):
+    """
+    A queue listener that flushes its handlers only once the queue is empty,
+    and when it is stopped.
+    """
+    
+    def dequeue(self, block):
+        try:
+            return self.queue.get_nowait()
+        except queue.Empty:
+            self.flush()
+            return self.queue.get(block)
+    
+    def flush(self):
+        for handler in self.handlers:
+            handler.flush()
+    
+    def stop(self):
+        # the last records are written after the sentinel, which ends the thread without flushing
+        super().stop()
+        self.flush()
+
 def setup_logger(set_verbose, log_file):
     """
     Setups the logger so that it logs everything within a log file,
     and eventually prints messages to the console.
     
+    Records are only queued by the thread that logs them: they are formatted
+    and written by a background thread, which writes them by batches. Forked
+    processes, such as the workers of a cluster, share the log file, hence
+    they write their records one by one.
+    
     Args:
     -----
         set_verbose (bool): `True` if logs should be printed in the console
@@ -35,6 +109,7 @@ def setup_logger(set_verbose, log_file):
         
     logger = logging.getLogger()
     logger.setLevel(logging.DEBUG)
+    handlers = []
     
     file_formatter = logging.Formatter('[%(asctime)s] - %(levelname)s : %(message)s')
     stream_formatter = logging.Formatter('[%(asctime)s] %(message)s')
@@ -45,19 +120,42 @@ def setup_logger(set_verbose, log_file):
         stdout_handler.setLevel(logging.DEBUG)
         stdout_handler.addFilter(OneOf(logging.INFO))
         stdout_handler.setFormatter(stream_formatter)
-        logger.addHandler(stdout_handler)
+        handlers.append(stdout_handler)
         
         # Prints WARNING & ERROR & CRITICAL to stderr
         stderr_handler = logging.StreamHandler()
         stderr_handler.setLevel(logging.WARNING)
         stderr_handler.setFormatter(stream_formatter)
-        logger.addHandler(stderr_handler)
+        handlers.append(stderr_handler)
     
     # Prints everything into log file
-    file_handler = logging.FileHandler(log_file, encoding='utf-8')
+    file_handler = _BatchFileHandler(log_file, encoding='utf-8')
     file_handler.setLevel(logging.DEBUG)
     file_handler.setFormatter(file_formatter)
-    logger.addHandler(file_handler)
+    handlers.append(file_handler)
+    
+    queue_handler = _DeferredQueueHandler(queue.Queue())
+    logger.addHandler(queue_handler)
+    
+    listener = _BatchQueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    
+    def restart_listener():
+        # the thread of the listener does not survive a fork
+        queue_handler.queue = listener.queue = queue.Queue()
+        file_handler.batched = False
+        listener.start()
+    
+    def stop_listener_at_exit(listener):
+        # children of multiprocessing do not run atexit's functions, and forget
+        # the finalizers registered before they are bootstrapped
+        multiprocessing.util.Finalize(None, listener.stop, exitpriority=0)
+    
+    if hasattr(os, 'register_at_fork'):
+        # a child would write the records buffered by its parent once more
+        os.register_at_fork(before=listener.flush, after_in_child=restart_listener)
+        multiprocessing.util.register_after_fork(listener, stop_listener_at_exit)
     
 def parse_arguments() -> Dict[str,object]:
     """
@@ -84,6 +182,17 @@ def parse_arguments() -> Dict[str,object]:
                         help="The number of the port to be used by the server.")
     parser.add_argument('log_file', default='dnc_server.log', nargs='?',
                         help="The name of the file in which logs the requests.")
+    parser.add_argument('-e', '--engine', default='selectors', choices=ENGINES.keys(),
+                        help="The event loop used to serve clients (default: selectors).")
+    parser.add_argument('--max-write-buffer', default=1 << 20, type=int,
+                        help="The maximum number of bytes waiting to be sent to a client.\n"
+                             "Slower clients are disconnected (default: 1 MiB).")
+    parser.add_argument('-w', '--workers', default=1, type=int,
+                        help="The number of processes serving clients (default: 1).\n"
+                             "Several workers require the selectors engine and SO_REUSEPORT.")
+    parser.add_argument('--relay-port', type=int,
+                        help="The port on which clients that cannot reach each other send files\n"
+                             "through the server (default: files are not relayed).")
     parser.add_argument('-v', '--verbose', action='store_true',
                         help="Adding this argument will let the server prints its log on the screen.")
     parser.add_argument('--rfc', action='store_true',
@@ -92,15 +201,52 @@ def parse_arguments() -> Dict[str,object]:
                         help="Specify a .ini file that contains server's configuration.\n"
                              "See below for accepted sections and variables (replace <..> by real values):\n"
                              "[network]\n"
-                             "port = <port_number>\n\n"
+                             "port = <port_number>\n"
+                             "engine = <selectors/asyncio>\n"
+                             "max_write_buffer = <bytes>\n"
+                             "workers = <number_of_processes>\n"
+                             "login_timeout = <seconds a client may stay silent before logging in, 120 by default, 0 to disable>\n"
+                             "idle_timeout = <seconds a logged in client may stay silent before being pinged, 0 (disabled) by default>\n"
+                             "ping_timeout = <seconds a pinged client has to answer, 30 by default>\n"
+                             "backlog = <connections waiting to be accepted, 1024 by default>\n"
+                             "accept_rate = <clients accepted per second, 0 (unlimited) by default>\n"
+                             "accept_rate_per_ip = <clients accepted per second from an ip, 0 (unlimited) by default>\n\n"
+                             "[commands]\n"
+                             "pool_size = <threads running the slow commands, 4 by default>\n"
+                             "queue_depth = <slow commands waiting for a thread, 64 by default>\n\n"
+                             "[files]\n"
+                             "relay_port = <port_number>\n"
+                             "relay_rate = <maximum bytes per second of a relayed file, 0 for unlimited>\n"
+                             "request_ttl = <seconds a file request waits for an answer, 300 by default>\n"
+                             "max_requests = <pending file requests per client, 8 by default>\n\n"
                              "[log]\n"
                              "verbose = <True/False>\n"
-                             "log_file = <file_name>")
+                             "log_file = <file_name>\n"
+                             "sample_rate = <ratio of requests logged, 1.0 by default>\n"
+                             "stats_interval = <seconds between two logs of the state of the server, 60 by default, 0 to disable>\n\n"
+                             "See server.config for an example.")
 
     args = vars(parser.parse_args())    
+    args['pool_size'] = 4
+    args['queue_depth'] = 64
+    args['sample_rate'] = 1.0
+    args['stats_interval'] = 60
+    args['login_timeout'] = 120
+    # the clients written before PONG do not answer a PING
+    args['idle_timeout'] = None
+    args['ping_timeout'] = 30
+    args['backlog'] = 1024
+    args['accept_rate'] = None
+    args['accept_rate_per_ip'] = None
+    args['relay_rate'] = None
+    args['request_ttl'] = 300
+    args['max_requests'] = 8
     
     if args['conf']:
         tailor_args_to_config_file(args['conf'], args)
+        
+    if args['workers'] > 1 and args['engine'] != 'selectors':
+        raise ValueError(" Several workers can only be run with the selectors engine")
 
     setup_logger(args['verbose'], args['log_file'])
     
@@ -116,12 +262,50 @@ def tailor_args_to_config_file(config_file, args):
     if "network" in parser.sections():
         if "port" in parser["network"]:
             args["port"] = int(parser["network"]["port"])
+        if "engine" in parser["network"]:
+            if parser["network"]["engine"] not in ENGINES:
+                raise ValueError(f" Unknown engine: {parser['network']['engine']}")
+            args["engine"] = parser["network"]["engine"]
+        if "max_write_buffer" in parser["network"]:
+            args["max_write_buffer"] = int(parser["network"]["max_write_buffer"])
+        if "workers" in parser["network"]:
+            args["workers"] = int(parser["network"]["workers"])
+        for timeout in ("login_timeout", "idle_timeout"):
+            if timeout in parser["network"]:
+                args[timeout] = float(parser["network"][timeout]) or None
+        if "ping_timeout" in parser["network"]:
+            args["ping_timeout"] = float(parser["network"]["ping_timeout"])
+        if "backlog" in parser["network"]:
+            args["backlog"] = int(parser["network"]["backlog"])
+        for rate in ("accept_rate", "accept_rate_per_ip"):
+            if rate in parser["network"]:
+                args[rate] = float(parser["network"][rate])
+            
+    if "commands" in parser.sections():
+        if "pool_size" in parser["commands"]:
+            args["pool_size"] = int(parser["commands"]["pool_size"])
+        if "queue_depth" in parser["commands"]:
+            args["queue_depth"] = int(parser["commands"]["queue_depth"])
+            
+    if "files" in parser.sections():
+        if "relay_port" in parser["files"]:
+            args["relay_port"] = int(parser["files"]["relay_port"])
+        if "relay_rate" in parser["files"]:
+            args["relay_rate"] = int(parser["files"]["relay_rate"]) or None
+        if "request_ttl" in parser["files"]:
+            args["request_ttl"] = float(parser["files"]["request_ttl"])
+        if "max_requests" in parser["files"]:
+            args["max_requests"] = int(parser["files"]["max_requests"])
             
     if "log" in parser.sections():
         if "verbose" in parser["log"]:
             args["verbose"] = True if parser["log"]["verbose"].lower() in ['yes', 'true'] else False
         if "log_file" in parser["log"]:
             args["log_file"] = parser["log"]["log_file"]
+        if "sample_rate" in parser["log"]:
+            args["sample_rate"] = float(parser["log"]["sample_rate"])
+        if "stats_interval" in parser["log"]:
+            args["stats_interval"] = float(parser["log"]["stats_interval"])
         
 def print_rfc_content():
     try:
@@ -146,9 +330,23 @@ if __name__ == '__main__':
         
     else:
         port = args['port']
+        server_class = ENGINES[args['engine']]
         
-        logging.info("Starting server")
+        logging.info(f"Starting server (ENGINE={args['engine']}, WORKERS={args['workers']})")
+
+        protocol = DncProtocol(args['pool_size'], args['queue_depth'], args['sample_rate'],
+                               args['request_ttl'], args['max_requests'])
+        
+        if args['relay_port'] is not None:
+            protocol.relay = FileRelay(args['relay_port'], args['relay_rate'])
+
+        options = {key: args[key] for key in ('max_write_buffer', 'stats_interval', 'login_timeout',
+                                              'idle_timeout', 'ping_timeout', 'backlog',
+                                              'accept_rate', 'accept_rate_per_ip')}
 
-        TcpServer(DncProtocol(), port).run_forever()
+        if args['workers'] > 1:
+            run_cluster(protocol, port, args['workers'], **options)
+        else:
+            server_class(protocol, port, **options).run_forever()
     
         logging.info("Server is closed")
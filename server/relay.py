@@ -0,0 +1,371 @@
+# Standard libraries
+import functools
+import logging
+import os
+import secrets
+import selectors
+import socket
+import threading
+import time
+
+# The maximum number of bytes read at once, which also bounds the data waiting
+# for the receiver of each transfer
+CHUNK_SIZE = 1 << 16
+
+# The maximum length of the line sent by a client to join a transfer
+MAX_HANDSHAKE = 64
+
+class _Transfer:
+    """
+    A file transfer between two clients.
+
+    Attributes:
+    -----------
+        token (str): identifies the transfer
+        size (int): the number of bytes to forward
+        deadline (float): the time after which the transfer is given up if nothing happens
+        sender (socket): the connection with the sender, or `None` until it joins
+        receiver (socket): the connection with the receiver, or `None` until it joins
+        read (int): the number of bytes received from the sender
+        pending (int): the number of bytes received but not sent to the receiver yet
+        head (memoryview): bytes of the sender received along with its handshake
+        buffer (memoryview): holds the pending bytes when there is no pipe
+        offset (int): the position of the pending bytes within `buffer`
+        pipe (Tuple[int,int]): holds the pending bytes when splice is available
+        allowance (float): the number of bytes that can be read before exceeding the rate limit
+        refilled_at (float): the last time `allowance` has been refilled
+        resume_at (float): when a throttled transfer can read again, or `None`
+    """
+
+    __slots__ = ('token', 'size', 'deadline', 'sender', 'receiver', 'read', 'pending', 'head',
+                 'buffer', 'offset', 'pipe', 'allowance', 'refilled_at', 'resume_at')
+
+    def __init__(self, token, size, deadline):
+        self.token = token
+        self.size = size
+        self.deadline = deadline
+        self.sender = None
+        self.receiver = None
+        self.read = 0
+        self.pending = 0
+        self.head = memoryview(b"")
+        self.buffer = None
+        self.offset = 0
+        self.pipe = None
+        self.allowance = CHUNK_SIZE
+        self.refilled_at = time.monotonic()
+        self.resume_at = None
+
+class FileRelay:
+    """
+    Forwards files between clients that cannot reach each other.
+
+    The relay runs its own loop in a background thread, so that file data never
+    delays the chat. Both are started by the first transfer, within the process
+    that runs the protocol.
+
+    A transfer is opened by `:func:open`, which returns a token. Both clients then
+    connect to the relay and send a line "<token> SEND" or "<token> RECV". The bytes
+    sent by the sender are forwarded to the receiver until the size of the file is
+    reached, then both connections are closed.
+
+    Bytes are moved by `os.splice` through a pipe where available, so that they
+    are not copied into the process, and through a buffer otherwise. In both cases
+    at most CHUNK_SIZE bytes per transfer wait for the receiver, hence a slow
+    receiver slows its sender down instead of filling the memory of the server.
+
+    A transfer that exceeds the rate limit waits for at most the bytes allowed in
+    one second before reading again, so that a low limit slows it down without
+    making it time out.
+
+    Args:
+    -----
+        port (int): the port on which clients connect to the relay
+        rate_limit (int): the maximum number of bytes per second of a transfer,
+                          or `None` if unlimited
+        timeout (float): the number of seconds a transfer may wait for its clients
+                         or for data before being given up
+    """
+
+    def __init__(self, port, rate_limit=None, timeout=60):
+        self.port = port
+        self.rate_limit = rate_limit
+        self.timeout = timeout
+
+        self._lock = threading.Lock()
+        self._transfers = {}
+        self._joining = {}
+        self._throttled = set()
+        self._sock = None
+        self._selector = None
+
+    def open(self, size):
+        """
+        Opens a transfer of `size` bytes, and returns its token.
+
+        Raises:
+        -------
+            OSError: the relay cannot listen on its port
+        """
+        token = secrets.token_hex(8)
+
+        with self._lock:
+            if self._sock is None:
+                self._start()
+            self._transfers[token] = _Transfer(token, size, time.monotonic() + self.timeout)
+
+        return token
+
+    def _start(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            if os.name == 'posix':
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind(('', self.port))
+            sock.listen(16)
+            sock.setblocking(False)
+        except OSError:
+            # the next transfer tries to listen again, with a new socket
+            sock.close()
+            raise
+
+        self._sock = sock
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(sock, selectors.EVENT_READ, self._accept)
+
+        threading.Thread(target=self._run, name="dnc-relay", daemon=True).start()
+        logging.info(f"Relay is waiting (PORT={self.port})")
+
+    def _run(self):
+        while True:
+            now = time.monotonic()
+            wake_up = min((transfer.resume_at for transfer in self._throttled), default=now + 1)
+
+            for key, events in self._selector.select(max(0, min(wake_up - now, 1))):
+                try:
+                    key.data(events)
+                except Exception:
+                    logging.exception("")
+                    self._drop(key.fileobj)
+
+            now = time.monotonic()
+
+            for transfer in [t for t in self._throttled if t.resume_at <= now]:
+                self._throttled.discard(transfer)
+
+                try:
+                    self._update(transfer)
+                except Exception:
+                    logging.exception("")
+                    self._close(transfer, "failed")
+
+            self._expire(now)
+
+    def _drop(self, sock):
+        """
+        Gives up the transfer or the handshake of `sock` after an unexpected error,
+        so that the other transfers go on.
+        """
+        if sock is self._sock:
+            return
+
+        self._joining.pop(sock, None)
+
+        with self._lock:
+            transfer = next((t for t in self._transfers.values() if sock in (t.sender, t.receiver)), None)
+
+        if transfer is not None:
+            self._close(transfer, "failed")
+        else:
+            self._watch(sock, 0, None)
+            sock.close()
+
+    def _expire(self, now):
+        for sock in [sock for sock, (deadline, _) in self._joining.items() if deadline < now]:
+            self._selector.unregister(sock)
+            del self._joining[sock]
+            sock.close()
+
+        with self._lock:
+            expired = [transfer for transfer in self._transfers.values() if transfer.deadline < now]
+
+        for transfer in expired:
+            self._close(transfer, "timed out")
+
+    def _accept(self, events):
+        try:
+            sock, _ = self._sock.accept()
+        except OSError:
+            return
+
+        sock.setblocking(False)
+        self._joining[sock] = (time.monotonic() + self.timeout, bytearray())
+        self._selector.register(sock, selectors.EVENT_READ, functools.partial(self._join, sock))
+
+    def _join(self, sock, events):
+        _, received = self._joining[sock]
+
+        try:
+            data = sock.recv(MAX_HANDSHAKE)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""
+
+        received += data
+        end = received.find(b"\n")
+
+        if end < 0 and data and len(received) < MAX_HANDSHAKE:
+            return
+
+        self._selector.unregister(sock)
+        del self._joining[sock]
+
+        words = received[:end].decode(errors="replace").split() if end >= 0 else []
+
+        with self._lock:
+            transfer = self._transfers.get(words[0]) if len(words) == 2 else None
+
+        if transfer is None or words[1] not in ("SEND", "RECV") \
+           or (transfer.sender if words[1] == "SEND" else transfer.receiver) is not None:
+            sock.close()
+            return
+
+        if words[1] == "SEND":
+            # the sender may have sent the beginning of the file along with its handshake
+            transfer.sender = sock
+            transfer.head = memoryview(bytes(received[end + 1:end + 1 + transfer.size]))
+            transfer.read = len(transfer.head)
+        else:
+            transfer.receiver = sock
+
+        if transfer.sender is not None and transfer.receiver is not None:
+            self._begin(transfer)
+
+    def _begin(self, transfer):
+        if hasattr(os, 'splice'):
+            transfer.pipe = os.pipe()
+            for fd in transfer.pipe:
+                os.set_blocking(fd, False)
+        else:
+            transfer.buffer = memoryview(bytearray(CHUNK_SIZE))
+
+        transfer.deadline = time.monotonic() + self.timeout
+        logging.info(f"RELAY {transfer.token}: {transfer.size} bytes")
+        self._update(transfer)
+
+    def _allows_read(self, transfer, now):
+        """
+        Returns whether the rate limit lets `transfer` read its next chunk,
+        and schedules its next read otherwise.
+        """
+        if self.rate_limit is None:
+            return True
+
+        # waiting for a whole chunk would take longer than the timeout with a low limit
+        needed = min(CHUNK_SIZE, transfer.size - transfer.read, self.rate_limit)
+        transfer.allowance = min(CHUNK_SIZE, transfer.allowance + (now - transfer.refilled_at) * self.rate_limit)
+        transfer.refilled_at = now
+
+        if transfer.allowance >= needed:
+            return True
+
+        transfer.resume_at = now + (needed - transfer.allowance) / self.rate_limit
+        self._throttled.add(transfer)
+        return False
+
+    def _update(self, transfer):
+        """
+        Watches the sockets of `transfer` for the events that let it progress.
+        """
+        if transfer.read == transfer.size and not transfer.pending and not transfer.head:
+            self._close(transfer, "done")
+            return
+
+        reading = not transfer.head and not transfer.pending and transfer.read < transfer.size \
+                  and transfer not in self._throttled and self._allows_read(transfer, time.monotonic())
+        writing = bool(transfer.head) or transfer.pending > 0
+
+        self._watch(transfer.sender, selectors.EVENT_READ if reading else 0, functools.partial(self._read, transfer))
+        self._watch(transfer.receiver, selectors.EVENT_WRITE if writing else 0, functools.partial(self._write, transfer))
+
+    def _watch(self, sock, events, callback):
+        try:
+            key = self._selector.get_key(sock)
+        except KeyError:
+            key = None
+
+        if not events:
+            if key is not None:
+                self._selector.unregister(sock)
+        elif key is None:
+            self._selector.register(sock, events, callback)
+        elif key.events != events:
+            self._selector.modify(sock, events, callback)
+
+    def _read(self, transfer, events):
+        count = min(CHUNK_SIZE, transfer.size - transfer.read)
+        if self.rate_limit is not None:
+            count = min(count, int(transfer.allowance))
+
+        try:
+            if transfer.pipe is not None:
+                count = os.splice(transfer.sender.fileno(), transfer.pipe[1], count,
+                                  flags=os.SPLICE_F_MOVE | os.SPLICE_F_NONBLOCK)
+            else:
+                count = transfer.sender.recv_into(transfer.buffer[:count])
+                transfer.offset = 0
+        except BlockingIOError:
+            return
+        except OSError:
+            count = 0
+
+        if count == 0:
+            self._close(transfer, "aborted by the sender")
+            return
+
+        transfer.read += count
+        transfer.pending = count
+        transfer.allowance -= count
+        transfer.deadline = time.monotonic() + self.timeout
+
+        self._write(transfer, selectors.EVENT_WRITE)
+
+    def _write(self, transfer, events):
+        try:
+            if transfer.head:
+                sent = transfer.receiver.send(transfer.head)
+                transfer.head = transfer.head[sent:]
+            elif transfer.pipe is not None:
+                sent = os.splice(transfer.pipe[0], transfer.receiver.fileno(), transfer.pending,
+                                 flags=os.SPLICE_F_MOVE | os.SPLICE_F_NONBLOCK)
+                transfer.pending -= sent
+            else:
+                sent = transfer.receiver.send(transfer.buffer[transfer.offset:transfer.offset + transfer.pending])
+                transfer.offset += sent
+                transfer.pending -= sent
+        except BlockingIOError:
+            pass
+        except OSError:
+            self._close(transfer, "aborted by the receiver")
+            return
+
+        self._update(transfer)
+
+    def _close(self, transfer, reason):
+        with self._lock:
+            if self._transfers.pop(transfer.token, None) is None:
+                return
+
+        self._throttled.discard(transfer)
+
+        for sock in (transfer.sender, transfer.receiver):
+            if sock is not None:
+                self._watch(sock, 0, None)
+                sock.close()
+
+        if transfer.pipe is not None:
+            for fd in transfer.pipe:
+                os.close(fd)
+
+        logging.info(f"RELAY {transfer.token}: {transfer.read}/{transfer.size} bytes, {reason}")
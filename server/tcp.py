@@ -1,8 +1,43 @@
 # Standard libraries
+import asyncio
+import collections
 import socket
-import select
+import selectors
 import threading
 import logging
+import os
+import time
+
+# Local imports
+from server.utils.framing import FrameBuffer
+from server.utils.ratelimit import RateLimiter
+from server.utils.timers import TimerWheel
+
+# The TCP keepalive of the clients' sockets: the kernel probes a silent peer after
+# KEEPALIVE_IDLE seconds, then every KEEPALIVE_INTERVAL seconds, and drops the
+# connection after KEEPALIVE_COUNT probes without answer
+KEEPALIVE_IDLE = 60
+KEEPALIVE_INTERVAL = 10
+KEEPALIVE_COUNT = 5
+
+# The delay between two cleanups of the rates of connection of the clients, in seconds
+PRUNE_INTERVAL = 60
+
+# The reply sent to the clients refused because they connect too often
+REFUSED_REPLY = b"210 ERR_SERVERBUSY\n"
+
+def _enable_keepalive(sock):
+    """
+    Lets the kernel detect the peers of `sock` that vanished without closing
+    the connection. The delays are only tuned where the platform allows it.
+    """
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    
+    for option, value in (('TCP_KEEPIDLE', KEEPALIVE_IDLE),
+                          ('TCP_KEEPINTVL', KEEPALIVE_INTERVAL),
+                          ('TCP_KEEPCNT', KEEPALIVE_COUNT)):
+        if hasattr(socket, option):
+            sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, option), value)
 
 class Connection():
     '''
@@ -49,6 +84,22 @@ class Protocol:
     def create_new_connection(self):
         raise NotImplementedError
     
+    def is_authenticated(self, connection):
+        """
+        Returns whether the client of `connection` has logged in, which tells
+        the server which idle timeout applies to the connection.
+        """
+        return True
+    
+    def ping(self, connection):
+        """
+        Asks the client of `connection` for a sign of life, since it has been
+        silent for too long. The client must then send any message.
+        
+        Protocols that do not override this method should not let the server
+        check whether their clients are alive.
+        """
+    
     def allows_to_send(self, sender, receiver, message):
         """
         Returns whether the protocol allows `sender` to send `message` to `receiver`.
@@ -60,6 +111,23 @@ class Protocol:
             message (str): the message to send
         """
         return True
+    
+    def receivers(self, sender, connections, message):
+        """
+        Returns the collection of the connections among `connections`
+        to which `sender` is allowed to send `message`.
+        
+        This method is called once per broadcast message, so protocols should
+        override it when some checks only depend on the sender.
+        
+        Arguments:
+        ----------
+            sender (Connection): the connection of the client that wants to send a message
+            connections (Iterable[Connection]): the candidate recipients
+            message (bytes): the message to send
+        """
+        return [receiver for receiver in connections
+                if receiver is not sender and self.allows_to_send(sender, receiver, message)]
 
     def get_connection(self, key):
         """
@@ -77,6 +145,126 @@ class Protocol:
         """
         return self.get_connection(key)
 
+class _Outbox:
+    """
+    The data waiting to be sent to a client.
+    
+    Attributes:
+    -----------
+        size (int): the number of bytes waiting to be sent
+    """
+    
+    def __init__(self):
+        self._chunks = collections.deque()
+        self.size = 0
+        
+    def __bool__(self):
+        return self.size > 0
+        
+    def push(self, data):
+        """
+        Appends `data` (bytes) to the data to send.
+        
+        The data is not copied, so that the same message can be queued
+        to several outboxes.
+        """
+        self._chunks.append(data)
+        self.size += len(data)
+        
+    def flush(self, sock):
+        """
+        Sends as much data as possible through `sock` without blocking.
+        
+        Raises an `OSError` if the socket is broken.
+        """
+        chunks = self._chunks
+        
+        while chunks:
+            try:
+                sent = sock.send(chunks[0])
+            except (BlockingIOError, InterruptedError):
+                return
+            
+            self.size -= sent
+            
+            if sent < len(chunks[0]):
+                # the kernel's buffer is full
+                chunks[0] = memoryview(chunks[0])[sent:]
+                return
+            
+            chunks.popleft()
+
+class _Liveness:
+    """
+    Tells whether a client is still alive.
+    
+    Attributes:
+    -----------
+        last_seen (float): the last time data has been received from the client
+        pinged (bool): whether the client has been pinged since then
+        timer: the handle of the next check of the client
+    """
+    
+    __slots__ = ('last_seen', 'pinged', 'timer')
+    
+    def __init__(self):
+        self.last_seen = time.monotonic()
+        self.pinged = False
+        self.timer = None
+
+class _Callbacks:
+    """
+    The callbacks to run within the loop of a server, which may be submitted
+    by other threads.
+    
+    The loop is woken up through a pair of sockets, whose reading end is
+    registered in the selector of the loop.
+    
+    Args:
+    -----
+        selector (selectors.BaseSelector): the selector of the loop
+    """
+    
+    def __init__(self, selector):
+        self._selector = selector
+        self._callbacks = collections.deque()
+        self._reader, self._writer = socket.socketpair()
+        self._reader.setblocking(False)
+        self._writer.setblocking(False)
+        
+        selector.register(self._reader, selectors.EVENT_READ, self._run)
+        
+    def call_soon_threadsafe(self, callback):
+        """
+        Schedules `callback` to be called by the loop, without argument.
+        """
+        self._callbacks.append(callback)
+        
+        try:
+            self._writer.send(b'\0')
+        except OSError:
+            # the loop is already about to wake up, or is over
+            pass
+        
+    def close(self):
+        self._selector.unregister(self._reader)
+        self._reader.close()
+        self._writer.close()
+        
+    def _run(self, events):
+        try:
+            while self._reader.recv(4096):
+                pass
+        except (BlockingIOError, InterruptedError):
+            pass
+        
+        # a failing callback must not keep the next ones from running, nor end the loop
+        while self._callbacks:
+            try:
+                self._callbacks.popleft()()
+            except Exception:
+                logging.exception("")
+
 class TcpServer():
     """
     A server that can handle TCP requests.
@@ -84,18 +272,64 @@ class TcpServer():
     Request processing:
     -----------------
         The process of requests is delegated to the given protocol.
+        
+        Messages are framed by a line feed: the server splits the incoming
+        data into messages before handing them to the connections one by one,
+        and terminates every message it writes with a line feed.
+    
+        Messages are not sent immediately: they are appended to the outbox of
+        the receiver, which is flushed whenever its socket is writable. When
+        the outbox of a client exceeds `max_write_buffer` bytes, the client is
+        considered too slow and its connection is closed as lost.
+        
+        All the clients waiting to be accepted are accepted at once, up to
+        `backlog` per wakeup, so that a restarted server quickly drains the
+        reconnections of its clients. Their rate can be limited, in total and
+        per ip, by token buckets: the clients beyond the limits receive
+        REFUSED_REPLY and are disconnected at once.
+        
+        Clients that vanished without closing their connection are detected by
+        the TCP keepalive of their socket, and by the server itself: a client
+        that has not logged in is closed once silent for `login_timeout` seconds,
+        and a logged in client that is silent for `idle_timeout` seconds is
+        pinged by the protocol, then closed as lost if it stays silent for
+        `ping_timeout` more seconds. Each connection has a single timer, which
+        is only pushed back when it expires.
     
         The connections created are filled with the following methods:
             - ip() : returns the client's ip
+            - address() : returns the client's address, as given by `socket.accept()`
             - write(str): writes a message to the connection's client
             - write_to(pseudo, message): writes a message to `pseudo`
             - write_all(message): writes a message to all other clients
             - close(): closes the associated socket, then call `:func:on_connection_close`
+            - call_soon_threadsafe(callback): lets any thread schedule a call of `callback`
+                                              within the server's loop
+            - call_later(delay, callback): calls `callback` within the server's loop in
+                                           `delay` seconds, and returns a handle whose
+                                           `cancel()` method prevents the call. Must be
+                                           called from the server's loop
             
     Args:
     -----
         protocol (Protocol): the protocol that deals with clients' requests
         port (int): the port of listening
+        selector (Callable[[], selectors.BaseSelector]): the factory of the selector
+            used to wait for incoming data. Defaults to the most efficient one
+            available on the platform (epoll on Linux); `selectors.SelectSelector`
+            can be given to fall back on the plain select() system call.
+        max_write_buffer (int): the maximum number of bytes waiting to be sent to a client
+        stats_interval (float): the number of seconds between two logs of the state
+                                of the server, or `None` to disable them
+        login_timeout (float): the number of seconds a client that has not logged in
+                               may stay silent, or `None` if unlimited
+        idle_timeout (float): the number of seconds a logged in client may stay silent
+                              before being pinged, or `None` if unlimited
+        ping_timeout (float): the number of seconds a pinged client has to answer
+        backlog (int): the number of connections the system queues until they are accepted
+        accept_rate (float): the number of clients accepted per second, or `None` if unlimited
+        accept_rate_per_ip (float): the number of clients accepted per second from a single
+                                    ip, or `None` if unlimited
     
     Attributes:
     -----------
@@ -103,18 +337,44 @@ class TcpServer():
         protocol (Protocol): the protocol that deals with requests from clients.
         is_over (threading.Event): indicates whether the server is over.
                                    This flag is used to close sub-threads.
-        opened_sockets (List[socket]): a list of sockets likely to receive incoming data
+        selector (selectors.BaseSelector): the selector in which every opened socket is registered
         local_socket (socket): server's socket
         connection_per_socket (Map[socket,Connection])
+        socket_per_connection (Map[Connection,socket])
+        frames_per_socket (Map[socket,FrameBuffer]): the incoming data not handled yet
+        outbox_per_socket (Map[socket,_Outbox]): the outgoing data not sent yet
+        liveness_per_socket (Map[socket,_Liveness]): tells whether the clients are alive
+        reaped (Counter[str]): the number of silent connections closed since the last
+                               report, per kind ("login" or "ping")
+        refused (int): the number of clients refused since the last report
     """
 
-    def __init__(self, protocol, port=8123):
+    def __init__(self, protocol, port=8123, selector=selectors.DefaultSelector, max_write_buffer=1 << 20,
+                 stats_interval=None, login_timeout=None, idle_timeout=None, ping_timeout=30,
+                 backlog=128, accept_rate=None, accept_rate_per_ip=None):
         self._port = port
         self._protocol = protocol
         self._is_over = threading.Event()
-        self._opened_sockets = []
+        self._selector_factory = selector
+        self._max_write_buffer = max_write_buffer
+        self._stats_interval = stats_interval
+        self._login_timeout = login_timeout
+        self._idle_timeout = idle_timeout
+        self._ping_timeout = ping_timeout
+        self._backlog = backlog
+        self._accept_limit = RateLimiter(accept_rate) if accept_rate else None
+        self._accept_limit_per_ip = RateLimiter(accept_rate_per_ip) if accept_rate_per_ip else None
+        self._selector = None
         self._local_socket = None
         self._connection_per_socket = {}
+        self._socket_per_connection = {}
+        self._frames_per_socket = {}
+        self._outbox_per_socket = {}
+        self._liveness_per_socket = {}
+        self._reaped = collections.Counter()
+        self._refused = 0
+        self._callbacks = None
+        self._timers = None
         
     def port(self) -> int:
         """
@@ -127,8 +387,11 @@ class TcpServer():
         Creates and then returns server's socket.
         """
         sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        # a restarted server must not wait for the connections of the previous one to expire
+        if os.name == 'posix':
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         sock.bind(('', self._port))
-        sock.listen(5)
+        sock.listen(self._backlog)
         sock.setblocking(0)
         logging.info(f"Server is waiting (PORT={self._port})")
         
@@ -140,26 +403,50 @@ class TcpServer():
         
         Arguments:
         ----------
-            poll_interval (float): the timeout ...
+            poll_interval (float): the maximum time (in seconds) to wait for an event
+                                   before checking whether the server is over
         """
         
         self._is_over.clear()
         
-        with self._create_local_socket() as server_sock:
+        with self._create_local_socket() as server_sock, self._selector_factory() as selector:
             
-            self._opened_sockets = [server_sock]        
+            self._selector = selector
             self._local_socket = server_sock
+            
+            # sockets are registered once, so that waiting for events does not depend
+            # on the number of opened sockets
+            selector.register(server_sock, selectors.EVENT_READ)
+            self._callbacks = _Callbacks(selector)
+            self._timers = TimerWheel()
 
             try:
+                self._on_started()
+                self._start_housekeeping()
+                
                 while not self._is_over.is_set():
-                    # readable is a list that contains server_sock if it have incoming data buffered and available to be read
-                    readable_sockets, _, _ = select.select(self._opened_sockets, [], [], poll_interval)
+                    for key, events in selector.select(self._timers.timeout(poll_interval)):
+                        if key.fileobj is self._local_socket:
+                            self._handle_new_connection(key.fileobj)
+                            continue
+                        
+                        # file objects registered with a callback handle their events by themselves
+                        if key.data is not None:
+                            key.data(events)
+                            continue
+                        
+                        # a previous event of the batch may have closed the socket, such as a
+                        # broadcast overflowing its outbox
+                        if key.fileobj not in self._connection_per_socket:
+                            continue
+                        
+                        if events & selectors.EVENT_WRITE:
+                            self._flush(key.fileobj)
+                        # the socket may have been closed while being flushed
+                        if events & selectors.EVENT_READ and key.fileobj in self._connection_per_socket:
+                            self._handle_existing_connection(key.fileobj)
                     
-                    for sock in readable_sockets:
-                        if sock == self._local_socket:
-                            self._handle_new_connection(sock)
-                        else:
-                            self._handle_existing_connection(sock)
+                    self._timers.advance()
             
             except KeyboardInterrupt:
                 logging.info("Closing...")
@@ -168,22 +455,145 @@ class TcpServer():
                 logging.exception("")
                 raise
             finally:
-                for sock in self._opened_sockets:
+                for sock in self._connection_per_socket:
                     sock.close()
+                self._connection_per_socket.clear()
+                self._socket_per_connection.clear()
+                self._frames_per_socket.clear()
+                self._outbox_per_socket.clear()
+                self._liveness_per_socket.clear()
+                self._callbacks.close()
+            
+    def _call_soon_threadsafe(self, callback):
+        """
+        Schedules `callback` to be called by the server's loop.
+        
+        This method can be called from any thread.
+        """
+        self._callbacks.call_soon_threadsafe(callback)
+        
+    def _call_later(self, delay, callback):
+        """
+        Schedules `callback` to be called by the server's loop in `delay` seconds.
+        """
+        return self._timers.call_later(delay, callback)
+            
+    def _start_housekeeping(self):
+        """
+        Schedules the periodic tasks of the server, which are run by its timers
+        rather than by polling every connection.
+        """
+        if self._stats_interval:
+            self._call_later(self._stats_interval, self._log_stats)
+        if self._accept_limit_per_ip is not None:
+            self._call_later(PRUNE_INTERVAL, self._prune_accept_limits)
             
-    def _broadcast(self, sender_socket, message):
-        """
-        Broadcasts `message` to all sockets except `sender_socket`.
-        """
-        sender = self._connection_per_socket[sender_socket]
-        for socket in self._opened_sockets:
-            if socket is not sender_socket and socket is not self._local_socket:
-                try:
-                    receiver = self._connection_per_socket[socket]
-                    if self._protocol.allows_to_send(sender, receiver, message):
-                        socket.send(message)
-                except:
-                    self._close_socket(socket)
+    def _prune_accept_limits(self):
+        """
+        Forgets the ips that have not connected lately, then schedules the next cleanup.
+        """
+        self._accept_limit_per_ip.prune()
+        self._call_later(PRUNE_INTERVAL, self._prune_accept_limits)
+            
+    def _log_stats(self):
+        """
+        Logs the state of the server, then schedules the next report.
+        """
+        logging.info(f"STATS: {len(self._connection_per_socket)} connections, "
+                     f"{self._queued_bytes()} bytes waiting to be sent, "
+                     f"{self._reaped['login']} reaped before login, "
+                     f"{self._reaped['ping']} reaped after a ping, "
+                     f"{self._refused} refused")
+        self._reaped.clear()
+        self._refused = 0
+        self._call_later(self._stats_interval, self._log_stats)
+        
+    def _queued_bytes(self):
+        """
+        Returns the number of bytes waiting to be sent to the clients.
+        """
+        return sum(outbox.size for outbox in self._outbox_per_socket.values())
+            
+    def _on_started(self):
+        """
+        Called by `:func:run_forever` once the server's socket is listening,
+        before handling any event.
+        
+        Daughters of `TcpServer` may register their own file objects in the
+        selector at this point, with a callback taking the ready events as data.
+        """
+            
+    def _broadcast(self, sender, message):
+        """
+        Broadcasts `message` (bytes) to all connections except `sender`.
+        
+        The receivers are selected once by the protocol, then the same bytes
+        object is queued to each of them without being copied.
+        """
+        receivers = self._protocol.receivers(sender, self._socket_per_connection, message)
+        
+        for receiver in receivers:
+            # the receiver may have been closed by a previous send
+            socket = self._socket_per_connection.get(receiver)
+            if socket is not None:
+                self._send(socket, message)
+    
+    def _send(self, socket, data):
+        """
+        Sends `data` (bytes) through `socket`.
+        
+        The data is appended to the outbox of the socket, which is flushed
+        as much as possible without blocking. Data sent to a closed socket
+        is ignored.
+        """
+        outbox = self._outbox_per_socket.get(socket)
+        
+        if outbox is None:
+            return
+        
+        if outbox.size + len(data) > self._max_write_buffer:
+            logging.warning(f"TOO SLOW: {self._connection_per_socket[socket].client}")
+            self._close_socket(socket, True)
+            return
+        
+        was_empty = not outbox
+        outbox.push(data)
+        
+        # when the outbox was not empty, the socket is already waiting to be writable
+        if was_empty:
+            self._flush(socket)
+            
+    def _flush(self, socket):
+        """
+        Sends the content of the outbox of `socket`, and then watches the socket
+        for write-readiness only if some data could not be sent.
+        """
+        outbox = self._outbox_per_socket[socket]
+        
+        try:
+            outbox.flush(socket)
+        except OSError:
+            self._close_socket(socket, True)
+            return
+        
+        events = selectors.EVENT_READ | selectors.EVENT_WRITE if outbox else selectors.EVENT_READ
+        
+        if self._selector.get_key(socket).events != events:
+            self._selector.modify(socket, events)
+    
+    def _detach(self, socket):
+        """
+        Stops watching `socket`, and then closes it.
+        """
+        self._selector.unregister(socket)
+        
+        # last attempt to send the pending data
+        try:
+            self._outbox_per_socket[socket].flush(socket)
+        except OSError:
+            pass
+        
+        socket.close()
                     
     def _close_socket(self, socket, connection_lost=False):
         """
@@ -193,9 +603,16 @@ class TcpServer():
         if socket not in self._connection_per_socket:
             return
         
-        socket.close()
+        self._detach(socket)
+        
+        connection = self._connection_per_socket.pop(socket)
+        del self._socket_per_connection[connection]
+        del self._frames_per_socket[socket]
+        del self._outbox_per_socket[socket]
         
-        connection = self._connection_per_socket[socket]
+        liveness = self._liveness_per_socket.pop(socket, None)
+        if liveness is not None and liveness.timer is not None:
+            liveness.timer.cancel()
         
         if connection_lost:
             logging.info(f"CONNECTION LOST: {connection.client}")
@@ -203,31 +620,93 @@ class TcpServer():
         else:
             logging.info(f"CONNECTION CLOSED: {connection.client}")
             connection.on_connection_closed()
-
-        self._opened_sockets.remove(socket)
             
     def _handle_new_connection(self, server_socket):
         """
-        Called by `:func:run_forever` when a new connection is initiated by a client.
+        Called by `:func:run_forever` when new connections are initiated by clients.
         
-        This method accepts the incoming socket, and then asks the server's protocol
-        to create an associated connection. Finally, utility methods are added to the
-        new connection in order to make it able to send messages to other clients.
+        This method accepts the incoming sockets, up to `backlog` at once, and then
+        asks the server's protocol to create the associated connections. Finally,
+        utility methods are added to the new connections in order to make them
+        able to send messages to other clients.
         """
-        client_socket, client_addr = server_socket.accept()
+        for _ in range(self._backlog):
+            try:
+                client_socket, client_addr = server_socket.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                # such as running out of file descriptors: the clients wait in the backlog
+                logging.warning(f"ACCEPT FAILED: {e}")
+                return
+            
+            client_socket.setblocking(False)
+            
+            if not self._allows_connection(client_addr[0]):
+                self._refuse(client_socket)
+                continue
+            
+            _enable_keepalive(client_socket)
+            
+            # prepare to receive new data from this socket
+            self._selector.register(client_socket, selectors.EVENT_READ)
+            
+            self._open_connection(client_socket, client_addr)
+            
+    def _allows_connection(self, ip):
+        """
+        Returns whether a client of `ip` can be accepted without exceeding the rates of connection.
+        """
+        # the ip is checked first, so that a flood from a single ip does not use the global rate
+        if self._accept_limit_per_ip is not None and not self._accept_limit_per_ip.allows(ip):
+            return False
         
-        # prepare to receive new data from this socket
-        self._opened_sockets.append(client_socket)
+        if self._accept_limit is not None and not self._accept_limit.allows():
+            # a refused client must not use the rate of its ip, or it could not come back sooner
+            if self._accept_limit_per_ip is not None:
+                self._accept_limit_per_ip.refund(ip)
+            return False
+        
+        return True
+    
+    def _refuse(self, client_socket):
+        """
+        Lets the client of `client_socket` know that it has to connect later, then closes the socket.
+        """
+        self._refused += 1
         
-        # create the new connection
+        try:
+            client_socket.send(REFUSED_REPLY)
+        except OSError:
+            pass
+        
+        client_socket.close()
+        
+    def _open_connection(self, client_socket, client_addr):
+        """
+        Asks the server's protocol to create the connection associated with
+        `client_socket`, and then fills it with the utility methods.
+        """
         connection = self._protocol.create_new_connection()
-        connection.ip = lambda: client_socket.getpeername()[0]
-        connection.write = lambda message: client_socket.send(message.encode())
+        connection.ip = lambda: client_addr[0]
+        connection.address = lambda: client_addr
+        connection.write = lambda message: self._send(client_socket, f"{message}\n".encode())
+        connection.write_bytes = lambda data: self._send(client_socket, data)
         connection.write_to = lambda pseudo, message: self._protocol[pseudo].connection.write(message)
-        connection.write_all = lambda message: self._broadcast(client_socket, message.encode())
+        connection.write_all = lambda message: self._broadcast(connection, f"{message}\n".encode())
         connection.close = lambda: self._close_socket(client_socket)
+        connection.call_soon_threadsafe = self._call_soon_threadsafe
+        connection.call_later = self._call_later
         
         self._connection_per_socket[client_socket] = connection
+        self._socket_per_connection[connection] = client_socket
+        self._frames_per_socket[client_socket] = FrameBuffer()
+        self._outbox_per_socket[client_socket] = _Outbox()
+        
+        if self._login_timeout is not None or self._idle_timeout is not None:
+            liveness = self._liveness_per_socket[client_socket] = _Liveness()
+            liveness.timer = self._call_later(self._check_delay(connection),
+                                              lambda: self._check_liveness(client_socket))
         
         connection.on_connection_started()
         
@@ -241,16 +720,213 @@ class TcpServer():
         This method reads the content of the socket, and then lets the associated connection
         deal with it.
         """
-        connection = self._connection_per_socket[client_socket]
-        
         try:
             request = client_socket.recv(2048)
-            request = request.decode()
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            # a reset, or a keepalive that got no answer (ETIMEDOUT, EHOSTUNREACH...)
+            self._close_socket(client_socket, True)
+            return
             
-            if request:
-                connection.on_data_received(request)
+        if request:
+            self._handle_data(client_socket, request)
+        else:
+            self._close_socket(client_socket)
+            
+    def _handle_data(self, client_socket, data):
+        """
+        Extracts the complete messages of `data`, and then lets the connection
+        associated with `client_socket` deal with them in order.
+        """
+        connection = self._connection_per_socket[client_socket]
+        
+        liveness = self._liveness_per_socket.get(client_socket)
+        if liveness is not None:
+            liveness.last_seen = time.monotonic()
+            liveness.pinged = False
+        
+        for frame in self._frames_per_socket[client_socket].feed(data):
+            # a previous message may have closed the connection
+            if client_socket not in self._connection_per_socket:
+                return
+            
+            if frame is None:
+                connection.write("298 ERR_MALFORMEDREQUEST")
+                continue
+            
+            # frames are only decoded once complete, so that a multi-byte character
+            # split by the network cannot make the decoding fail
+            try:
+                request = frame.decode()
+            except UnicodeDecodeError:
+                connection.write("298 ERR_MALFORMEDREQUEST")
             else:
+                connection.on_data_received(request)
+
+    def _check_delay(self, connection):
+        """
+        Returns the number of seconds `connection` may stay silent.
+        """
+        timeout = self._idle_timeout if self._protocol.is_authenticated(connection) else self._login_timeout
+        
+        # without timeout in the current state, the state is checked again later
+        return timeout if timeout is not None else self._login_timeout or self._idle_timeout
+        
+    def _check_liveness(self, client_socket):
+        """
+        Closes the connection of `client_socket` if its client has been silent
+        for too long, and checks it again later otherwise.
+        """
+        liveness = self._liveness_per_socket.get(client_socket)
+        
+        if liveness is None:
+            return
+        
+        connection = self._connection_per_socket[client_socket]
+        authenticated = self._protocol.is_authenticated(connection)
+        timeout = self._idle_timeout if authenticated else self._login_timeout
+        silence = time.monotonic() - liveness.last_seen
+        
+        if liveness.pinged and authenticated:
+            logging.info(f"NO PONG: {connection.client}")
+            self._reaped['ping'] += 1
+            self._close_socket(client_socket, True)
+            return
+        
+        if timeout is not None and silence >= timeout:
+            if not authenticated:
+                logging.info(f"LOGIN TIMEOUT: {connection.address()}")
+                self._reaped['login'] += 1
                 self._close_socket(client_socket)
+                return
+            
+            liveness.pinged = True
+            self._protocol.ping(connection)
+            delay = self._ping_timeout
+        elif timeout is not None:
+            delay = timeout - silence
+        else:
+            delay = self._check_delay(connection)
+        
+        liveness.timer = self._call_later(delay, lambda: self._check_liveness(client_socket))
+
+class _AsyncChannel(asyncio.Protocol):
+    """
+    Forwards the events of an asyncio transport to an `:class:AsyncTcpServer`.
+    """
+    
+    def __init__(self, server):
+        self._server = server
+        self._transport = None
+        
+    def connection_made(self, transport):
+        self._transport = transport
+        address = transport.get_extra_info('peername')
+        
+        if not self._server._allows_connection(address[0]):
+            self._server._refuse(transport)
+            return
+        
+        _enable_keepalive(transport.get_extra_info('socket'))
+        self._server._open_connection(transport, address)
+        
+    def data_received(self, data):
+        self._server._handle_data(self._transport, data)
+        
+    def connection_lost(self, exc):
+        self._server._close_socket(self._transport, exc is not None)
 
-        except ConnectionResetError:
-            self._close_socket(client_socket, True)
\ No newline at end of file
+class AsyncTcpServer(TcpServer):
+    """
+    A server that can handle TCP requests, running on an asyncio event loop.
+    
+    It behaves as `:class:TcpServer`, except that messages are written to
+    asyncio transports: writing to a client never blocks the loop, since data
+    that cannot be sent yet is buffered by the transport. The size of this
+    buffer is limited by `max_write_buffer` as well.
+    
+    Within this class, the sockets of `:class:TcpServer` are replaced by the
+    transports of the clients.
+    
+    Args:
+    -----
+        protocol (Protocol): the protocol that deals with clients' requests
+        port (int): the port of listening
+        max_write_buffer (int): the maximum number of bytes waiting to be sent to a client
+        options: the other keyword arguments of `:class:TcpServer`, such as `stats_interval`
+    """
+    
+    def __init__(self, protocol, port=8123, max_write_buffer=1 << 20, **options):
+        super().__init__(protocol, port, selector=None, max_write_buffer=max_write_buffer, **options)
+        self._loop = None
+        
+    def run_forever(self, poll_interval=0.5):
+        """
+        Runs the server so that it loops indefinitely. 
+        
+        Arguments:
+        ----------
+            poll_interval (float): the time (in seconds) between two checks of
+                                   whether the server is over
+        """
+        self._is_over.clear()
+        
+        try:
+            asyncio.run(self._serve(poll_interval))
+        except KeyboardInterrupt:
+            logging.info("Closing...")
+            self._is_over.set()
+        except Exception:
+            logging.exception("")
+            raise
+        
+    async def _serve(self, poll_interval):
+        """
+        Serves clients until `is_over` is set.
+        """
+        loop = asyncio.get_running_loop()
+        self._loop = loop
+        server = await loop.create_server(lambda: _AsyncChannel(self), '', self._port, backlog=self._backlog)
+        logging.info(f"Server is waiting (PORT={self._port})")
+        self._start_housekeeping()
+        
+        async with server:
+            try:
+                while not self._is_over.is_set():
+                    await asyncio.sleep(poll_interval)
+            finally:
+                for transport in self._connection_per_socket:
+                    transport.close()
+                self._connection_per_socket.clear()
+                self._socket_per_connection.clear()
+                self._frames_per_socket.clear()
+                self._liveness_per_socket.clear()
+    
+    def _call_soon_threadsafe(self, callback):
+        self._loop.call_soon_threadsafe(callback)
+        
+    def _call_later(self, delay, callback):
+        return self._loop.call_later(delay, callback)
+        
+    def _queued_bytes(self):
+        return sum(transport.get_write_buffer_size() for transport in self._connection_per_socket)
+    
+    def _send(self, transport, data):
+        if transport not in self._connection_per_socket:
+            return
+        
+        if transport.get_write_buffer_size() + len(data) > self._max_write_buffer:
+            logging.warning(f"TOO SLOW: {self._connection_per_socket[transport].client}")
+            self._close_socket(transport, True)
+            return
+        
+        transport.write(data)
+        
+    def _refuse(self, transport):
+        self._refused += 1
+        transport.write(REFUSED_REPLY)
+        transport.close()
+        
+    def _detach(self, transport):
+        transport.close()
\ No newline at end of file
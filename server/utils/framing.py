@@ -0,0 +1,56 @@
+class FrameBuffer:
+    """
+    Reassembles the frames of a byte stream.
+    
+    Each frame is terminated by a line feed, which may be preceded by a
+    carriage return. Terminators are not part of the returned frames.
+    
+    Args:
+    -----
+        max_size (int): the maximum size of a frame, in bytes (terminator excluded)
+    """
+    
+    def __init__(self, max_size=2048):
+        self._max_size = max_size
+        self._buffer = bytearray()
+        self._overflow = False
+        
+    def feed(self, data):
+        """
+        Appends `data` to the buffer, and then returns the list of the frames
+        it completes, in order.
+        
+        Empty frames are ignored. A frame longer than `max_size` is discarded
+        and replaced by `None` within the returned list.
+        
+        Arguments:
+        ----------
+            data (bytes): the data received from the stream
+        """
+        buffer = self._buffer
+        buffer += data
+        
+        frames = []
+        start = 0
+        end = buffer.find(b'\n')
+        
+        while end != -1:
+            stop = end - 1 if end > start and buffer[end - 1] == 0x0D else end
+            
+            if self._overflow or stop - start > self._max_size:
+                frames.append(None)
+                self._overflow = False
+            elif stop > start:
+                frames.append(bytes(buffer[start:stop]))
+                
+            start = end + 1
+            end = buffer.find(b'\n', start)
+            
+        del buffer[:start]
+        
+        # do not keep an incomplete frame that is already too long
+        if len(buffer) > self._max_size + 1:
+            buffer.clear()
+            self._overflow = True
+            
+        return frames
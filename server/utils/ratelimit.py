@@ -0,0 +1,80 @@
+# Standard libraries
+import time
+
+class _Bucket:
+    """
+    The tokens left to a key of a `:class:RateLimiter`.
+    """
+
+    __slots__ = ('tokens', 'updated_at')
+
+    def __init__(self, tokens, updated_at):
+        self.tokens = tokens
+        self.updated_at = updated_at
+
+class RateLimiter:
+    """
+    Limits the rate of events per key, thanks to a token bucket per key.
+
+    Each bucket holds up to `burst` tokens, and is refilled at `rate` tokens
+    per second. An event is allowed when a token is left in the bucket of its
+    key, which is then consumed. Hence bursts of `burst` events are allowed,
+    as long as the average rate stays below `rate`.
+
+    Buckets are created on demand: `:func:prune` should be called from time to
+    time to forget the keys that have been quiet long enough to be full again.
+
+    Args:
+    -----
+        rate (float): the number of events allowed per second and per key
+        burst (float): the number of events allowed at once, `rate` by default
+        clock (Callable[[], float]): returns the current time, in seconds
+    """
+
+    def __init__(self, rate, burst=None, clock=time.monotonic):
+        self.rate = rate
+        self.burst = max(1, burst if burst is not None else rate)
+        self._clock = clock
+        self._buckets = {}
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def allows(self, key=None):
+        """
+        Returns whether an event of `key` is allowed, and consumes a token if so.
+        """
+        now = self._clock()
+        bucket = self._buckets.get(key)
+
+        if bucket is None:
+            bucket = self._buckets[key] = _Bucket(self.burst, now)
+        else:
+            bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated_at) * self.rate)
+            bucket.updated_at = now
+
+        if bucket.tokens < 1:
+            return False
+
+        bucket.tokens -= 1
+        return True
+
+    def refund(self, key=None):
+        """
+        Gives back the token consumed by an event of `key` that did not happen after all.
+        """
+        bucket = self._buckets.get(key)
+
+        if bucket is not None:
+            bucket.tokens = min(self.burst, bucket.tokens + 1)
+
+    def prune(self):
+        """
+        Forgets the keys whose bucket is full, which behave as unknown keys.
+        """
+        now = self._clock()
+        full = [key for key, bucket in self._buckets.items()
+                if bucket.tokens + (now - bucket.updated_at) * self.rate >= self.burst]
+
+        for key in full:
+            del self._buckets[key]
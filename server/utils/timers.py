@@ -0,0 +1,188 @@
+# Standard libraries
+import logging
+import math
+import time
+
+class Timer:
+    """
+    A callback scheduled by a `:class:TimerWheel`.
+
+    Attributes:
+    -----------
+        tick (int): the tick at which the callback is due
+        callback (Callable[[], None]): the function called without argument
+        cancelled (bool): whether the timer has been cancelled
+    """
+
+    __slots__ = ('tick', 'callback', 'cancelled')
+
+    def __init__(self, tick, callback):
+        self.tick = tick
+        self.callback = callback
+        self.cancelled = False
+
+    def cancel(self):
+        """
+        Prevents the callback from being called. Cancelling a timer that has
+        already run does nothing.
+        """
+        self.cancelled = True
+        self.callback = None
+
+class TimerWheel:
+    """
+    Runs callbacks after a delay, within the loop of a server.
+
+    Time is split into ticks of `resolution` seconds. The wheel is made of
+    `levels` rings of `slots` lists: a slot of the first ring holds the timers
+    due at one tick, and a slot of each next ring covers `slots` times more
+    ticks than a slot of the previous one. A timer is put in the ring whose
+    span covers its delay, then moves down to the previous ring once its slot
+    is reached, until it is due.
+
+    Scheduling and cancelling a timer cost O(1), and each tick only looks at
+    the slots it reaches, so the cost of the wheel does not depend on the
+    number of connections. With the default values, the wheel covers delays
+    up to 19 days, and longer ones are rescheduled by the last ring.
+
+    The loop must call `:func:advance` after each wait for events, and should
+    not wait longer than `:func:timeout`.
+
+    The wheel is not thread-safe: timers must be scheduled from the loop.
+
+    Args:
+    -----
+        resolution (float): the duration of a tick, in seconds
+        slots (int): the number of slots of each ring
+        levels (int): the number of rings
+        clock (Callable[[], float]): returns the current time, in seconds
+    """
+
+    def __init__(self, resolution=0.1, slots=64, levels=4, clock=time.monotonic):
+        self._resolution = resolution
+        self._size = slots
+        self._rings = [[[] for _ in range(slots)] for _ in range(levels)]
+        self._clock = clock
+        self._origin = clock()
+        self._tick = 0
+        self._count = 0
+
+    def __len__(self):
+        """
+        Returns the number of timers scheduled, including the cancelled ones
+        that have not been dropped yet.
+        """
+        return self._count
+
+    def call_later(self, delay, callback):
+        """
+        Schedules `callback` to be called without argument in `delay` seconds,
+        rounded up to the next tick, and returns its `:class:Timer`.
+        """
+        elapsed = self._clock() - self._origin + delay
+        timer = Timer(max(self._tick + 1, math.ceil(elapsed / self._resolution)), callback)
+
+        self._place(timer)
+        self._count += 1
+
+        return timer
+
+    def timeout(self, default):
+        """
+        Returns the time to wait before the next tick at which timers may be due,
+        in seconds, or `default` if it is later.
+        """
+        if not self._count:
+            return default
+
+        size = self._size
+        ring = self._rings[0]
+
+        # the timers of the next rings only come down when a whole turn of the first one is over
+        for tick in range(self._tick + 1, self._tick + size + 1):
+            if ring[tick % size] or tick % size == 0:
+                break
+
+        return min(default, max(0, self._origin + tick * self._resolution - self._clock()))
+
+    def advance(self):
+        """
+        Runs the callbacks of the timers that are due.
+        """
+        now = int((self._clock() - self._origin) / self._resolution)
+
+        # an idle wheel has nothing to look at
+        if not self._count:
+            self._tick = now
+            return
+
+        while self._tick < now:
+            self._tick += 1
+            self._cascade(self._tick)
+            self._run_slot(self._tick)
+
+    def _place(self, timer):
+        """
+        Puts `timer` in the ring whose span covers its delay.
+        """
+        size = self._size
+        delay = timer.tick - self._tick
+        span = size
+
+        for level, ring in enumerate(self._rings):
+            if delay < span or level == len(self._rings) - 1:
+                # the last ring keeps the longer delays until its slot is reached again
+                tick = min(timer.tick, self._tick + span - 1)
+                ring[(tick // (span // size)) % size].append(timer)
+                return
+
+            span *= size
+
+    def _cascade(self, tick):
+        """
+        Moves the timers of the slots reached at `tick` down to the previous rings.
+
+        The higher rings are emptied first, so that their timers can be moved
+        down again by the lower rings reached at the same tick.
+        """
+        size = self._size
+        levels = 1
+
+        while levels < len(self._rings) and tick % size ** levels == 0:
+            levels += 1
+
+        for level in range(levels - 1, 0, -1):
+            slot = self._rings[level][(tick // size ** level) % size]
+            timers, slot[:] = slot[:], []
+
+            for timer in timers:
+                if not timer.cancelled:
+                    self._place(timer)
+                else:
+                    self._count -= 1
+
+    def _run_slot(self, tick):
+        slot = self._rings[0][tick % self._size]
+
+        if not slot:
+            return
+
+        timers, slot[:] = slot[:], []
+
+        for timer in timers:
+            if timer.cancelled:
+                self._count -= 1
+                continue
+
+            # a timer found in the first ring before being due has come from the last one
+            if timer.tick > tick:
+                self._place(timer)
+                continue
+
+            self._count -= 1
+            callback, timer.callback = timer.callback, None
+
+            try:
+                callback()
+            except Exception:
+                logging.exception("")
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the server's packages import each other as main_server.py lets them, from the server's directory
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "server"))
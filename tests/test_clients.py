@@ -0,0 +1,114 @@
+# Standard libraries
+import random
+import unittest
+
+# Local imports
+from server.dnc._data import Client, Clients
+
+class _Connection:
+    """
+    Stands for the connection of a client, which only has to give its address.
+    """
+
+    def __init__(self, address):
+        self._address = address
+
+    def address(self):
+        return self._address
+
+def _client(pseudo, port):
+    return Client(pseudo, _Connection(('127.0.0.1', port)))
+
+class ClientsTest(unittest.TestCase):
+
+    def test_lookups(self):
+        clients = Clients()
+        alice = _client("alice", 1)
+        clients += alice
+
+        self.assertIs(clients["alice"], alice)
+        self.assertIs(clients[('127.0.0.1', 1)], alice)
+        self.assertIs(clients[alice.connection], alice)
+        self.assertIs(clients.from_address(('127.0.0.1', 1)), alice)
+        self.assertIs(clients.from_connection(alice.connection), alice)
+
+        for key in (alice, "alice", ('127.0.0.1', 1), alice.connection):
+            self.assertIn(key, clients)
+
+    def test_unknown_keys(self):
+        clients = Clients()
+
+        self.assertNotIn("bob", clients)
+        self.assertIsNone(clients.from_address(('127.0.0.1', 2)))
+        self.assertIsNone(clients.from_connection(_Connection(None)))
+
+        with self.assertRaises(KeyError):
+            clients["bob"]
+
+    def test_removal_clears_every_index(self):
+        clients = Clients()
+        alice = _client("alice", 1)
+        clients += alice
+        clients -= alice.connection
+
+        for key in ("alice", ('127.0.0.1', 1), alice.connection):
+            self.assertNotIn(key, clients)
+        self.assertEqual(len(clients), 0)
+
+    def test_rename_keeps_the_other_indexes(self):
+        clients = Clients()
+        alice = _client("alice", 1)
+        clients += alice
+        clients.rename("alice", "al")
+
+        self.assertNotIn("alice", clients)
+        self.assertIs(clients["al"], alice)
+        self.assertIs(clients[alice.connection], alice)
+        self.assertEqual(clients.names_reply, b"101 RPL_NAMES al\n")
+
+    def test_names_reply_is_built_once_per_change(self):
+        clients = Clients()
+        clients += _client("alice", 1)
+        reply = clients.names_reply
+
+        self.assertIs(clients.names_reply, reply)
+
+        clients += _client("bob", 2)
+        self.assertEqual(clients.names_reply, b"101 RPL_NAMES alice bob\n")
+
+    def test_random_operations(self):
+        rng = random.Random(0)
+        clients = Clients()
+        # the model: the connected clients per pseudo
+        expected = {}
+
+        for port in range(2000):
+            action = rng.random()
+
+            if action < 0.5 or not expected:
+                pseudo = f"u{rng.randrange(50)}"
+                if pseudo in expected:
+                    continue
+                expected[pseudo] = _client(pseudo, port)
+                clients += expected[pseudo]
+            elif action < 0.8:
+                client = expected.pop(rng.choice(list(expected)))
+                clients -= rng.choice([client, client.pseudo, client.address, client.connection])
+            else:
+                old, new = rng.choice(list(expected)), f"u{rng.randrange(50)}"
+                if new in expected:
+                    continue
+                clients.rename(old, new)
+                expected[new] = expected.pop(old)
+
+            self.assertEqual(sorted(clients), sorted(expected))
+            self.assertEqual(sorted(clients.roster.split()), sorted(expected))
+            self.assertEqual(clients.names_reply, f"101 RPL_NAMES {clients.roster}\n".encode())
+
+            for pseudo, client in expected.items():
+                self.assertIs(clients[pseudo], client)
+                self.assertIs(clients[client.address], client)
+                self.assertIs(clients[client.connection], client)
+
+if __name__ == '__main__':
+    unittest.main()
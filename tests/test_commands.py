@@ -0,0 +1,80 @@
+# Standard libraries
+import os
+import unittest
+
+# Local imports
+from server.dnc._commands import CommandDispatcher
+from server.dnc.protocol import DncProtocol
+
+MIX_FILE = os.path.join(os.path.dirname(__file__), "..", "benchmarks", "request_mix.txt")
+
+class _Timer:
+
+    def cancel(self):
+        pass
+
+def _load_mix():
+    """
+    Returns the (client, request, replies) triplets recorded in the mix of requests.
+    """
+    with open(MIX_FILE, encoding='utf-8') as file:
+        lines = [line.rstrip('\n') for line in file if line.strip() and not line.startswith('#')]
+
+    return [line.split('\t') for line in lines]
+
+class RecordedMixTest(unittest.TestCase):
+
+    def setUp(self):
+        self.protocol = DncProtocol()
+        self.replies = []
+
+    def tearDown(self):
+        self.protocol.executor.shutdown()
+
+    def _connect(self, client):
+        connection = self.protocol.create_new_connection()
+        connection.ip = lambda: "127.0.0.1"
+        connection.address = lambda: ("127.0.0.1", 4000)
+        connection.write = lambda message: self.replies.append((client, message))
+        connection.write_bytes = lambda data: self.replies.append((client, data.decode()[:-1]))
+        connection.write_to = lambda pseudo, message: None
+        connection.write_all = lambda message: None
+        connection.close = lambda: connection.on_connection_closed()
+        connection.call_soon_threadsafe = lambda callback: callback()
+        connection.call_later = lambda delay, callback: _Timer()
+        connection.on_connection_started()
+        return connection
+
+    def test_recorded_replies(self):
+        # requests are parsed, checked against their preconditions, then handled
+        connections = {}
+
+        for client, request, replies in _load_mix():
+            if client not in connections:
+                connections[client] = self._connect(client)
+
+            self.replies.clear()
+            connections[client].on_data_received(request)
+            own = " / ".join(message for receiver, message in self.replies if receiver == client)
+            self.assertEqual(own, replies, f"{client}: {request}")
+
+    def test_parsing_splits_as_the_whole_line(self):
+        dispatcher = CommandDispatcher()
+
+        for _, request, _ in _load_mix():
+            command, args = dispatcher.parse(request)
+            name, *words = request.split()
+
+            with self.subTest(request=request):
+                expected = CommandDispatcher._commands.get(name.upper())
+                if expected is None:
+                    self.assertEqual(command.handler(None, args), "298 ERR_MALFORMEDREQUEST")
+                else:
+                    self.assertIs(command, expected)
+                # the last argument holds the rest of the line, whose words are the remaining ones
+                self.assertEqual(" ".join(args).split(), words)
+                if command.max_args is not None:
+                    self.assertLessEqual(len(args), command.max_args)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+# Standard libraries
+import random
+import unittest
+
+# Local imports
+from server.utils.framing import FrameBuffer
+
+MAX_SIZE = 64
+
+# the bytes that can be found within a frame
+CONTENT = [byte for byte in range(256) if byte != 0x0A]
+
+def _random_frame(rng):
+    """
+    Returns the content of a frame, which is sometimes empty, longer than
+    MAX_SIZE, or made of multi-byte characters.
+    """
+    kind = rng.random()
+
+    if kind < 0.1:
+        return b""
+    if kind < 0.3:
+        return "".join(rng.choice("aé€😀") for _ in range(rng.randint(1, 20))).encode()
+
+    size = rng.choice([rng.randint(1, MAX_SIZE), MAX_SIZE, MAX_SIZE + 1, rng.randint(MAX_SIZE + 2, 4 * MAX_SIZE)])
+    frame = bytes(rng.choices(CONTENT, k=size))
+
+    # a trailing carriage return would be taken for a part of the terminator
+    return frame[:-1] + b"x" if frame.endswith(b"\r") else frame
+
+def _split(rng, stream):
+    """
+    Cuts `stream` at random positions, including within terminators and characters.
+    """
+    chunks = []
+    start = 0
+
+    while start < len(stream):
+        end = start + rng.choice([1, 2, 3, rng.randint(1, 3 * MAX_SIZE)])
+        chunks.append(stream[start:end])
+        start = end
+
+    return chunks
+
+class FrameBufferTest(unittest.TestCase):
+
+    def test_random_splits(self):
+        for seed in range(300):
+            rng = random.Random(seed)
+            frames = [_random_frame(rng) for _ in range(rng.randint(1, 40))]
+            stream = b"".join(frame + rng.choice([b"\n", b"\r\n"]) for frame in frames)
+
+            buffer = FrameBuffer(MAX_SIZE)
+            received = [frame for chunk in _split(rng, stream) for frame in buffer.feed(chunk)]
+
+            # empty frames are ignored, and oversized ones are replaced by None
+            expected = [frame if len(frame) <= MAX_SIZE else None for frame in frames if frame]
+            self.assertEqual(received, expected, f"seed {seed}")
+
+    def test_oversized_frame_does_not_affect_the_next_ones(self):
+        buffer = FrameBuffer(MAX_SIZE)
+
+        self.assertEqual(buffer.feed(b"x" * (10 * MAX_SIZE)), [])
+        self.assertEqual(buffer.feed(b"y" * MAX_SIZE), [])
+        self.assertEqual(buffer.feed(b"\nNAMES\r\n"), [None, b"NAMES"])
+
+    def test_incomplete_frame_is_kept(self):
+        buffer = FrameBuffer(MAX_SIZE)
+
+        self.assertEqual(buffer.feed(b"MESSAGE h\xc3"), [])
+        self.assertEqual(buffer.feed(b"\xa9\r"), [])
+        self.assertEqual(buffer.feed(b"\n"), ["MESSAGE hé".encode()])
+
+    def test_empty_frames_are_ignored(self):
+        buffer = FrameBuffer(MAX_SIZE)
+
+        self.assertEqual(buffer.feed(b"\n\r\n\nQUIT\n\n"), [b"QUIT"])
+
+if __name__ == '__main__':
+    unittest.main()
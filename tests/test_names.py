@@ -0,0 +1,90 @@
+# Standard libraries
+import random
+import unittest
+
+# Local imports
+from server.dnc._commands import CommandDispatcher
+from server.dnc._data import Client, Clients
+
+class _Protocol:
+
+    def __init__(self, clients):
+        self.clients = clients
+
+class _Connection:
+    """
+    Stands for the connection of a client asking for the list of pseudos.
+    """
+
+    def __init__(self, clients):
+        self._protocol = _Protocol(clients)
+
+def _names(clients, request):
+    command, args = CommandDispatcher().parse(request)
+    return command.handler(_Connection(clients), args)
+
+def _apply(pseudos, reply):
+    """
+    Returns the version and the pseudos given by a RPL_NAMESDELTA `reply`
+    to a client that knew `pseudos`.
+    """
+    code, _, version, *changes = reply.split()
+    assert code == "103"
+
+    if changes[:1] == ["*"]:
+        return int(version), set(changes[1:])
+
+    pseudos = set(pseudos)
+    for change in changes:
+        if change[0] == "+":
+            pseudos.add(change[1:])
+        else:
+            pseudos.remove(change[1:])
+
+    return int(version), pseudos
+
+class NamesDeltaTest(unittest.TestCase):
+
+    def test_deltas_lead_to_the_current_list(self):
+        rng = random.Random(0)
+        clients = Clients(history_size=64)
+        # the list of pseudos known at each version
+        known = {clients.version: set()}
+
+        for _ in range(1000):
+            action = rng.random()
+            pseudo = f"u{rng.randrange(30)}"
+
+            if pseudo not in clients:
+                clients += Client(pseudo)
+            elif action < 0.5:
+                clients -= pseudo
+            elif f"{pseudo}x" not in clients:
+                clients.rename(pseudo, f"{pseudo}x")
+
+            known[clients.version] = set(clients)
+
+            for version in rng.sample(sorted(known), min(5, len(known))):
+                reply = _names(clients, f"NAMES SINCE {version}")
+                self.assertEqual(_apply(known[version], reply), (clients.version, set(clients)), reply)
+
+    def test_unknown_versions_get_the_whole_list(self):
+        clients = Clients(history_size=2)
+        for pseudo in ("a", "b", "c"):
+            clients += Client(pseudo)
+
+        self.assertEqual(_names(clients, "NAMES SINCE 0"), "103 RPL_NAMESDELTA 3 * a b c")
+        self.assertEqual(_names(clients, "NAMES SINCE 4"), "103 RPL_NAMESDELTA 3 * a b c")
+        self.assertEqual(_names(clients, "NAMES SINCE 1"), "103 RPL_NAMESDELTA 3 +b +c")
+        self.assertEqual(_names(clients, "NAMES SINCE 3").rstrip(), "103 RPL_NAMESDELTA 3")
+
+    def test_bad_requests(self):
+        clients = Clients()
+
+        self.assertEqual(_names(clients, "NAMES"), b"101 RPL_NAMES \n")
+        self.assertEqual(_names(clients, "NAMES SINCE"), "203 ERR_NOTENOUGHARGS")
+        self.assertEqual(_names(clients, "NAMES SINCE one"), "208 ERR_BADARGUMENT")
+        self.assertEqual(_names(clients, "NAMES UNTIL 1"), "208 ERR_BADARGUMENT")
+
+if __name__ == '__main__':
+    unittest.main()
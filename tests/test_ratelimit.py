@@ -0,0 +1,113 @@
+# Standard libraries
+import unittest
+
+# Local imports
+from server.tcp import TcpServer
+from server.utils.ratelimit import RateLimiter
+
+class _Clock:
+    """
+    A clock that only moves forward when told to.
+    """
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class RateLimiterTest(unittest.TestCase):
+
+    def test_burst_then_rate(self):
+        clock = _Clock()
+        limiter = RateLimiter(2, burst=5, clock=clock)
+
+        self.assertEqual([limiter.allows() for _ in range(6)], [True] * 5 + [False])
+
+        clock.now = 0.4
+        self.assertFalse(limiter.allows())
+        clock.now = 0.5
+        self.assertTrue(limiter.allows())
+        self.assertFalse(limiter.allows())
+
+    def test_average_rate(self):
+        clock = _Clock()
+        limiter = RateLimiter(10, burst=3, clock=clock)
+        allowed = 0
+
+        # 100 events per second for 10 seconds
+        for _ in range(1000):
+            clock.now += 0.01
+            allowed += limiter.allows()
+
+        self.assertGreaterEqual(allowed, 100)
+        self.assertLessEqual(allowed, 100 + 3)
+
+    def test_burst_is_the_rate_by_default(self):
+        limiter = RateLimiter(3, clock=_Clock())
+
+        self.assertEqual([limiter.allows() for _ in range(4)], [True] * 3 + [False])
+
+    def test_a_low_rate_still_allows_one_event(self):
+        clock = _Clock()
+        limiter = RateLimiter(0.5, clock=clock)
+
+        self.assertTrue(limiter.allows())
+        self.assertFalse(limiter.allows())
+
+        clock.now = 2
+        self.assertTrue(limiter.allows())
+
+    def test_keys_are_independent(self):
+        limiter = RateLimiter(1, clock=_Clock())
+
+        self.assertTrue(limiter.allows("10.0.0.1"))
+        self.assertFalse(limiter.allows("10.0.0.1"))
+        self.assertTrue(limiter.allows("10.0.0.2"))
+
+    def test_prune_forgets_full_buckets(self):
+        clock = _Clock()
+        limiter = RateLimiter(1, burst=2, clock=clock)
+        limiter.allows("a")
+        limiter.allows("b")
+        limiter.allows("b")
+
+        clock.now = 1
+        limiter.prune()
+        self.assertEqual(len(limiter), 1)
+
+        # a forgotten key starts again with a full bucket
+        clock.now = 2
+        limiter.prune()
+        self.assertEqual(len(limiter), 0)
+        self.assertEqual([limiter.allows("b") for _ in range(3)], [True, True, False])
+
+    def test_refund(self):
+        clock = _Clock()
+        limiter = RateLimiter(1, burst=2, clock=clock)
+
+        self.assertTrue(limiter.allows("a"))
+        limiter.refund("a")
+        limiter.refund("a")
+        self.assertEqual([limiter.allows("a") for _ in range(3)], [True, True, False])
+
+        # unknown keys have a full bucket already
+        limiter.refund("b")
+        self.assertEqual(len(limiter), 1)
+
+    def test_global_refusal_keeps_the_rate_of_the_ip(self):
+        clock = _Clock()
+        server = TcpServer(None)
+        server._accept_limit = RateLimiter(1, clock=clock)
+        server._accept_limit_per_ip = RateLimiter(0.5, clock=clock)
+
+        self.assertTrue(server._allows_connection("10.0.0.1"))
+        self.assertFalse(server._allows_connection("10.0.0.2"))
+
+        # the global rate allows a client again, while the ip would not have got a new token yet
+        clock.now = 1
+        self.assertTrue(server._allows_connection("10.0.0.2"))
+        self.assertFalse(server._allows_connection("10.0.0.1"))
+
+if __name__ == '__main__':
+    unittest.main()
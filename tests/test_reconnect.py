@@ -0,0 +1,121 @@
+# Standard libraries
+import queue
+import socket
+import threading
+import time
+import unittest
+
+# Local imports
+from server.dnc.protocol import DncProtocol
+from server.tcp import TcpServer
+
+try:
+    from PyQt5.QtCore import Qt
+    from client.controllers.network import NetworkClient
+except ImportError:
+    NetworkClient = None
+
+CLIENTS = 200
+
+# The delays of the clients' backoff, in seconds
+MIN_DELAY = 0.1
+MAX_DELAY = 2
+
+# The time the server stays down, in seconds
+DOWNTIME = 1
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+class _Reply:
+    """
+    Receives the reply of a request, as the signals of the client do.
+    """
+
+    def __init__(self, callback):
+        self.emit = callback
+
+class _HeadlessClient:
+    """
+    A client that resumes its session each time it is connected, as the GUI does.
+
+    Attributes:
+    -----------
+        connected_at (List[float]): when the client got connected
+        resumed (threading.Event): set once the session is resumed on the current connection
+    """
+
+    def __init__(self, port, pseudo):
+        self.pseudo = pseudo
+        self.connected_at = []
+        self.resumed = threading.Event()
+        self.network = NetworkClient('127.0.0.1', port, queue.Queue(), MIN_DELAY, MAX_DELAY)
+        # the client has no event loop of Qt, hence its signals are handled by the network thread
+        self.network.connected.connect(self._on_connected, Qt.DirectConnection)
+        self.network.connection_lost.connect(self.resumed.clear, Qt.DirectConnection)
+
+    def _on_connected(self):
+        self.connected_at.append(time.monotonic())
+        self.network.submit(f"CONNECT {self.pseudo}", _Reply(self._on_resume))
+
+    def _on_resume(self, reply):
+        if reply.startswith("100"):
+            self.network.confirm()
+            self.resumed.set()
+
+@unittest.skipIf(NetworkClient is None, "the client requires PyQt5")
+class ReconnectTest(unittest.TestCase):
+
+    def setUp(self):
+        self.port = _free_port()
+        self.server = None
+        self.clients = []
+
+    def tearDown(self):
+        for client in self.clients:
+            client.network.stop()
+        self._stop_server()
+
+    def _start_server(self):
+        self.server = TcpServer(DncProtocol(), self.port)
+        self.thread = threading.Thread(target=self.server.run_forever, args=(0.05,), daemon=True)
+        self.thread.start()
+
+    def _stop_server(self):
+        if self.server is not None:
+            self.server._is_over.set()
+            self.thread.join(5)
+            self.server = None
+
+    def _wait_resumed(self, timeout):
+        deadline = time.monotonic() + timeout
+        return all(client.resumed.wait(max(0, deadline - time.monotonic())) for client in self.clients)
+
+    def test_restart(self):
+        self._start_server()
+        self.clients = [_HeadlessClient(self.port, f"u{i}") for i in range(CLIENTS)]
+        for client in self.clients:
+            client.network.start()
+        self.assertTrue(self._wait_resumed(10))
+
+        self._stop_server()
+        time.sleep(DOWNTIME)
+        restarted_at = time.monotonic()
+        self._start_server()
+
+        # a client waits at most MAX_DELAY between two attempts
+        self.assertTrue(self._wait_resumed(MAX_DELAY + 5))
+        recovery = time.monotonic() - restarted_at
+        self.assertLess(recovery, MAX_DELAY + 5)
+        self.assertEqual(len(self.server._protocol.clients), CLIENTS)
+
+        # the clients come back spread over the backoff, not all at once
+        reconnected = sorted(client.connected_at[-1] - restarted_at for client in self.clients)
+        self.assertGreater(reconnected[-1] - reconnected[0], MAX_DELAY / 4)
+        busiest = max(sum(1 for other in reconnected if at <= other < at + 0.05) for at in reconnected)
+        self.assertLess(busiest, CLIENTS / 4)
+
+if __name__ == '__main__':
+    unittest.main()
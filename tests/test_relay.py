@@ -0,0 +1,30 @@
+# Standard libraries
+import gc
+import socket
+import unittest
+import warnings
+
+# Local imports
+from server.relay import FileRelay
+
+class FileRelayTest(unittest.TestCase):
+
+    def test_busy_port(self):
+        with socket.socket() as busy:
+            busy.bind(('', 0))
+            busy.listen(1)
+            relay = FileRelay(busy.getsockname()[1])
+
+            # a socket left open is reported when collected
+            with warnings.catch_warnings(record=True) as caught:
+                warnings.simplefilter("always", ResourceWarning)
+
+                for _ in range(3):
+                    with self.assertRaises(OSError):
+                        relay.open(1024)
+                gc.collect()
+
+            self.assertEqual([w for w in caught if issubclass(w.category, ResourceWarning)], [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,165 @@
+# Standard libraries
+import errno
+import selectors
+import socket
+import threading
+import time
+import unittest
+
+# Local imports
+from server.dnc.protocol import DncProtocol
+from server.tcp import TcpServer
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+class _EagerSelector(selectors.DefaultSelector):
+    """
+    A selector that reports the sockets waiting to be writable as writable,
+    which a selector is allowed to do, and the readable sockets first.
+
+    Hence a socket closed while handling a read is always followed by its
+    write event within the same batch.
+    """
+
+    def select(self, timeout=None):
+        ready = {key.fd: [key, events] for key, events in super().select(timeout)}
+
+        for key in self.get_map().values():
+            if key.events & selectors.EVENT_WRITE:
+                ready.setdefault(key.fd, [key, 0])[1] |= selectors.EVENT_WRITE
+
+        return sorted(map(tuple, ready.values()), key=lambda item: not item[1] & selectors.EVENT_READ)
+
+class _SmallBufferServer(TcpServer):
+    """
+    A server whose sockets have small buffers, so that a client that does not
+    read fills its outbox quickly.
+    """
+
+    def _open_connection(self, client_socket, client_addr):
+        client_socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+        super()._open_connection(client_socket, client_addr)
+
+class _UnreachableSocket(socket.socket):
+    """
+    A socket whose peer becomes unreachable once `unreachable` is set, as seen
+    by a keepalive that gets no answer.
+    """
+
+    unreachable = threading.Event()
+
+    def recv(self, *args):
+        if self.unreachable.is_set():
+            raise TimeoutError(errno.ETIMEDOUT, "Connection timed out")
+        return super().recv(*args)
+
+class _UnreachableListener(socket.socket):
+    """
+    A listening socket whose clients may become unreachable.
+    """
+
+    def accept(self):
+        client_socket, client_addr = super().accept()
+        return _UnreachableSocket(fileno=client_socket.detach()), client_addr
+
+class _UnreachableServer(TcpServer):
+    """
+    A server whose clients may become unreachable.
+    """
+
+    def _create_local_socket(self):
+        return _UnreachableListener(fileno=super()._create_local_socket().detach())
+
+class _Client:
+    """
+    A client of the server, whose replies are read by a background thread
+    unless it has to be slow.
+    """
+
+    def __init__(self, port, pseudo, reads=True):
+        self.sock = socket.socket()
+        # a slow client must fill the buffers of the server quickly
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        self.sock.connect(('127.0.0.1', port))
+        self.received = bytearray()
+        self.sock.sendall(f"CONNECT {pseudo}\n".encode())
+
+        if reads:
+            threading.Thread(target=self._read, daemon=True).start()
+
+    def _read(self):
+        try:
+            while True:
+                data = self.sock.recv(1 << 16)
+                if not data:
+                    return
+                self.received += data
+        except OSError:
+            pass
+
+    def wait_for(self, expected, timeout=5):
+        deadline = time.monotonic() + timeout
+        while expected not in self.received and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return expected in self.received
+
+class TcpServerTest(unittest.TestCase):
+
+    def _start(self, server_class, **kwargs):
+        self.port = _free_port()
+        self.server = server_class(DncProtocol(), self.port, **kwargs)
+        self.thread = threading.Thread(target=self.server.run_forever, args=(0.05,), daemon=True)
+        self.thread.start()
+        time.sleep(0.2)
+
+    def tearDown(self):
+        self.server._is_over.set()
+        self.thread.join(2)
+
+    def test_slow_client_closed_within_a_batch(self):
+        self._start(_SmallBufferServer, selector=_EagerSelector, max_write_buffer=1 << 14)
+        fast = _Client(self.port, "fast")
+        slow = _Client(self.port, "slow", reads=False)
+        self.assertTrue(fast.wait_for(b":slow CONNECT\n"))
+
+        # the outbox of the slow client overflows while its socket is reported writable
+        message = b"MESSAGE " + b"x" * 1000 + b"\n"
+        for _ in range(2000):
+            fast.sock.sendall(message)
+            if b":slow QUIT" in fast.received:
+                break
+
+        self.assertTrue(fast.wait_for(b":slow QUIT"))
+        self.assertTrue(self.thread.is_alive())
+
+        fast.sock.sendall(b"NAMES\n")
+        self.assertTrue(fast.wait_for(b"101 RPL_NAMES fast\n"))
+
+        fast.sock.close()
+        slow.sock.close()
+
+    def test_unreachable_client(self):
+        self._start(_UnreachableServer)
+        watcher = _Client(self.port, "watcher")
+        lost = _Client(self.port, "lost")
+        self.assertTrue(watcher.wait_for(b":lost CONNECT\n"))
+
+        _UnreachableSocket.unreachable.set()
+        try:
+            lost.sock.sendall(b"NAMES\n")
+            self.assertTrue(watcher.wait_for(b":lost QUIT"))
+        finally:
+            _UnreachableSocket.unreachable.clear()
+        self.assertTrue(self.thread.is_alive())
+
+        watcher.sock.sendall(b"NAMES\n")
+        self.assertTrue(watcher.wait_for(b"101 RPL_NAMES watcher\n"))
+
+        watcher.sock.close()
+        lost.sock.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+# Standard libraries
+import random
+import unittest
+
+# Local imports
+from server.utils.timers import TimerWheel
+
+RESOLUTION = 0.1
+
+class _Clock:
+    """
+    A clock that only moves forward when told to.
+    """
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class TimerWheelTest(unittest.TestCase):
+
+    def test_random_timers(self):
+        # small wheels cover short delays, so that timers cascade and overflow the last ring
+        for slots, levels in ((64, 4), (8, 3), (4, 2), (2, 3)):
+            for seed in range(3):
+                with self.subTest(slots=slots, levels=levels, seed=seed):
+                    self._simulate(random.Random(seed), slots, levels)
+
+    def _simulate(self, rng, slots, levels):
+        clock = _Clock()
+        wheel = TimerWheel(RESOLUTION, slots, levels, clock)
+        due = {}
+        fired = {}
+
+        # the loop of a server waits for the time given by the wheel, or less
+        for i in range(400):
+            clock.now += min(rng.uniform(0, 0.5), wheel.timeout(0.5))
+            wheel.advance()
+
+            delay = rng.choice([rng.uniform(0, 1), rng.uniform(0, 30), rng.uniform(0, 500), rng.uniform(0, 2000)])
+            timer = wheel.call_later(delay, lambda i=i: fired.__setitem__(i, clock.now))
+            due[i] = clock.now + delay
+
+            if rng.random() < 0.1:
+                timer.cancel()
+                del due[i]
+
+        end = max(due.values()) + 1
+        while clock.now < end:
+            clock.now += min(wheel.timeout(5.0), 5.0) or 0.01
+            wheel.advance()
+
+        self.assertEqual(set(fired), set(due))
+        self.assertEqual(len(wheel), 0)
+
+        for i, time in fired.items():
+            # a delay is rounded up to the next tick, which is run within a tick
+            self.assertGreaterEqual(time, due[i] - 1e-9)
+            self.assertLessEqual(time, due[i] + 2 * RESOLUTION + 1e-9)
+
+    def test_timeout(self):
+        clock = _Clock()
+        wheel = TimerWheel(RESOLUTION, clock=clock)
+
+        self.assertEqual(wheel.timeout(10), 10)
+
+        wheel.call_later(0.25, lambda: None)
+        self.assertAlmostEqual(wheel.timeout(10), 0.3)
+
+    def test_cancel_after_run(self):
+        clock = _Clock()
+        wheel = TimerWheel(RESOLUTION, clock=clock)
+        calls = []
+        timer = wheel.call_later(0.1, lambda: calls.append(clock.now))
+
+        clock.now = 0.2
+        wheel.advance()
+        timer.cancel()
+
+        self.assertEqual(calls, [0.2])
+        self.assertEqual(len(wheel), 0)
+
+    def test_failing_callback(self):
+        clock = _Clock()
+        wheel = TimerWheel(RESOLUTION, clock=clock)
+        calls = []
+
+        wheel.call_later(0.1, lambda: 1 / 0)
+        wheel.call_later(0.1, lambda: calls.append(True))
+        clock.now = 0.2
+
+        with self.assertLogs(level='ERROR'):
+            wheel.advance()
+        self.assertEqual(calls, [True])
+
+if __name__ == '__main__':
+    unittest.main()